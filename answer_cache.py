@@ -0,0 +1,126 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# The cache lives next to the app, outside st.session_state, so every Streamlit session
+# shares it and it survives restarts.
+CACHE_PATH = 'nl2sql_cache.db'
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+
+_local = threading.local()
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key."""
+    question = re.sub(r'[^\w\s]', ' ', question.lower())
+    return ' '.join(question.split())
+
+
+def cache_scope(model, db_path, prompt):
+    """
+    Identify what cached SQL is valid for: the model, the database it runs on and the
+    prompt template (schema and examples) it was generated from. Apps sharing a model
+    and the cache file never see each other's SQL.
+    """
+    template = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+    return hashlib.sha1(f"{model}\x00{os.path.abspath(db_path)}\x00{template}".encode('utf-8')).hexdigest()
+
+
+def cache_key(question, scope):
+    normalized = normalize_question(question)
+    return hashlib.sha1(f"{scope}\x00{normalized}".encode('utf-8')).hexdigest()
+
+
+def get_cache_connection(path=CACHE_PATH):
+    """Return this thread's connection to the cache database, creating the table on first use."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                scope TEXT NOT NULL DEFAULT '',
+                question TEXT NOT NULL,
+                sql TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        if 'scope' not in {row[1] for row in conn.execute("PRAGMA table_info(answer_cache)")}:
+            # Entries keyed before the key covered the database and prompt cannot be told apart.
+            conn.execute("DELETE FROM answer_cache")
+            conn.execute("ALTER TABLE answer_cache ADD COLUMN scope TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS answer_cache_last_used ON answer_cache(last_used)")
+        conn.commit()
+        connections[path] = conn
+    return conn
+
+
+def get_cached_sql(question, model, db_path, prompt, path=CACHE_PATH, ttl=DEFAULT_TTL):
+    """Return the cached SQL for a question in an app's scope (see cache_scope), or None on a miss or expired entry."""
+    conn = get_cache_connection(path)
+    now = time.time()
+    key = cache_key(question, cache_scope(model, db_path, prompt))
+    row = conn.execute("SELECT sql, created FROM answer_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    if ttl is not None and now - row[1] > ttl:
+        with conn:
+            conn.execute("DELETE FROM answer_cache WHERE key = ?", (key,))
+        return None
+    with conn:
+        conn.execute("UPDATE answer_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+    return row[0]
+
+
+def put_cached_sql(question, model, db_path, prompt, sql, path=CACHE_PATH, ttl=DEFAULT_TTL,
+                   max_entries=DEFAULT_MAX_ENTRIES):
+    """Store the SQL for a question in an app's scope, then evict expired and least recently used entries."""
+    conn = get_cache_connection(path)
+    now = time.time()
+    scope = cache_scope(model, db_path, prompt)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO answer_cache (key, model, scope, question, sql, created, last_used, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (cache_key(question, scope), model, scope, question, sql, now, now),
+        )
+        if ttl is not None:
+            conn.execute("DELETE FROM answer_cache WHERE created < ?", (now - ttl,))
+        conn.execute(
+            "DELETE FROM answer_cache WHERE key IN ("
+            "SELECT key FROM answer_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (max_entries,),
+        )
+
+
+def clear_cache(path=CACHE_PATH):
+    """Drop every cached question and its SQL."""
+    conn = get_cache_connection(path)
+    with conn:
+        conn.execute("DELETE FROM answer_cache")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or clear the cache of generated SQL.")
+    parser.add_argument('--cache', default=CACHE_PATH)
+    parser.add_argument('--clear', action='store_true', help="delete every cached question")
+    args = parser.parse_args()
+
+    if args.clear:
+        clear_cache(args.cache)
+    conn = get_cache_connection(args.cache)
+    count, hits = conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM answer_cache").fetchone()
+    print(f"{count} cached questions, {hits} hits in {args.cache}")
@@ -0,0 +1,482 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+
+from db_pool import QUERY_TIMEOUT, QueryBudgetExceeded, database_version, pooled_connection, time_query
+from index_advisor import load_workload
+
+try:
+    import duckdb
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    duckdb = None
+
+# Optional columnar backend: aggregate queries are answered from a Parquet mirror of the
+# tables by DuckDB's vectorised engine, everything else (and anything DuckDB rejects) by
+# SQLite. The mirror is built explicitly (python columnar.py --build) and only used while
+# the database is unchanged since the build.
+COLUMNAR = os.environ.get('NL2SQL_COLUMNAR', '0') == '1'
+MIRROR_DIR = os.environ.get('NL2SQL_COLUMNAR_DIR', 'nl2sql_columnar')
+MIRROR_TABLES = ['vehicle_table', 'energy_data', 'charging_table', 'discharge_table', 'soh_table',
+                 'charging_pack', 'soh_pack']
+EXPORT_BATCH = 100000
+# DuckDB's working memory; larger joins and aggregations spill to MIRROR_DIR/spill.
+MEMORY_LIMIT = os.environ.get('NL2SQL_COLUMNAR_MEMORY', '1GB')
+# Queries reading only tables smaller than this are faster on SQLite than through DuckDB.
+MIN_TABLE_ROWS = 10000
+
+_TOKEN_RE = re.compile(
+    r"""\s+|'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\w+"""
+    r"""|<=|>=|<>|!=|==|\|\||\S""")
+_AGGREGATES = {'COUNT', 'SUM', 'AVG', 'MIN', 'MAX'}
+# Functions that behave the same in both engines. CAST (SQLite truncates REAL to INTEGER,
+# DuckDB rounds), date functions and TOTAL are left to SQLite.
+_FUNCTIONS = _AGGREGATES | {'ROUND', 'ABS', 'COALESCE', 'IFNULL', 'NULLIF', 'LOWER', 'UPPER', 'LENGTH', 'TRIM',
+                            'REPLACE'}
+# Keywords that may directly precede "(".
+_BEFORE_PAREN = {'SELECT', 'FROM', 'JOIN', 'ON', 'WHERE', 'AND', 'OR', 'NOT', 'IN', 'EXISTS', 'AS', 'BY',
+                 'WHEN', 'THEN', 'ELSE', 'HAVING', 'DISTINCT'}
+# Integer division, modulo on REALs and pattern matching differ between the engines.
+_UNSUPPORTED = {'/', '%', 'GLOB', 'REGEXP', 'MATCH', 'OVER', 'WINDOW', 'UNION', 'INTERSECT', 'EXCEPT', 'CAST'}
+_ARROW_TYPES = {'int64': 'int64', 'float64': 'float64', 'string': 'string'}
+# DuckDB casts a string literal compared with a number ('5' = 5 is true); SQLite does not
+# (text never equals a number), so such comparisons only run here against text columns.
+_COMPARISONS = {'=', '==', '!=', '<>', '<', '<=', '>', '>=', 'LIKE'}
+_TEXT_FUNCTIONS = {'LOWER', 'UPPER', 'TRIM', 'REPLACE'}
+
+logger = logging.getLogger(__name__)
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def mirror_dir(db_path, version=None, directory=MIRROR_DIR):
+    """Directory of the mirror of one version of a database."""
+    version = database_version(db_path) if version is None else version
+    name = hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, f"{name}-{hashlib.sha1(version.encode('utf-8')).hexdigest()[:12]}")
+
+
+def _column_types(conn, table, columns):
+    """
+    Map each column to int64, float64 or string from the storage classes it actually
+    holds (the tables declare no types). Returns (types, columns mixing text and numbers).
+    """
+    found = conn.execute(f"SELECT {', '.join(f'GROUP_CONCAT(DISTINCT typeof({column}))' for column in columns)} "
+                         f"FROM {table}").fetchone()
+    types, mixed = {}, []
+    for column, classes in zip(columns, found):
+        classes = set((classes or 'null').split(',')) - {'null'}
+        if classes <= {'integer'} and classes:
+            types[column] = 'int64'
+        elif classes <= {'integer', 'real'} and classes:
+            types[column] = 'float64'
+        else:
+            types[column] = 'string'
+            if classes - {'text'}:
+                mixed.append(column)
+    return types, mixed
+
+
+def _export_table(conn, table, path):
+    columns = [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+    types, mixed = _column_types(conn, table, columns)
+    schema = pyarrow.schema([(column, _ARROW_TYPES[types[column]]) for column in columns])
+    rows = 0
+    cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table}")
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = cursor.fetchmany(EXPORT_BATCH)
+            if not batch:
+                break
+            arrays = []
+            for column, values in zip(columns, zip(*batch)):
+                if column in mixed:
+                    values = [None if value is None else str(value) for value in values]
+                arrays.append(pyarrow.array(values, type=schema.field(column).type))
+            writer.write_batch(pyarrow.record_batch(arrays, schema=schema))
+            rows += len(batch)
+    return {'file': os.path.basename(path), 'rows': rows, 'columns': types, 'mixed': mixed}
+
+
+def build_mirror(db_path, directory=MIRROR_DIR, tables=MIRROR_TABLES):
+    """
+    Export the tables of a database to Parquet and return the mirror's manifest.
+
+    The mirror is written next to the others under directory and replaces older mirrors
+    of the same database once complete. Column types come from the stored values;
+    columns mixing text and numbers are stored as text and listed in the manifest, and
+    queries touching them stay on SQLite.
+    """
+    if duckdb is None:
+        raise RuntimeError("The columnar backend needs the duckdb and pyarrow packages.")
+    version = database_version(db_path)
+    target = mirror_dir(db_path, version, directory)
+    building = target + '.building'
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")}
+        manifest = {'db_path': os.path.abspath(db_path), 'version': version, 'tables': {
+            table: _export_table(conn, table, os.path.join(building, f"{table}.parquet"))
+            for table in tables if table in present}}
+    finally:
+        conn.close()
+    with open(os.path.join(building, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    prefix = os.path.basename(target).rsplit('-', 1)[0] + '-'
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and not name.endswith('.building'):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    os.replace(building, target)
+    return manifest
+
+
+def drop_mirror(db_path, directory=MIRROR_DIR):
+    """Remove every mirror of a database."""
+    prefix = os.path.basename(mirror_dir(db_path, '', directory)).rsplit('-', 1)[0] + '-'
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+def _engine(db_path, directory=MIRROR_DIR):
+    """
+    Return (DuckDB connection, manifest) for the current mirror of a database, or None
+    when there is no mirror of its current version. One connection per mirrored database
+    version, with a view per table.
+    """
+    path = os.path.abspath(db_path)
+    version = database_version(db_path)
+    with _engines_lock:
+        cached = _engines.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        engine = None
+        target = mirror_dir(db_path, version, directory)
+        try:
+            with open(os.path.join(target, 'manifest.json'), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = None
+        if manifest is not None and manifest['version'] == version:
+            conn = duckdb.connect()
+            conn.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+            conn.execute(f"SET temp_directory = '{os.path.abspath(os.path.join(directory, 'spill'))}'")
+            # SQLite sorts NULLs as the smallest value.
+            conn.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+            for table, info in manifest['tables'].items():
+                parquet = os.path.abspath(os.path.join(target, info['file'])).replace("'", "''")
+                conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{parquet}')")
+            engine = (conn, manifest)
+            _engines[path] = (version, engine)
+        return engine
+
+
+def _has_alias(item):
+    depth = 0
+    for token in item:
+        depth += (token == '(') - (token == ')')
+        if depth == 0 and token.upper() == 'AS':
+            return True
+    return len(item) > 1 and re.fullmatch(r'\w+|"[^"]*"', item[-1]) is not None and item[-2] not in (
+        '.', '+', '-', '*', '||', '(', ',') and item[-1].upper() not in _BEFORE_PAREN | {'END', 'NULL'}
+
+
+def _is_text(words, tokens, at, text_columns):
+    """Whether the operand at word position at is a text column, or a text function of one ending there."""
+    if words[at] == ')':
+        depth, n = 0, at
+        while n >= 0:
+            depth += (words[n] == ')') - (words[n] == '(')
+            if depth == 0:
+                break
+            n -= 1
+        return n > 0 and words[n - 1] in _TEXT_FUNCTIONS
+    return tokens[at].strip('"`[]').lower() in text_columns
+
+
+def _compares_text_with_number(words, tokens, text_columns):
+    """
+    Whether any string literal is compared (=, <, IN, BETWEEN, LIKE, ...) with something
+    other than a text column, where DuckDB and SQLite disagree.
+    """
+    for n, token in enumerate(tokens):
+        if not token.startswith("'"):
+            continue
+        subject = None
+        if n >= 2 and words[n - 1] in _COMPARISONS | {'BETWEEN'}:
+            subject = n - 2
+        elif n >= 4 and words[n - 1] == 'AND' and words[n - 3] == 'BETWEEN':
+            subject = n - 4
+        elif n + 2 < len(words) and words[n + 1] in _COMPARISONS:
+            start = n + 2
+            if start + 2 < len(words) and words[start + 1] == '.':
+                start += 2
+            if not _is_text(words, tokens, start, text_columns):
+                return True
+            continue
+        else:
+            k = n
+            while k > 0 and (tokens[k - 1].startswith("'") or words[k - 1] == ','):
+                k -= 1
+            if k >= 2 and words[k - 1] == '(' and words[k - 2] == 'IN':
+                subject = k - 4 if k >= 4 and words[k - 3] == 'NOT' else k - 3
+        if subject is not None and (subject < 0 or not _is_text(words, tokens, subject, text_columns)):
+            return True
+    return False
+
+
+def columnar_sql(sql, manifest):
+    """
+    Translate an aggregate query for the mirror, or return None if it should stay on SQLite.
+
+    Only queries that aggregate over mirrored tables (at least one of MIN_TABLE_ROWS
+    rows), use functions and operators with the same semantics in both engines and avoid
+    columns of mixed type are translated. LIKE
+    becomes ILIKE (SQLite's LIKE ignores ASCII case), unaliased select items keep the
+    label SQLite would give them, and a result without ORDER BY is sorted on all columns
+    so pages are stable across re-runs. Comparisons of string literals with numbers stay
+    on SQLite.
+    """
+    tokens = _TOKEN_RE.findall(sql.strip())
+    original = list(tokens)
+    solid = [i for i, token in enumerate(tokens) if not token.isspace()]
+    while solid and tokens[solid[-1]] == ';':
+        tokens[solid.pop()] = ''
+    words = [tokens[i].upper() for i in solid]
+    if not words or words[0] not in ('SELECT', 'WITH') or _UNSUPPORTED.intersection(words):
+        return None
+    tables = {table.lower(): info['rows'] for table, info in manifest['tables'].items()}
+    mixed = {column.lower() for info in manifest['tables'].values() for column in info['mixed']}
+    types = [(column.lower(), kind) for info in manifest['tables'].values() for column, kind in info['columns'].items()]
+    text_columns = {column for column, kind in types if kind == 'string'} - {column for column, kind in types
+                                                                             if kind != 'string'}
+    if _compares_text_with_number(words, [tokens[i] for i in solid], text_columns):
+        return None
+    ctes = {words[n - 1].lower() for n in range(1, len(words) - 1) if words[n] == 'AS' and words[n + 1] == '('}
+    aggregated = 'GROUP' in words
+    largest = 0
+    depth, top_order = 0, False
+    for n, i in enumerate(solid):
+        token, word = tokens[i], words[n]
+        following = words[n + 1] if n + 1 < len(words) else None
+        depth += (token == '(') - (token == ')')
+        if following == '(' and re.fullmatch(r'\w+', token):
+            if word in _AGGREGATES:
+                aggregated = True
+                close, inner = n + 2, 1
+                while close < len(words) and inner:
+                    inner += (words[close] == '(') - (words[close] == ')')
+                    close += 1
+                if word in ('MIN', 'MAX') and ',' in words[n + 2:close]:
+                    return None
+            elif word not in _FUNCTIONS and word not in _BEFORE_PAREN:
+                return None
+        if n and words[n - 1] in ('FROM', 'JOIN') and token != '(':
+            if token.lower() not in tables and token.lower() not in ctes:
+                return None
+            largest = max(largest, tables.get(token.lower(), 0))
+        if token.lower() in mixed:
+            return None
+        if depth == 0 and word == 'ORDER':
+            top_order = True
+        if word == 'LIKE':
+            tokens[i] = 'ILIKE'
+        elif token[0] in '`[':
+            tokens[i] = '"' + token[1:-1].replace('"', '""') + '"'
+    if not aggregated or largest < MIN_TABLE_ROWS:
+        return None
+
+    # Label unaliased expressions of the outer select list with their text, as SQLite does.
+    if words[0] == 'SELECT':
+        items, current, depth = [], [], 0
+        for n in range(1, len(solid)):
+            depth += (words[n] == '(') - (words[n] == ')')
+            if depth == 0 and words[n] in ('FROM', 'WHERE', 'GROUP', 'ORDER', 'LIMIT', 'HAVING'):
+                break
+            if depth == 0 and words[n] == ',':
+                items.append(current)
+                current = []
+            elif words[n] not in ('DISTINCT', 'ALL') or current:
+                current.append(n)
+        items.append(current)
+        for item in items:
+            text = [tokens[solid[n]] for n in item]
+            plain = re.fullmatch(r'(?:\w+\.)?\w+|\*|\w+\.\*', ''.join(text))
+            if item and not plain and not _has_alias(text):
+                label = ''.join(original[solid[item[0]]:solid[item[-1]] + 1])
+                tokens[solid[item[-1]]] += ' AS "' + label.replace('"', '""') + '"'
+    translated = ''.join(tokens).strip()
+    if not top_order:
+        translated = f"SELECT * FROM ({translated}) ORDER BY ALL"
+    return translated
+
+
+def fetch_columnar(sql, db_path, start, count, timeout=QUERY_TIMEOUT):
+    """
+    Run a query on the columnar mirror and return (rows start..start+count, labels), or
+    None when the backend is off, has no current mirror, or cannot run the query, in
+    which case the caller runs it on SQLite. Raises QueryBudgetExceeded after timeout.
+    """
+    if not COLUMNAR or duckdb is None:
+        return None
+    engine = _engine(db_path)
+    if engine is None:
+        return None
+    conn, manifest = engine
+    translated = columnar_sql(sql, manifest)
+    if translated is None:
+        return None
+    cursor = conn.cursor()
+    timer = threading.Timer(timeout, cursor.interrupt) if timeout else None
+    started = time.perf_counter()
+    try:
+        if timer:
+            timer.start()
+        cursor.execute(translated)
+        skipped = 0
+        while skipped < start:
+            batch = len(cursor.fetchmany(min(start - skipped, EXPORT_BATCH)))
+            if not batch:
+                break
+            skipped += batch
+        rows = cursor.fetchmany(count)
+        labels = [column[0] for column in cursor.description]
+        # SQLite has no booleans: comparisons in the select list come back as 1/0.
+        flags = [n for n, column in enumerate(cursor.description) if str(column[1]) == 'BOOLEAN']
+        if flags:
+            rows = [tuple(int(value) if n in flags and value is not None else value for n, value in enumerate(row))
+                    for row in rows]
+    except duckdb.InterruptException as e:
+        raise QueryBudgetExceeded(f"Query cancelled: it ran longer than {timeout:g}s. "
+                                  f"Try a narrower question or add filters.") from e
+    except duckdb.Error as e:
+        logger.info("Columnar backend could not run the query, using SQLite: %s", e)
+        return None
+    finally:
+        if timer:
+            timer.cancel()
+        cursor.close()
+    logger.debug("Columnar query took %.3fs", time.perf_counter() - started)
+    return rows, labels
+
+
+def benchmark(db_path, queries, repeat=3, max_seconds=60.0):
+    """
+    Time each query the columnar backend accepts on SQLite and on the mirror and check
+    both return the same rows. Returns a list of dicts with sql, sqlite and columnar
+    median seconds (None when over max_seconds) and same.
+    """
+    from rollups import same_rows
+
+    engine = _engine(db_path)
+    if engine is None:
+        raise RuntimeError(f"No current columnar mirror of {db_path}; run with --build first.")
+    conn, manifest = engine
+    results = []
+    with pooled_connection(db_path) as sqlite_conn:
+        for sql in queries:
+            translated = columnar_sql(sql, manifest)
+            if translated is None:
+                continue
+            entry = {'sql': sql, 'translated': translated}
+            try:
+                entry['sqlite'] = sorted(time_query(sqlite_conn, sql, max_seconds) for _ in range(repeat))[repeat // 2]
+                expected = sqlite_conn.execute(sql).fetchall()
+            except sqlite3.Error as e:
+                entry['sqlite'] = None if isinstance(e, QueryBudgetExceeded) else e
+                expected = None
+            rows, timings = None, []
+            cursor = conn.cursor()
+            try:
+                for _ in range(repeat):
+                    timer = threading.Timer(max_seconds, cursor.interrupt)
+                    started = time.perf_counter()
+                    timer.start()
+                    try:
+                        rows = cursor.execute(translated).fetchall()
+                    finally:
+                        timer.cancel()
+                    timings.append(time.perf_counter() - started)
+                entry['columnar'] = sorted(timings)[repeat // 2]
+            except duckdb.InterruptException:
+                entry['columnar'], rows = None, None
+            except duckdb.Error as e:
+                entry['columnar'], rows = e, None
+            finally:
+                cursor.close()
+            if expected is not None and rows is not None:
+                entry['same'] = same_rows(expected, [tuple(row) for row in rows], rel_tol=1e-6)
+            results.append(entry)
+    return results
+
+
+def _format(value):
+    if value is None:
+        return 'timeout'
+    if isinstance(value, Exception):
+        return 'error'
+    return f"{value * 1000:.1f}ms"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the Parquet mirror and compare SQLite with the columnar backend.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--build', action='store_true', help="(re)build the mirror of --db first")
+    parser.add_argument('--drop', action='store_true', help="remove the mirrors of --db and exit")
+    parser.add_argument('--rows', type=int, nargs='*',
+                        help="instead of --db, benchmark synthetic databases of these sizes, e.g. 1000000 10000000 50000000")
+    parser.add_argument('--workdir', default='.', help="where the synthetic databases are created")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    if args.drop:
+        drop_mirror(args.db)
+        raise SystemExit
+    workload = list(dict.fromkeys(load_workload(args.script, args.template)))
+    targets = [args.db]
+    if args.rows:
+        from prompt_builder import load_template
+        from synthetic_db import create_synthetic_db
+        targets = []
+        for rows in args.rows:
+            path = os.path.join(args.workdir, f"columnar_bench_{rows}.db")
+            if not os.path.exists(path):
+                started = time.perf_counter()
+                create_synthetic_db(path, load_template(args.script, args.template), rows)
+                print(f"created {path} in {time.perf_counter() - started:.1f}s")
+            targets.append(path)
+    for path in targets:
+        if args.build or args.rows:
+            if _engine(path) is None:
+                started = time.perf_counter()
+                manifest = build_mirror(path)
+                print(f"mirrored {path} in {time.perf_counter() - started:.1f}s: "
+                      f"{ {table: info['rows'] for table, info in manifest['tables'].items()} }")
+        results = benchmark(path, workload, args.repeat, args.max_seconds)
+        print(f"\n{path}")
+        print(f"{'query':<70}{'sqlite':>12}{'columnar':>12}  same")
+        for entry in results:
+            same = {True: 'yes', False: 'NO'}.get(entry.get('same'), '-')
+            print(f"{' '.join(entry['sql'].split())[:68]:<70}{_format(entry['sqlite']):>12}"
+                  f"{_format(entry['columnar']):>12}  {same}")
+        timed = [entry for entry in results if isinstance(entry['sqlite'], float) and isinstance(entry['columnar'], float)]
+        if timed:
+            sqlite_total = sum(entry['sqlite'] for entry in timed)
+            columnar_total = sum(entry['columnar'] for entry in timed)
+            print(f"{len(timed)} queries: sqlite {sqlite_total:.2f}s, columnar {columnar_total:.2f}s "
+                  f"({sqlite_total / columnar_total:.1f}x)")
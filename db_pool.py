@@ -0,0 +1,330 @@
+import argparse
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from example_store import parse_examples
+from prompt_builder import load_template
+
+# Read-only connection tuning. mmap lets SQLite read pages straight from the OS page cache;
+# cache_size is negative so it is in KiB.
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KIB = 64 * 1024
+POOL_SIZE = 8
+
+# Per-query budgets, overridable per deployment through the environment. A query is
+# interrupted once it runs longer than QUERY_TIMEOUT seconds or executes more than
+# QUERY_MAX_STEPS SQLite VM instructions; 0 disables a limit.
+QUERY_TIMEOUT = float(os.environ.get('NL2SQL_QUERY_TIMEOUT', '30'))
+QUERY_MAX_STEPS = int(os.environ.get('NL2SQL_QUERY_MAX_STEPS', '2000000000'))
+PROGRESS_INTERVAL = 10000
+
+# Optional in-memory mode: the database is copied into a shared-cache in-memory database
+# with the backup API and every pooled connection reads the copy. Databases larger than
+# MEMORY_CAP_MB (file plus WAL) stay file-backed.
+IN_MEMORY = os.environ.get('NL2SQL_IN_MEMORY', '0') == '1'
+MEMORY_CAP_MB = int(os.environ.get('NL2SQL_MEMORY_CAP_MB', '1024'))
+
+logger = logging.getLogger(__name__)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def read_only_uri(db_path):
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+def database_version(db_path):
+    """
+    Identify the current state of a database file: device, inode, size and modification
+    time of the file and of its WAL, if any. Any write changes the result.
+    """
+    version = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version.append(f"{stat.st_dev}:{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}")
+    return '|'.join(version)
+
+
+def memory_uri(db_path, generation):
+    """Shared-cache URI of one loaded copy of a database; every reload gets a new name."""
+    name = hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:16]
+    return f"file:nl2sql-{name}-{generation}?mode=memory&cache=shared"
+
+
+def load_into_memory(db_path, uri, cap_mb=MEMORY_CAP_MB):
+    """
+    Copy a database into the shared in-memory database at uri with the backup API.
+
+    Returns the connection that keeps the copy alive (SQLite frees a shared in-memory
+    database when its last connection closes), or None when the file is larger than
+    cap_mb or cannot be copied; the caller then stays file-backed.
+    """
+    size = sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+    if size > cap_mb * 1024 * 1024:
+        logger.warning("%s is %.0f MB, over the %d MB in-memory cap; reading it from disk.",
+                       db_path, size / 1024 / 1024, cap_mb)
+        return None
+    start = time.perf_counter()
+    holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    try:
+        source = sqlite3.connect(read_only_uri(db_path), uri=True)
+        try:
+            source.backup(holder)
+        finally:
+            source.close()
+    except (sqlite3.Error, MemoryError) as e:
+        holder.close()
+        logger.warning("Could not load %s into memory (%s); reading it from disk.", db_path, e)
+        return None
+    logger.info("Loaded %s (%.0f MB) into memory in %.2fs.", db_path, size / 1024 / 1024,
+                time.perf_counter() - start)
+    return holder
+
+
+def open_memory(uri):
+    """Open a read-only connection to a shared in-memory copy made by load_into_memory."""
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def open_read_only(db_path):
+    """Open a tuned, read-only connection; fails instead of creating a missing database."""
+    conn = sqlite3.connect(read_only_uri(db_path), uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+class QueryBudgetExceeded(sqlite3.OperationalError):
+    """Raised when a query is interrupted for exceeding its time or VM-step budget."""
+
+
+@contextmanager
+def query_budget(conn, timeout=QUERY_TIMEOUT, max_steps=QUERY_MAX_STEPS):
+    """
+    Interrupt whatever runs on conn inside the block once it exceeds the budget.
+
+    SQLite calls the progress handler every PROGRESS_INTERVAL VM instructions; returning
+    True aborts the statement, which rolls back cleanly and leaves the connection usable.
+    The resulting error (also when wrapped, e.g. by pandas) is re-raised as
+    QueryBudgetExceeded with a message fit for the UI.
+    """
+    start = time.perf_counter()
+    state = {'steps': 0, 'exceeded': None}
+
+    def check():
+        state['steps'] += PROGRESS_INTERVAL
+        if timeout and time.perf_counter() - start > timeout:
+            state['exceeded'] = f"ran longer than {timeout:g}s"
+        elif max_steps and state['steps'] > max_steps:
+            state['exceeded'] = f"executed more than {max_steps:,} steps"
+        return state['exceeded'] is not None
+
+    conn.set_progress_handler(check, PROGRESS_INTERVAL)
+    try:
+        yield state
+    except Exception as e:
+        if state['exceeded']:
+            raise QueryBudgetExceeded(f"Query cancelled: it {state['exceeded']}. "
+                                      f"Try a narrower question or add filters.") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+class ConnectionPool:
+    """
+    Process-wide pool of read-only connections to one database.
+
+    Each checkout hands one connection to the calling thread exclusively until it is
+    returned, so connections (with their page cache and parsed schema) are reused by every
+    Streamlit session instead of being opened and closed per query.
+
+    With in_memory the database is first copied into RAM (see load_into_memory) and the
+    connections read the copy. Every checkout compares database_version with the loaded
+    one: when a new file has been dropped in (or the database was written), the pool loads
+    a fresh copy under a new name and retires the connections of the old one, without a
+    restart. Queries already running finish on the copy they started on.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, opener=open_read_only, in_memory=False,
+                 memory_cap_mb=MEMORY_CAP_MB):
+        self.db_path = db_path
+        self.opener = opener
+        self.in_memory = in_memory
+        self.memory_cap_mb = memory_cap_mb
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.reload_lock = threading.Lock()
+        self.version = None
+        self.generation = 0
+        self.uri = None
+        self.memory = None
+
+    @property
+    def mode(self):
+        return 'memory' if self.memory is not None else 'file'
+
+    def _refresh(self):
+        version = database_version(self.db_path)
+        if version == self.version:
+            return
+        with self.reload_lock:
+            if version == self.version:
+                return
+            memory, uri = None, memory_uri(self.db_path, self.generation + 1)
+            if self.in_memory:
+                memory = load_into_memory(self.db_path, uri, self.memory_cap_mb)
+            retired, self.memory = self.memory, memory
+            self.generation += 1
+            self.uri, self.version = uri, version
+            self.close()
+            if retired is not None:
+                retired.close()
+
+    def _open(self):
+        """
+        Open a connection to the current copy and return (generation, connection).
+
+        The generation and URI are read, and an in-memory copy is opened, under the reload
+        lock: opening the URI of a copy that _refresh has just retired would silently
+        create a new, empty database.
+        """
+        with self.reload_lock:
+            generation, memory, uri = self.generation, self.memory, self.uri
+            if memory is not None:
+                return generation, open_memory(uri)
+        return generation, self.opener(self.db_path)
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            self._refresh()
+            conn = None
+            while conn is None:
+                try:
+                    generation, conn = self.idle.get_nowait()
+                except queue.Empty:
+                    generation, conn = self._open()
+                    break
+                # Idle connections of an older copy are closed, never handed out.
+                if generation != self.generation:
+                    conn.close()
+                    conn = None
+            try:
+                yield conn
+            finally:
+                if generation == self.generation:
+                    self.idle.put((generation, conn))
+                else:
+                    conn.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait()[1].close()
+            except queue.Empty:
+                return
+
+
+def get_pool(db_path):
+    """Return the process-wide pool for a database path."""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_path, in_memory=IN_MEMORY)
+        return pool
+
+
+def pooled_connection(db_path):
+    """Context manager checking a read-only connection out of the database's pool."""
+    return get_pool(db_path).connection()
+
+
+def time_query(conn, sql, max_seconds):
+    """Run a query to completion and return its wall time; interrupted after max_seconds."""
+    start = time.perf_counter()
+    with query_budget(conn, max_seconds, 0):
+        conn.execute(sql).fetchall()
+    return time.perf_counter() - start
+
+
+def _time_fresh(db_path, sql, max_seconds):
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        time_query(conn, sql, max_seconds)
+    finally:
+        conn.close()
+    return time.perf_counter() - start
+
+
+def benchmark(db_path, queries, repeat=5, max_seconds=5.0):
+    """
+    Time each query with a fresh connection per execution (the apps' old behaviour), with
+    pooled read-only connections and with pooled connections to an in-memory copy.
+    Returns (per-query median seconds, pool mode of the in-memory pool); queries that fail
+    or run longer than max_seconds on this database are reported with their error instead.
+    """
+    results = []
+    pool = ConnectionPool(db_path)
+    memory_pool = ConnectionPool(db_path, in_memory=True)
+    for sql in queries:
+        fresh, pooled, memory = [], [], []
+        try:
+            for _ in range(repeat):
+                fresh.append(_time_fresh(db_path, sql, max_seconds))
+                with pool.connection() as conn:
+                    pooled.append(time_query(conn, sql, max_seconds))
+                with memory_pool.connection() as conn:
+                    memory.append(time_query(conn, sql, max_seconds))
+        except sqlite3.Error as e:
+            results.append({'sql': sql, 'error': str(e)})
+            continue
+        results.append({'sql': sql, 'fresh': statistics.median(fresh), 'pooled': statistics.median(pooled),
+                        'memory': statistics.median(memory)})
+    mode = memory_pool.mode
+    pool.close()
+    memory_pool.close()
+    return results, mode
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the few-shot example queries with fresh, pooled and in-memory connections.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    examples, _, _ = parse_examples(load_template(args.script, args.template))
+    results, mode = benchmark(args.db, [example.sql for example in examples], args.repeat, args.max_seconds)
+    timed = [row for row in results if 'fresh' in row]
+    print(f"{'query':<60}{'fresh':>10}{'pooled':>10}{mode:>10}")
+    for row in timed:
+        print(f"{' '.join(row['sql'].split())[:58]:<60}{row['fresh'] * 1000:>8.2f}ms{row['pooled'] * 1000:>8.2f}ms"
+              f"{row['memory'] * 1000:>8.2f}ms")
+    print(f"{len(timed)} queries, {len(results) - len(timed)} failed on this database; total "
+          f"fresh {sum(r['fresh'] for r in timed) * 1000:.1f}ms, pooled {sum(r['pooled'] for r in timed) * 1000:.1f}ms, "
+          f"{mode} {sum(r['memory'] for r in timed) * 1000:.1f}ms")
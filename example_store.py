@@ -0,0 +1,80 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from text_vectors import top_k, vectorize
+
+Example = namedtuple('Example', ['question', 'sql'])
+
+# Number of few-shot examples sent with each question.
+DEFAULT_K = 5
+
+_SECTION_HEADER = 'Example SQL Queries'
+_IDENTIFIER_RE = re.compile(r'\b[A-Za-z_][A-Za-z0-9_]*\b')
+_SQL_KEYWORDS = {
+    'select', 'from', 'where', 'join', 'inner', 'left', 'on', 'and', 'or', 'as', 'group', 'by',
+    'order', 'desc', 'asc', 'limit', 'having', 'distinct', 'is', 'null', 'not', 'count', 'sum',
+    'avg', 'min', 'max', 'least',
+}
+
+
+def parse_examples(text):
+    """
+    Parse the "- question" / "SELECT ...;" pairs of a prompt's example section.
+
+    Returns (examples, start, end) where start/end delimit the example block in text, or
+    ([], -1, -1) when the text has no example section.
+    """
+    header = text.find(_SECTION_HEADER)
+    if header < 0:
+        return [], -1, -1
+    examples = []
+    start = end = -1
+    pending = None
+    offset = text.index('\n', header) + 1 if '\n' in text[header:] else len(text)
+    for line in text[offset:].splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped.startswith('-'):
+            pending = (stripped.lstrip('- ').strip(), offset)
+        elif stripped.upper().startswith(('SELECT', 'WITH')) and pending:
+            examples.append(Example(pending[0], stripped))
+            if start < 0:
+                start = pending[1]
+            end = offset + len(line)
+            pending = None
+        elif stripped.startswith(('Question:', '[')):
+            break
+        offset += len(line)
+    return examples, start, end
+
+
+def _example_text(example):
+    # Identifiers from the SQL let "depot" match an example that only mentions Depot_Name.
+    identifiers = [word for word in _IDENTIFIER_RE.findall(example.sql)
+                   if word.lower() not in _SQL_KEYWORDS and len(word) > 2]
+    return example.question + ' ' + ' '.join(identifiers)
+
+
+@lru_cache(maxsize=8)
+def build_example_store(text):
+    """Parse and vectorise the examples in a prompt; cached per prompt text."""
+    examples, start, end = parse_examples(text)
+    matrix = vectorize([_example_text(example) for example in examples])
+    return {'examples': examples, 'matrix': matrix, 'start': start, 'end': end}
+
+
+def nearest_examples(text, question, k=DEFAULT_K):
+    """Return the k examples in the prompt text closest to the question, with similarities."""
+    store = build_example_store(text)
+    vector = vectorize([question])[0]
+    return [(store['examples'][row], score) for row, score in top_k(store['matrix'], vector, k)]
+
+
+def select_examples(text, question, k=DEFAULT_K):
+    """Replace the prompt's example block with only the k examples nearest to the question."""
+    store = build_example_store(text)
+    if len(store['examples']) <= k:
+        return text
+    chosen = nearest_examples(text, question, k)
+    block = ''.join(f"- {example.question}\n{example.sql}\n\n" for example, _ in chosen)
+    return text[:store['start']] + block + text[store['end']:]
@@ -0,0 +1,210 @@
+import re
+import threading
+
+from answer_cache import normalize_question
+from schema_linking import build_schema_index
+
+# Question phrases mapped to SQL. Lists are ordered so longer, more specific phrases are
+# tried before the shorter phrases they contain.
+AGGREGATES = {
+    'total': 'SUM', 'sum': 'SUM', 'average': 'AVG', 'avg': 'AVG', 'mean': 'AVG',
+    'maximum': 'MAX', 'max': 'MAX', 'highest': 'MAX', 'minimum': 'MIN', 'min': 'MIN', 'lowest': 'MIN',
+}
+ALIAS_PREFIX = {'SUM': 'total', 'AVG': 'avg', 'MAX': 'max', 'MIN': 'min'}
+
+# (phrase, table, column, aggregate used when the question ranks by the metric without
+# naming one: totals for quantities that add up, averages for rates and levels).
+METRICS = [
+    ('net energy consumption', 'energy_data', 'NetkWh', 'SUM'),
+    ('energy consumption', 'energy_data', 'NetkWh', 'SUM'),
+    ('energy consumed', 'energy_data', 'NetkWh', 'SUM'),
+    ('netkwh', 'energy_data', 'NetkWh', 'SUM'),
+    ('energy charged', 'charging_table', 'kwhCharged', 'SUM'),
+    ('kwh charged', 'charging_table', 'kwhCharged', 'SUM'),
+    ('charging duration', 'charging_table', 'chargeDurationInMin', 'SUM'),
+    ('charge duration', 'charging_table', 'chargeDurationInMin', 'SUM'),
+    ('interruption duration', 'charging_table', 'InterruptDurationInMin', 'SUM'),
+    ('charging interruptions', 'charging_table', 'NoOfInterrupt', 'SUM'),
+    ('interruptions', 'charging_table', 'NoOfInterrupt', 'SUM'),
+    ('charging current', 'charging_table', 'avgChargingCurrent', 'AVG'),
+    ('soc change', 'charging_table', 'delta_soc', 'AVG'),
+    ('change in soc', 'charging_table', 'delta_soc', 'AVG'),
+    ('regenerated energy', 'discharge_table', 'dataRegen_kWh', 'SUM'),
+    ('regen energy', 'discharge_table', 'dataRegen_kWh', 'SUM'),
+    ('distance traveled', 'discharge_table', 'distanceInKM', 'SUM'),
+    ('distance travelled', 'discharge_table', 'distanceInKM', 'SUM'),
+    ('distance covered', 'discharge_table', 'distanceInKM', 'SUM'),
+    ('distance', 'discharge_table', 'distanceInKM', 'SUM'),
+    ('wh per km', 'discharge_table', 'whPerKM', 'AVG'),
+    ('energy per km', 'energy_data', 'kwh_km', 'AVG'),
+    ('range', 'energy_data', 'Range', 'AVG'),
+]
+
+DIMENSIONS = [
+    ('dealer region', 'DLR_REGION'),
+    ('dealer state', 'DLR_STATE'),
+    ('dealer city', 'DLR_ORG_CITY'),
+    ('registration number', 'vehicle_registration_number'),
+    ('product line', 'PL'),
+    ('line of business', 'LOB'),
+    ('smart city', 'Smart_City'),
+    ('region', 'DLR_REGION'),
+    ('state', 'DLR_STATE'),
+    ('city', 'DLR_ORG_CITY'),
+    ('dealer', 'DLR_NAME'),
+    ('depot', 'Depot_Name'),
+    ('month', 'monthId'),
+    ('vehicle', 'vehicleId'),
+]
+
+# Things that can be counted, with the table they live in and the COUNT expression.
+COUNT_SUBJECTS = [
+    ('charging sessions', 'charging_table', 'COUNT(*)', 'charging_sessions'),
+    ('charging events', 'charging_table', 'COUNT(*)', 'charging_events'),
+    ('charges', 'charging_table', 'COUNT(*)', 'charging_sessions'),
+    ('trips', 'discharge_table', 'COUNT(*)', 'trips'),
+    ('vehicles', 'vehicle_table', 'COUNT(DISTINCT vehicleId)', 'vehicle_count'),
+]
+
+LATEST_SUBJECTS = [
+    ('charging session', 'charging_table'),
+    ('charging', 'charging_table'),
+    ('charge', 'charging_table'),
+    ('trip', 'discharge_table'),
+    ('discharge', 'discharge_table'),
+    ('soh', 'soh_table'),
+    ('health', 'soh_table'),
+    ('energy', 'energy_data'),
+]
+
+
+def _alternation(phrases):
+    return '|'.join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+
+
+def _plurals(entries):
+    """Map each phrase and its plural ("city" -> "cities", "depot" -> "depots") to its entry."""
+    forms = {}
+    for entry in entries:
+        phrase = entry[0]
+        forms[phrase] = entry
+        forms[phrase[:-1] + 'ies' if phrase.endswith('y') else phrase + 's'] = entry
+    return forms
+
+
+_METRIC_NAMES = {entry[0]: entry for entry in METRICS}
+_DIMENSION_NAMES = _plurals(DIMENSIONS)
+_SUBJECT_NAMES = _plurals(COUNT_SUBJECTS)
+_LATEST_NAMES = _plurals(LATEST_SUBJECTS)
+
+# A question is answered here only when the whole of it matches one of these shapes; any
+# word left over (a month, a year, a registration number, "excluding", "last 30 days", a
+# second metric) means it has a filter or twist the shapes do not express, so it goes to
+# the LLM instead of being answered without it.
+_LEAD = (r'(?:(?:show|list|find|get|give|display|retrieve|identify|calculate|compute|return)(?: me)? '
+         r'|what (?:is|are) |which )?(?:the )?')
+_TOP = r'(?:(?P<rank>top|bottom) (?P<limit>\d+) )?'
+_GROUP = r'(?:per|by|for each|for every|of each|in each|across|each) (?:the )?'
+_AGGREGATE = rf'(?P<aggregate>{_alternation(AGGREGATES)})'
+_DIMENSION = rf'(?P<dimension>{_alternation(_DIMENSION_NAMES)})'
+_METRIC = rf'(?P<metric>{_alternation(_METRIC_NAMES)})'
+_SUBJECT = rf'(?P<subject>{_alternation(_SUBJECT_NAMES)})'
+_SUPERLATIVE = r'(?P<superlative>most|highest|largest|biggest|fewest|least|lowest|smallest)'
+_ASCENDING = {'fewest', 'least', 'lowest', 'smallest'}
+_SHAPES = [
+    # total distance per vehicle / top 5 avg range by depot
+    ('aggregate', re.compile(rf'{_LEAD}{_TOP}{_AGGREGATE} {_METRIC} {_GROUP}{_DIMENSION}')),
+    # number of charging sessions per depot / how many trips per vehicle / trips count by dealer
+    ('count', re.compile(rf'{_LEAD}{_TOP}(?:(?:count|number) of |how many )?{_SUBJECT}(?: count)? {_GROUP}{_DIMENSION}')),
+    # top 5 dealers by distance / depots by number of charging sessions
+    ('ranked', re.compile(rf'{_LEAD}{_TOP}{_DIMENSION} by (?:(?:{_AGGREGATE} )?{_METRIC}'
+                          rf'|(?:(?:count|number) of )?{_SUBJECT})')),
+    # depots with the most charging sessions / vehicles with the lowest average range
+    ('superlative', re.compile(rf'{_LEAD}{_TOP}{_DIMENSION} (?:with|having) (?:the )?{_SUPERLATIVE} '
+                               rf'(?:(?:{_AGGREGATE} )?{_METRIC}|(?:(?:count|number) of )?{_SUBJECT})')),
+    # latest charging session per vehicle
+    ('latest', re.compile(rf'{_LEAD}{_TOP}(?:latest|most recent|last) (?P<latest>{_alternation(_LATEST_NAMES)})'
+                          rf'(?: (?:record|row|entry|entries|reading|event)s?)? (?:per|for each|for every|of each) '
+                          rf'(?:the )?vehicle')),
+]
+
+_stats = {'fast_path': 0, 'llm': 0}
+_stats_lock = threading.Lock()
+
+
+def _known_columns(prompt):
+    index = build_schema_index(prompt)
+    if index is None:
+        return None
+    return {table: [name for name, _ in info['columns']] for table, info in index['tables'].items()}
+
+
+def _compile(text, columns):
+    for shape, pattern in _SHAPES:
+        match = pattern.fullmatch(text)
+        if match:
+            return _sql(shape, match.groupdict(), columns)
+    return None
+
+
+def _sql(shape, parts, columns):
+    limit = f" LIMIT {parts['limit']}" if parts['limit'] else ''
+    if shape == 'latest':
+        table = _LATEST_NAMES[parts['latest']][1]
+        if 'eventdate' not in columns.get(table, ()) or 'vehicleId' not in columns.get(table, ()):
+            return None
+        # The table's own columns, so the helper latest_rank column is not returned.
+        return (f"SELECT {', '.join(columns[table])} FROM (SELECT t.*, ROW_NUMBER() OVER "
+                f"(PARTITION BY t.vehicleId ORDER BY t.eventdate DESC) AS latest_rank FROM {table} t) "
+                f"WHERE latest_rank = 1 ORDER BY eventdate DESC{limit};")
+
+    dimension = _DIMENSION_NAMES[parts['dimension']][1]
+    if shape == 'superlative':
+        order = 'ASC' if parts['superlative'] in _ASCENDING else 'DESC'
+    elif parts['rank']:
+        order = 'ASC' if parts['rank'] == 'bottom' else 'DESC'
+    else:
+        # "lowest/minimum range per dealer" lists the lowest first, anything else the highest.
+        order = 'ASC' if parts.get('aggregate') and AGGREGATES[parts['aggregate']] == 'MIN' else 'DESC'
+
+    if parts.get('subject'):
+        _, table, expression, alias = _SUBJECT_NAMES[parts['subject']]
+        if dimension not in columns.get(table, ()):
+            return None
+        return (f"SELECT {dimension}, {expression} AS {alias} FROM {table} "
+                f"GROUP BY {dimension} ORDER BY {alias} {order}{limit};")
+
+    _, table, column, default = _METRIC_NAMES[parts['metric']]
+    aggregate = AGGREGATES[parts['aggregate']] if parts.get('aggregate') else default
+    if column not in columns.get(table, ()) or dimension not in columns.get(table, ()):
+        return None
+    alias = f"{ALIAS_PREFIX[aggregate]}_{column}"
+    return (f"SELECT {dimension}, {aggregate}({column}) AS {alias} FROM {table} "
+            f"GROUP BY {dimension} ORDER BY {alias} {order}{limit};")
+
+
+def compile_question(question, prompt):
+    """
+    Compile a question of a common fixed shape straight to SQL, without the LLM.
+
+    Handles "count of X per Y", "total/avg/max/min <metric> per <dimension>", "top N
+    <dimension>s by <metric>", "<dimension>s with the most/fewest <metric>" and "latest
+    <table> row per vehicle", using only columns listed in the prompt's schema. The whole
+    question must fit a shape: any other word may be a filter, so the question is left to
+    the LLM (None) rather than answered without it. Every call is counted in
+    fast_path_stats().
+    """
+    columns = _known_columns(prompt)
+    sql = _compile(normalize_question(question), columns) if columns else None
+    with _stats_lock:
+        _stats['fast_path' if sql else 'llm'] += 1
+    return sql
+
+
+def fast_path_stats():
+    """Return how many questions this process answered with the fast path and the LLM."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['fast_path'] + stats['llm']
+    stats['fast_path_rate'] = stats['fast_path'] / total if total else 0.0
+    return stats
@@ -0,0 +1,359 @@
+import argparse
+import re
+import sqlite3
+import statistics
+
+from answer_cache import CACHE_PATH, get_cache_connection
+from db_pool import time_query
+from example_store import parse_examples
+from prompt_builder import load_template
+
+# Indexes wider than this are not worth their write and storage cost; the key columns are
+# kept and the covering columns dropped.
+MAX_INDEX_COLUMNS = 6
+# Scanning a table this small is cheaper than maintaining an index on it.
+MIN_TABLE_ROWS = 10000
+# An index is kept only if the queries that use it get at least this much faster.
+MIN_IMPROVEMENT = 0.1
+# Rows sampled per index by ANALYZE, so re-planning stays cheap on large tables.
+ANALYSIS_LIMIT = 1000
+INDEX_PREFIX = 'advisor_'
+
+_COLUMN_REF = r'(?:\b(\w+)\.)?\b(\w+)\b'
+_TABLE_REF_RE = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|LEFT|RIGHT|INNER|OUTER|CROSS|NATURAL|'
+    r'GROUP|ORDER|LIMIT|USING|UNION|WINDOW|HAVING)\b)(\w+))?', re.IGNORECASE)
+_EQUALITY_RE = re.compile(_COLUMN_REF + r'\s*(?:(?<![<>!])=|\bIN\b)\s*(?:' + _COLUMN_REF + r')?', re.IGNORECASE)
+_RANGE_RE = re.compile(_COLUMN_REF + r'\s*(?:<|>|\bBETWEEN\b|\bLIKE\b)', re.IGNORECASE)
+_ORDERING_RE = re.compile(r'\b(?:GROUP|ORDER|PARTITION)\s+BY\b(.*?)(?=\b(?:LIMIT|HAVING|UNION|WINDOW|FROM|'
+                          r'WHERE|ORDER|GROUP|ROWS|RANGE)\b|\)|;|$)', re.IGNORECASE | re.DOTALL)
+_ACCESS_RE = re.compile(r'^(SCAN|SEARCH) (\w+)(?: USING (.*))?$')
+_AUTOMATIC_RE = re.compile(r'AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX \((.*)\)')
+_TEMP_BTREE_RE = re.compile(r'^USE TEMP B-TREE FOR (.*)$')
+
+
+def table_columns(conn):
+    """Return {table: [column, ...]} for every table in the database."""
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    return {table: [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+            for table in tables}
+
+
+def existing_indexes(conn):
+    """Return {table: [(index name, (column, ...)), ...]} for the database's indexes."""
+    indexes = {}
+    for name, table in conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"):
+        columns = tuple(row[0] for row in conn.execute("SELECT name FROM pragma_index_info(?)", (name,)))
+        indexes.setdefault(table, []).append((name, columns))
+    return indexes
+
+
+def explain(conn, sql):
+    """Return the EXPLAIN QUERY PLAN rows of a statement as (id, parent, detail) tuples."""
+    return [(row[0], row[1], row[3]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def plan_issues(plan):
+    """
+    Find full scans, automatic indexes and temp B-trees in a query plan.
+
+    Returns a list of dicts with kind ('scan', 'automatic_index' or 'temp_btree'), the
+    alias the plan names, automatic index columns, whether the access is the first loop
+    under its parent (so join predicates cannot narrow it) and the plan detail.
+    """
+    details = {row_id: detail for row_id, _, detail in plan}
+    seen_parents = set()
+    issues = []
+    for row_id, parent, detail in plan:
+        access = _ACCESS_RE.match(detail)
+        if access:
+            outer = parent not in seen_parents and not details.get(parent, '').startswith('CORRELATED')
+            seen_parents.add(parent)
+            using = access.group(3) or ''
+            automatic = _AUTOMATIC_RE.search(using)
+            if automatic:
+                columns = [part.split('=')[0].strip() for part in automatic.group(1).split(' AND ')]
+                issues.append({'kind': 'automatic_index', 'alias': access.group(2), 'columns': columns,
+                               'outer': outer, 'detail': detail})
+            elif 'INDEX' not in using and 'PRIMARY KEY' not in using and 'rowid' not in using:
+                issues.append({'kind': 'scan', 'alias': access.group(2), 'columns': [],
+                               'outer': outer, 'detail': detail})
+            continue
+        temp = _TEMP_BTREE_RE.match(detail)
+        if temp:
+            issues.append({'kind': 'temp_btree', 'alias': None, 'columns': [], 'outer': False, 'detail': detail})
+    return issues
+
+
+def _aliases(sql, columns):
+    aliases = {}
+    for table, alias in _TABLE_REF_RE.findall(sql):
+        if table in columns:
+            aliases[table] = table
+            if alias:
+                aliases[alias] = table
+    return aliases
+
+
+def _resolve(qualifier, name, aliases, lookup):
+    """Return (table, column) for a column reference, or None if it is not an unambiguous column."""
+    if qualifier:
+        table = aliases.get(qualifier)
+        column = lookup.get(table, {}).get(name.lower()) if table else None
+        return (table, column) if column else None
+    matches = {table for table in set(aliases.values()) if name.lower() in lookup[table]}
+    if len(matches) != 1:
+        return None
+    table = matches.pop()
+    return table, lookup[table][name.lower()]
+
+
+def column_usage(sql, columns):
+    """
+    Classify the columns a statement uses, per table.
+
+    Returns {table: {'constant': [...], 'join': [...], 'range': [...], 'ordering': [...],
+    'referenced': [...], 'star': bool}} where constant and join are equality predicates
+    against literals and against other columns.
+    """
+    aliases = _aliases(sql, columns)
+    lookup = {table: {name.lower(): name for name in names} for table, names in columns.items()}
+    usage = {table: {'constant': [], 'join': [], 'range': [], 'ordering': [], 'referenced': [], 'star': False}
+             for table in set(aliases.values())}
+
+    def add(table, kind, column):
+        if column not in usage[table][kind]:
+            usage[table][kind].append(column)
+
+    for match in _EQUALITY_RE.finditer(sql):
+        left = _resolve(match.group(1), match.group(2), aliases, lookup)
+        right = _resolve(match.group(3), match.group(4), aliases, lookup) if match.group(4) else None
+        if left:
+            add(left[0], 'join' if right else 'constant', left[1])
+        if right:
+            add(right[0], 'join' if left else 'constant', right[1])
+    for match in _RANGE_RE.finditer(sql):
+        ref = _resolve(match.group(1), match.group(2), aliases, lookup)
+        if ref:
+            add(ref[0], 'range', ref[1])
+    for clause in _ORDERING_RE.findall(sql):
+        for qualifier, name in re.findall(_COLUMN_REF, clause):
+            ref = _resolve(qualifier, name, aliases, lookup)
+            if ref:
+                add(ref[0], 'ordering', ref[1])
+    for qualifier, name in re.findall(_COLUMN_REF, sql):
+        ref = _resolve(qualifier, name, aliases, lookup)
+        if ref:
+            add(ref[0], 'referenced', ref[1])
+    for qualifier in re.findall(r'\b(\w+)\.\*', sql):
+        if qualifier in aliases:
+            usage[aliases[qualifier]]['star'] = True
+    if re.search(r'\bSELECT\s+(?:DISTINCT\s+)?\*', sql, re.IGNORECASE):
+        for used in usage.values():
+            used['star'] = True
+    return usage
+
+
+def _index_columns(issue, used):
+    """Return (key, covering) columns for one plan issue, or None when no index would help."""
+    if issue['kind'] == 'automatic_index':
+        key = list(issue['columns']) + used['range'] + used['ordering']
+    elif issue['outer']:
+        # The outer loop is read in index order, so ordering columns go before ranges.
+        key = used['constant'] + used['ordering'] + used['range']
+    else:
+        key = used['constant'] + used['join'] + used['range'] + used['ordering']
+    key = list(dict.fromkeys(key))[:MAX_INDEX_COLUMNS]
+    if not key:
+        return None
+    covering = [] if used['star'] else [c for c in used['referenced'] if c not in key]
+    return tuple(key), tuple(covering)
+
+
+def propose_indexes(sql, plan, columns):
+    """
+    Return the plan issues of one query and the indexes that would remove them, as
+    (table, key columns, covering columns) tuples.
+    """
+    usage = column_usage(sql, columns)
+    aliases = _aliases(sql, columns)
+    issues = plan_issues(plan)
+    proposals = []
+    sorts = any(issue['kind'] == 'temp_btree' for issue in issues)
+    for issue in issues:
+        table = aliases.get(issue['alias'])
+        if table is None or table not in usage:
+            continue
+        used = usage[table]
+        # A full scan of the driving table is unavoidable unless something filters it, or the
+        # query reads only that table and an index in GROUP BY/ORDER BY order saves the sort.
+        if issue['kind'] == 'scan' and issue['outer'] and not (
+                used['constant'] or used['range'] or (sorts and len(usage) == 1)):
+            continue
+        index = _index_columns(issue, used)
+        if index and (table,) + index not in proposals:
+            proposals.append((table,) + index)
+    return issues, proposals
+
+
+def index_name(table, columns):
+    return f"{INDEX_PREFIX}{table}__{'_'.join(columns)}"[:120]
+
+
+def merge_proposals(proposals, indexes):
+    """
+    Turn per-query proposals into one index per (table, key): covering columns are merged
+    when they fit in MAX_INDEX_COLUMNS. Indexes whose columns are a prefix of an existing
+    index or of another proposal are dropped. Returns [(table, columns), ...].
+    """
+    grouped = {}
+    for table, key, covering in proposals:
+        grouped.setdefault((table, key), []).extend(covering)
+    candidates = []
+    for (table, key), covering in grouped.items():
+        covering = list(dict.fromkeys(covering))
+        candidates.append((table, key + tuple(covering) if len(key) + len(covering) <= MAX_INDEX_COLUMNS else key))
+    merged = []
+    for table, columns in sorted(candidates, key=lambda p: -len(p[1])):
+        covered = any(t == table and c[:len(columns)] == columns for t, c in merged)
+        covered = covered or any(c[:len(columns)] == columns for _, c in indexes.get(table, []))
+        if not covered:
+            merged.append((table, columns))
+    return merged
+
+
+def approximate_rows(conn, table):
+    """Return max(rowid) as a cheap row-count estimate, 0 for an empty table."""
+    return conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+
+
+def advise(conn, queries):
+    """
+    Replay a workload through EXPLAIN QUERY PLAN and propose covering indexes.
+
+    Returns {'queries': [{'sql', 'issues', 'proposals'} or {'sql', 'error'}], 'indexes':
+    [(table, columns), ...]} where indexes is the deduplicated proposal set.
+    """
+    columns = table_columns(conn)
+    indexes = existing_indexes(conn)
+    report = {'queries': [], 'indexes': []}
+    proposals = []
+    for sql in queries:
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error as e:
+            report['queries'].append({'sql': sql, 'error': str(e)})
+            continue
+        issues, query_proposals = propose_indexes(sql, plan, columns)
+        report['queries'].append({'sql': sql, 'issues': issues, 'proposals': query_proposals})
+        proposals.extend(query_proposals)
+    small = {table for table in columns if approximate_rows(conn, table) < MIN_TABLE_ROWS}
+    report['indexes'] = merge_proposals([p for p in proposals if p[0] not in small], indexes)
+    return report
+
+
+def _measure(conn, queries, repeat, max_seconds):
+    timings = {}
+    for sql in queries:
+        try:
+            timings[sql] = statistics.median(time_query(conn, sql, max_seconds) for _ in range(repeat))
+        except sqlite3.Error:
+            timings[sql] = None
+    return timings
+
+
+def _total(timings, queries, max_seconds):
+    return sum(max_seconds if timings[sql] is None else timings[sql] for sql in queries)
+
+
+def apply_indexes(db_path, report, repeat=3, max_seconds=10.0):
+    """
+    Create the proposed indexes one at a time and keep each only if it pays off.
+
+    After each CREATE INDEX and ANALYZE, the queries whose new plan uses the index are
+    re-timed; the index stays if their total time drops by MIN_IMPROVEMENT, otherwise it is
+    dropped again. Queries that fail or exceed max_seconds count as max_seconds. Returns
+    {'indexes': [{'name', 'table', 'columns', 'kept', 'queries', 'before', 'after'}],
+    'timings': {sql: (before, after)}} for the queries with proposals.
+    """
+    queries = [entry['sql'] for entry in report['queries'] if entry.get('proposals')]
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        before = _measure(conn, queries, repeat, max_seconds)
+        current = dict(before)
+        results = []
+        for table, columns in report['indexes']:
+            name = index_name(table, columns)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+            conn.execute(f"ANALYZE {name}")
+            conn.commit()
+            affected = [sql for sql in queries
+                        if any(re.search(rf'\b{name}\b', detail) for _, _, detail in explain(conn, sql))]
+            trial = _measure(conn, affected, repeat, max_seconds)
+            old, new = _total(current, affected, max_seconds), _total(trial, affected, max_seconds)
+            kept = bool(affected) and new < old * (1 - MIN_IMPROVEMENT)
+            if kept:
+                current.update(trial)
+            else:
+                conn.execute(f"DROP INDEX {name}")
+                conn.commit()
+            results.append({'name': name, 'table': table, 'columns': columns, 'kept': kept,
+                            'queries': len(affected), 'before': old, 'after': new})
+    finally:
+        conn.close()
+    return {'indexes': results, 'timings': {sql: (before[sql], current[sql]) for sql in queries}}
+
+
+def load_workload(script, template, cache_path=CACHE_PATH):
+    """Return the few-shot example SQL of a prompt template followed by the SQL logged in the answer cache."""
+    examples, _, _ = parse_examples(load_template(script, template))
+    queries = [example.sql for example in examples]
+    try:
+        logged = [row[0] for row in get_cache_connection(cache_path).execute("SELECT sql FROM answer_cache")]
+    except sqlite3.Error:
+        logged = []
+    return list(dict.fromkeys(queries + logged))
+
+
+def _format_seconds(value):
+    return f"{value * 1000:>9.1f}ms" if value is not None else f"{'-':>11}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Propose (or create) covering indexes for the generated-SQL workload.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--cache', default=CACHE_PATH)
+    parser.add_argument('--apply', action='store_true', help="create the indexes instead of only reporting them")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    workload = load_workload(args.script, args.template, args.cache)
+    with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+        report = advise(conn, workload)
+    failed = sum('error' in entry for entry in report['queries'])
+    flagged = [entry for entry in report['queries'] if entry.get('issues')]
+    print(f"{len(workload)} queries replayed, {failed} failed to plan, {len(flagged)} with scans or temp B-trees")
+    for entry in flagged:
+        print(f"\n{' '.join(entry['sql'].split())[:100]}")
+        for issue in entry['issues']:
+            print(f"    {issue['detail']}")
+    print("\nProposed indexes:")
+    for table, columns in report['indexes']:
+        print(f"    CREATE INDEX {index_name(table, columns)} ON {table} ({', '.join(columns)});")
+
+    if args.apply:
+        result = apply_indexes(args.db, report, args.repeat, args.max_seconds)
+        print(f"\n{'index':<90}{'queries':>8}{'before':>11}{'after':>11}")
+        for index in result['indexes']:
+            status = 'kept' if index['kept'] else 'dropped'
+            print(f"{index['name'][:80]:<82}{status:>8}{index['queries']:>8}"
+                  f"{_format_seconds(index['before'])}{_format_seconds(index['after'])}")
+        print(f"\n{'query':<70}{'before':>11}{'after':>11}")
+        for sql, (before, after) in result['timings'].items():
+            print(f"{' '.join(sql.split())[:68]:<70}{_format_seconds(before)}{_format_seconds(after)}")
+        kept = sum(index['kept'] for index in result['indexes'])
+        print(f"\nKept {kept} of {len(result['indexes'])} indexes.")
@@ -0,0 +1,179 @@
+import argparse
+import logging
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from rollups import fresh_rollups, merge_new_rows
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+INGEST_TABLES = ['vehicle_table', 'energy_data', 'charging_table', 'discharge_table', 'soh_table']
+# Rows already in the table (or earlier in the same drop) with this key are skipped.
+DEDUP_KEY = 'unique_id'
+# Rows per executemany call and per transaction. Large transactions keep the WAL and the
+# index updates efficient; a failed drop rolls back at most one transaction.
+BATCH_ROWS = int(os.environ.get('NL2SQL_INGEST_BATCH', '50000'))
+TRANSACTION_ROWS = int(os.environ.get('NL2SQL_INGEST_TRANSACTION', '500000'))
+# Identifier-like columns kept as text when read from CSV.
+TEXT_KEYS = {DEDUP_KEY: str, 'vehicle_registration_number': str}
+
+logger = logging.getLogger(__name__)
+
+
+def open_for_ingest(db_path):
+    """Open a writable connection in WAL mode, so the apps keep reading while rows are loaded."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def table_for(path, table=None):
+    """The table a drop file loads into: the given one, or the table its file name starts with."""
+    if table:
+        return table
+    name = os.path.basename(path).lower()
+    for candidate in sorted(INGEST_TABLES, key=len, reverse=True):
+        if name.startswith(candidate.lower()):
+            return candidate
+    raise ValueError(f"Cannot tell which table {path} belongs to; name it after the table or pass --table.")
+
+
+def read_batches(path, batch_rows=BATCH_ROWS):
+    """Yield DataFrames of at most batch_rows rows from a CSV or Parquet file."""
+    if path.lower().endswith(('.parquet', '.pq')):
+        if pyarrow is None:
+            raise RuntimeError("Reading Parquet needs the pyarrow package.")
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=batch_rows, dtype=TEXT_KEYS, low_memory=False)
+
+
+def _rows(df):
+    """Plain Python tuples for executemany: NaN becomes NULL, NumPy scalars become ints and floats."""
+    values = df.astype(object).where(df.notna(), None)
+    return list(values.itertuples(index=False, name=None))
+
+
+def ensure_dedup_index(conn, table):
+    """Index the dedup key so every duplicate check is an index probe."""
+    conn.execute(f"CREATE INDEX IF NOT EXISTS ingest_{table}_{DEDUP_KEY} ON {table} ({DEDUP_KEY})")
+
+
+def ingest_file(conn, path, table, batch_rows=BATCH_ROWS, transaction_rows=TRANSACTION_ROWS):
+    """
+    Append the rows of one drop file to table and return {'read', 'inserted', 'seconds'}.
+
+    Columns are matched to the table by name (case-insensitively); columns the table lacks
+    are ignored and missing ones stay NULL. A row whose unique_id is already present is
+    skipped. Rows go in with executemany, batch_rows at a time, committing every
+    transaction_rows rows.
+    """
+    columns = {row[0].lower(): row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))}
+    if DEDUP_KEY.lower() not in columns:
+        raise ValueError(f"{table} has no {DEDUP_KEY} column to deduplicate on.")
+    start = time.perf_counter()
+    read = inserted = pending = 0
+    statement = None
+    conn.execute("BEGIN")
+    try:
+        for df in read_batches(path, batch_rows):
+            if statement is None:
+                names = [columns[name.lower()] for name in df.columns if name.lower() in columns]
+                ignored = [name for name in df.columns if name.lower() not in columns]
+                if ignored:
+                    logger.warning("%s: ignoring columns that %s does not have: %s", path, table, ', '.join(ignored))
+                if DEDUP_KEY not in names:
+                    raise ValueError(f"{path} has no {DEDUP_KEY} column to deduplicate on.")
+                key_at = names.index(DEDUP_KEY)
+                statement = (f"INSERT INTO {table} ({', '.join(names)}) SELECT {', '.join('?' * len(names))} "
+                             f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {DEDUP_KEY} = ?)")
+                wanted = [name for name in df.columns if name.lower() in columns]
+            rows = _rows(df[wanted])
+            # rowcount leaves out rows written by triggers (pack tables, rollup_meta).
+            inserted += conn.executemany(statement, [row + (row[key_at],) for row in rows]).rowcount
+            read += len(rows)
+            pending += len(rows)
+            if pending >= transaction_rows:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+                pending = 0
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return {'read': read, 'inserted': inserted, 'seconds': time.perf_counter() - start}
+
+
+def ingest(db_path, paths, table=None, batch_rows=BATCH_ROWS, transaction_rows=TRANSACTION_ROWS):
+    """
+    Load drop files into a database without rebuilding it and return one report per file
+    plus a 'total' entry, each with read, inserted, seconds and rows_per_second.
+
+    Indexes (including the pack tables, kept in step by their triggers) are maintained by
+    SQLite as rows arrive. Rollups that were fresh before the load get the new rows merged
+    in (rollups.merge_new_rows) instead of being left stale; the result caches, schema
+    caches and in-memory copies notice the new database version by themselves. A
+    columnar mirror or month partitions go stale until python columnar.py --build or
+    python partitions.py --build refreshes them.
+    """
+    conn = open_for_ingest(db_path)
+    try:
+        fresh = fresh_rollups(conn)
+        appended_after = {}
+        reports = {}
+        for path in paths:
+            target = table_for(path, table)
+            ensure_dedup_index(conn, target)
+            if target not in appended_after:
+                appended_after[target] = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {target}").fetchone()[0]
+            reports[path] = ingest_file(conn, path, target, batch_rows, transaction_rows)
+            reports[path]['table'] = target
+        start = time.perf_counter()
+        conn.execute("BEGIN")
+        for target, after in appended_after.items():
+            if target in fresh:
+                touched = merge_new_rows(conn, target, after)
+                logger.info("Merged the new %s rows into %d rollup rows.", target, touched)
+        conn.execute("COMMIT")
+        conn.execute("PRAGMA optimize")
+        rollup_seconds = time.perf_counter() - start
+    finally:
+        conn.close()
+    total = {'read': sum(report['read'] for report in reports.values()),
+             'inserted': sum(report['inserted'] for report in reports.values()),
+             'seconds': sum(report['seconds'] for report in reports.values()) + rollup_seconds,
+             'rollup_seconds': rollup_seconds}
+    for report in list(reports.values()) + [total]:
+        report['rows_per_second'] = report['read'] / report['seconds'] if report['seconds'] else 0.0
+    reports['total'] = total
+    return reports
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Append CSV/Parquet drops of new telemetry to the database.")
+    parser.add_argument('paths', nargs='+', help="drop files, named after their table unless --table is given")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--table', choices=INGEST_TABLES)
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS)
+    parser.add_argument('--transaction-rows', type=int, default=TRANSACTION_ROWS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    reports = ingest(args.db, args.paths, args.table, args.batch_rows, args.transaction_rows)
+    total = reports.pop('total')
+    for path, report in reports.items():
+        print(f"{path} -> {report['table']}: {report['inserted']:,} of {report['read']:,} rows inserted "
+              f"({report['read'] - report['inserted']:,} duplicates) in {report['seconds']:.1f}s, "
+              f"{report['rows_per_second']:,.0f} rows/s")
+    print(f"total: {total['inserted']:,} of {total['read']:,} rows in {total['seconds']:.1f}s "
+          f"(rollups {total['rollup_seconds']:.1f}s), {total['rows_per_second']:,.0f} rows/s")
@@ -0,0 +1,186 @@
+import json
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from sql_text import find_complete_statement, find_statement_start, find_statements
+
+OLLAMA_BASE_URL = 'http://localhost:11434'
+
+# How long Ollama keeps a model resident after the last request (duration string or
+# seconds; -1 keeps it loaded indefinitely).
+KEEP_ALIVE = '30m'
+
+# Size of the HTTP keep-alive pool shared by every Streamlit session in the process.
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 16
+
+# Generation limits: a one-line SQL answer never needs more than NUM_PREDICT tokens, and the
+# stop sequences end generation if the model starts another question or an explanation.
+NUM_PREDICT = 256
+STOP_SEQUENCES = ['Question:', 'Explanation:', '\n\n\n']
+
+
+@st.cache_resource(show_spinner=False)
+def get_http_session():
+    """Process-wide requests session with a pooled, keep-alive connection to Ollama."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@st.cache_resource(show_spinner=False)
+def get_llm(model, keep_alive=KEEP_ALIVE):
+    """Process-wide LangChain Ollama completion client for a model."""
+    from langchain.llms import Ollama
+    return Ollama(model=model, base_url=OLLAMA_BASE_URL, keep_alive=keep_alive,
+                  num_predict=NUM_PREDICT, stop=STOP_SEQUENCES)
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_llm(model, keep_alive=KEEP_ALIVE):
+    """Process-wide LangChain ChatOllama client for a model."""
+    from langchain.chat_models import ChatOllama
+    return ChatOllama(model=model, base_url=OLLAMA_BASE_URL, keep_alive=keep_alive,
+                      num_predict=NUM_PREDICT, stop=STOP_SEQUENCES)
+
+
+@st.cache_resource(show_spinner="Loading the language model...")
+def _load_model(model, keep_alive):
+    """
+    Have Ollama load a model; an empty prompt loads it without generating anything.
+    Raises on failure, which st.cache_resource does not cache, so only success is remembered.
+    """
+    response = get_http_session().post(
+        f"{OLLAMA_BASE_URL}/api/generate",
+        json={"model": model, "prompt": "", "keep_alive": keep_alive, "stream": False},
+        timeout=300,
+    )
+    response.raise_for_status()
+    return True
+
+
+def warm_up(model, keep_alive=KEEP_ALIVE):
+    """
+    Load the model into Ollama once per process so the first user does not pay for it.
+
+    Returns True when the model is loaded, False when Ollama could not be reached or
+    refused; a failed warm-up is retried on the next call.
+    """
+    try:
+        return _load_model(model, keep_alive)
+    except requests.RequestException:
+        return False
+
+
+def stream_generate(model, prompt, url=f"{OLLAMA_BASE_URL}/api/generate", keep_alive=KEEP_ALIVE,
+                    context=None, raw=False, timeout=300, **options):
+    """
+    Stream completion text from Ollama's /api/generate, one chunk per yielded string.
+
+    Closing the generator closes the HTTP response, which makes Ollama stop generating.
+    context is a token array returned by an earlier call whose evaluation is reused; raw
+    skips the model's prompt template. timeout is the request timeout in seconds, which
+    also bounds each wait for the next chunk. Extra keyword arguments are passed as Ollama
+    options.
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": NUM_PREDICT, "stop": STOP_SEQUENCES, **options},
+    }
+    if context:
+        payload["context"] = context
+    if raw:
+        payload["raw"] = True
+    with get_http_session().post(url, json=payload, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get('response'):
+                yield chunk['response']
+            if chunk.get('done'):
+                return
+
+
+def _may_continue(rest):
+    """
+    True while the text after the last complete statement may still start another one.
+
+    The prompts ask for extra statements on the same line, in the upper-case SQL of their
+    examples, so a blank line, or a first word other than SELECT or WITH (e.g. "With these
+    results..." or "Note:"), ends the list. A word still being generated only has to be a
+    prefix of one of them.
+    """
+    stripped = rest.lstrip()
+    if rest[:len(rest) - len(stripped)].count('\n') > 1:
+        return False
+    word = stripped.split(None, 1)[0] if stripped else ''
+    if word == stripped:
+        return any(keyword.startswith(word) for keyword in ('SELECT', 'WITH'))
+    return word in ('SELECT', 'WITH')
+
+
+def _statement_list(text):
+    """
+    Return (end, closed) for the statements at the start of an answer: the offset just
+    past the last of them, and whether the text after it ends the list.
+    """
+    end = 0
+    for statement in find_statements(text):
+        at = text.index(statement, end)
+        if end and not _may_continue(text[end:at + len(statement)]):
+            return end, True
+        end = at + len(statement)
+    return end, bool(end) and not _may_continue(text[end:])
+
+
+def stream_sql(chunks, on_partial=None, multiple=False):
+    """
+    Consume streamed completion chunks until the first complete SQL statement is parsed.
+
+    Parameters:
+    chunks (iterable): Text chunks, e.g. from stream_generate or a LangChain llm.stream().
+    on_partial (callable): Called with the SQL generated so far after every chunk.
+    multiple (bool): Keep reading while the model follows a statement with another one,
+    for answers made of several independent queries (see _may_continue).
+
+    Returns:
+    str: The text generated up to and including the (last) statement's semicolon, or
+    everything generated if no complete statement appeared. Generation is cancelled as
+    soon as the statement is complete, or with multiple as soon as something other than
+    another statement follows.
+    """
+    text = ''
+    end = 0
+    try:
+        for chunk in chunks:
+            text += getattr(chunk, 'content', chunk)
+            if multiple:
+                end, closed = _statement_list(text)
+                if closed:
+                    return text[:end]
+                start = find_statement_start(text)
+                if on_partial and start >= 0:
+                    on_partial(text[start:].strip())
+                continue
+            statement = find_complete_statement(text)
+            start = find_statement_start(text)
+            if on_partial and start >= 0:
+                on_partial(statement or text[start:])
+            if statement:
+                return text[:text.index(statement) + len(statement)]
+        if end:
+            return text[:end]
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+    return text
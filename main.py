@@ -1,11 +1,17 @@
 import streamlit as st
-from langchain.llms import Ollama
-import sqlite3
 import pandas as pd
 import plotly.express as px
+from request_state import answer_once, generate_answer, last_result, page_controls, show_parts
+from pack_tables import with_pack_tables
+from llm_clients import get_llm, stream_generate, stream_sql, warm_up
+from prompt_context import USE_PREFIX_CONTEXT, stream_with_prefix_context, warm_prefix_context
 import matplotlib.pyplot as pl
+from prompt_builder import build_prompt
+from paged_query import empty_page, first_page
+from db_pool import QueryBudgetExceeded
 
 database_path = 'tml_cesl_final_data_acsentsarthi.db'
+model_name = 'mistral'
 
 
 
@@ -440,8 +446,11 @@ SELECT ed.vehicleId, vt.vehicle_registration_number, ct.kwhCharged AS charged_en
 - Find cases where SOC drops significantly between charge and discharge.
 SELECT ed.vehicleId, vt.vehicle_registration_number, ct.soc_end AS charging_soc, dt.dischargeSoc AS discharge_soc, (ct.soc_end - dt.dischargeSoc) AS soc_difference FROM energy_data ed JOIN vehicle_table vt ON ed.vehicleId = vt.vehicleId JOIN charging_table ct ON ed.vehicleId = ct.vehicleId JOIN discharge_table dt ON ed.vehicleId = dt.vehicleId WHERE (ct.soc_end - dt.dischargeSoc) > 30 ORDER BY soc_difference DESC;
 
-- Write an SQL query to find the total energy discharged from discharge_table and the total energy charged from charging_table for each vehicle.
-SELECT d.vehicleId,SUM(d.NetkWh) AS total_energy_discharged,SUM(c.kwhCharged) AS total_energy_charged FROM discharge_table d JOIN charging_table c ON d.vehicleId = c.vehicleId GROUP BY d.vehicleId;
+- Write an SQL query to find the total energy discharged from discharge_table for each vehicle.
+SELECT vehicleId, SUM(NetkWh) AS total_energy_discharged FROM discharge_table GROUP BY vehicleId;
+
+- Write an SQL query to find the total energy charged from charging_table for each vehicle.
+SELECT vehicleId, SUM(kwhCharged) AS total_energy_charged FROM charging_table GROUP BY vehicleId;
 
 - Find the average state of charge (SOC) before and after charging for each vehicle
 SELECT d.vehicleId,AVG(d.startSoc) AS avg_discharge_start_soc,AVG(c.soc_end) AS avg_charge_end_soc FROM discharge_table d JOIN charging_table c ON d.vehicleId = c.vehicleId GROUP BY d.vehicleId;
@@ -542,7 +551,7 @@ SELECT DLR_NAME, COUNT(DISTINCT DLR_REGION) AS unique_regions FROM vehicle_table
 SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.Depot_Name, c.InterruptDurationInMin FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number WHERE c.InterruptDurationInMin > 30 ORDER BY c.InterruptDurationInMin DESC;
 
 - Get the latest charging session details for each vehicle
-SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, c.kwhCharged, c.chargeDurationInMin, c.soc_start, c.soc_end, c.eventdate FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 WHERE c2.vehicleId = c.vehicleId) ORDER BY c.eventdate DESC;
+SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, c.kwhCharged, c.chargeDurationInMin, c.soc_start, c.soc_end, c.eventdate FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number JOIN (SELECT vehicleId, MAX(eventdate) AS latest_eventdate FROM charging_table GROUP BY vehicleId) latest ON latest.vehicleId = c.vehicleId AND latest.latest_eventdate = c.eventdate ORDER BY c.eventdate DESC;
 
 - Count the number of charging sessions per vehicle
 SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, COUNT(c.unique_id) AS charging_sessions FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number GROUP BY v.vehicleId, v.vehicle_registration_number, v.DLR_NAME, v.DLR_STATE ORDER BY charging_sessions DESC;
@@ -554,20 +563,32 @@ Question: {question}
 Query Language:SQL
 Answer:
  
-[The output should be a single, valid SQL query in one line, without line breaks or additional text.]
+[The output should be a single, valid SQL query in one line, without line breaks or additional text. Only when the question combines totals from unrelated tables, write one such query per table, one after another on the same line.]
 """
+prompt_template = with_pack_tables(prompt_template, database_path)
 
 
 def get_ollama_response(question, prompt):
-    llm = Ollama(model="mistral")  
-    response = llm.invoke(f"{prompt}\nQuestion: {question}\nAnswer:")
+    prompt, stats = build_prompt(prompt, question)
+    st.caption(f"Schema linked to {', '.join(stats['tables']) or 'all tables'}: "
+               f"saved ~{stats['tokens_saved']} of {stats['tokens_before']} prompt tokens.")
+    full_prompt = f"{prompt}\nQuestion: {question}\nAnswer:"
+    if USE_PREFIX_CONTEXT:
+        chunks = stream_with_prefix_context(model_name, prompt_template, full_prompt)
+    else:
+        chunks = get_llm(model_name).stream(full_prompt)
+    partial_sql = st.empty()
+    response = stream_sql(chunks, lambda sql: partial_sql.code(sql, language='sql'), multiple=True)
+    partial_sql.empty()
     return response
 
 def read_sql_query(sql, db):
-    conn = sqlite3.connect(db)
-    df = pd.read_sql_query(sql, conn)
-    conn.close()
-    return df
+    try:
+        page = first_page(sql, db)
+    except QueryBudgetExceeded as e:
+        st.error(str(e))
+        return empty_page(sql, db)
+    return page
 
 def get_sql_query_from_response(response):
     try:
@@ -667,6 +688,9 @@ def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=N
     y_axis_label (str): The y-axis label.
     color_scale (str): The color scale for heatmaps.
     bin_size (int): The bin size for histograms.
+
+    Returns:
+    plotly.graph_objects.Figure: The chart, or None if no chart can be drawn.
     """
     if chart_type is None:
         st.write("No suitable chart type determined for this data.")
@@ -754,9 +778,25 @@ def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=N
                          template="plotly_white")
     
     fig.update_layout(plot_bgcolor="rgba(0,0,0,0)")
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+def chart_for(df):
+    """The chart for a page of results, or None when no chart type suits it."""
+    chart_type = determine_chart_type(df)
+    return generate_chart(df, chart_type) if chart_type else None
+
+
+def answer_question(question):
+    """Generate, run and chart the SQL for a question; called only when the question changes."""
+    return generate_answer(question, model_name, database_path, prompt_template,
+                           lambda q: get_ollama_response(q, prompt_template), get_sql_query_from_response,
+                           lambda prompt, timeout: stream_generate(model_name, prompt, timeout=timeout),
+                           lambda sql: read_sql_query(sql, database_path), chart_for)
 
 st.set_page_config(page_title="SQL Query Retrieval App", layout="wide")
+warm_up(model_name)
+if USE_PREFIX_CONTEXT:
+    warm_prefix_context(model_name, prompt_template)
 
 st.markdown("""
     <h1 style="color: purple; text-align: center;">
@@ -777,25 +817,29 @@ with st.container():
         submit = st.button("Retrieve Data", help="Click to submit your question.")
 
 if submit and question:
-    response = get_ollama_response(question, prompt_template)
-    sql_query = get_sql_query_from_response(response)
-    
-    if sql_query:
-        st.code(sql_query, language='sql')
-        df = read_sql_query(sql_query, database_path)
-        
-        if not df.empty:
+    answer_once(question, answer_question)
+
+result = last_result()
+if result:
+    if result['note']:
+        st.caption(result['note'])
+    if result['sql_query']:
+        st.code(result['sql_query'], language='sql')
+        df = result['df']
+
+        if result['parts']:
+            show_parts(result)
+        elif not df.empty:
             col_data, col_chart = st.columns(2)
             with col_data:
                 st.subheader("Query Results:")
-                st.dataframe(df)
-            chart_type = determine_chart_type(df)
-            
-            if chart_type:
+                st.dataframe(page_controls(result))
+
+            if result['fig'] is not None:
                 with col_chart:
                     st.subheader("Visualization:")
-                    generate_chart(df, chart_type)  
+                    st.plotly_chart(result['fig'], use_container_width=True)
         else:
             st.write("No results found for the given query.")
     else:
-        st.write("No valid SQL query could be extracted from the response.")
\ No newline at end of file
+        st.write("No valid SQL query could be extracted from the response.")
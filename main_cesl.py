@@ -1,15 +1,20 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
 import plotly.express as px
-from langchain.chat_models import ChatOllama
 from langchain.schema import HumanMessage
+from prompt_builder import build_prompt
+from request_state import answer_once, generate_answer, page_controls, show_parts
+from pack_tables import with_pack_tables
+from prompt_context import USE_PREFIX_CONTEXT, stream_with_prefix_context, warm_prefix_context
+from llm_clients import get_chat_llm, stream_generate, stream_sql, warm_up
+from paged_query import empty_page, first_page
 
 # Database Path
 database_path = "tml_cesl_final_data_acsentsarthi.db"
 
 # Initialize Ollama Language Model
-ollama_llm = ChatOllama(model="llama3.2:3b")
+model_name = "llama3.2:3b"
+ollama_llm = get_chat_llm(model_name)
 
 # Prompt Template
 prompt_template = """
@@ -443,8 +448,11 @@ SELECT ed.vehicleId, vt.vehicle_registration_number, ct.kwhCharged AS charged_en
 - Find cases where SOC drops significantly between charge and discharge.
 SELECT ed.vehicleId, vt.vehicle_registration_number, ct.soc_end AS charging_soc, dt.dischargeSoc AS discharge_soc, (ct.soc_end - dt.dischargeSoc) AS soc_difference FROM energy_data ed JOIN vehicle_table vt ON ed.vehicleId = vt.vehicleId JOIN charging_table ct ON ed.vehicleId = ct.vehicleId JOIN discharge_table dt ON ed.vehicleId = dt.vehicleId WHERE (ct.soc_end - dt.dischargeSoc) > 30 ORDER BY soc_difference DESC;
 
-- Write an SQL query to find the total energy discharged from discharge_table and the total energy charged from charging_table for each vehicle.
-SELECT d.vehicleId,SUM(d.NetkWh) AS total_energy_discharged,SUM(c.kwhCharged) AS total_energy_charged FROM discharge_table d JOIN charging_table c ON d.vehicleId = c.vehicleId GROUP BY d.vehicleId;
+- Write an SQL query to find the total energy discharged from discharge_table for each vehicle.
+SELECT vehicleId, SUM(NetkWh) AS total_energy_discharged FROM discharge_table GROUP BY vehicleId;
+
+- Write an SQL query to find the total energy charged from charging_table for each vehicle.
+SELECT vehicleId, SUM(kwhCharged) AS total_energy_charged FROM charging_table GROUP BY vehicleId;
 
 - Find the average state of charge (SOC) before and after charging for each vehicle
 SELECT d.vehicleId,AVG(d.startSoc) AS avg_discharge_start_soc,AVG(c.soc_end) AS avg_charge_end_soc FROM discharge_table d JOIN charging_table c ON d.vehicleId = c.vehicleId GROUP BY d.vehicleId;
@@ -545,7 +553,7 @@ SELECT DLR_NAME, COUNT(DISTINCT DLR_REGION) AS unique_regions FROM vehicle_table
 SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.Depot_Name, c.InterruptDurationInMin FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number WHERE c.InterruptDurationInMin > 30 ORDER BY c.InterruptDurationInMin DESC;
 
 - Get the latest charging session details for each vehicle
-SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, c.kwhCharged, c.chargeDurationInMin, c.soc_start, c.soc_end, c.eventdate FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 WHERE c2.vehicleId = c.vehicleId) ORDER BY c.eventdate DESC;
+SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, c.kwhCharged, c.chargeDurationInMin, c.soc_start, c.soc_end, c.eventdate FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number JOIN (SELECT vehicleId, MAX(eventdate) AS latest_eventdate FROM charging_table GROUP BY vehicleId) latest ON latest.vehicleId = c.vehicleId AND latest.latest_eventdate = c.eventdate ORDER BY c.eventdate DESC;
 
 - Count the number of charging sessions per vehicle
 SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, COUNT(c.unique_id) AS charging_sessions FROM vehicle_table v JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number GROUP BY v.vehicleId, v.vehicle_registration_number, v.DLR_NAME, v.DLR_STATE ORDER BY charging_sessions DESC;
@@ -555,32 +563,39 @@ SELECT v.Depot_Name, COUNT(c.unique_id) AS total_charging_sessions FROM vehicle_
  
 
  
-[The output should be a single, valid SQL query in one line, without line breaks or additional text.]
+[The output should be a single, valid SQL query in one line, without line breaks or additional text. Only when the question combines totals from unrelated tables, write one such query per table, one after another on the same line.]
 
 Question: {question}
 SQL Query:
 """
+prompt_template = with_pack_tables(prompt_template, database_path)
 
 def get_ollama_response(question, prompt_template):
     """Generate SQL query using LangChain's ChatOllama."""
-    prompt = prompt_template.format(question=question)
-    response = ollama_llm([HumanMessage(content=prompt)])
-    return response.content.strip()
+    pruned, stats = build_prompt(prompt_template, question)
+    st.caption(f"Schema linked to {', '.join(stats['tables']) or 'all tables'}: "
+               f"saved ~{stats['tokens_saved']} of {stats['tokens_before']} prompt tokens.")
+    prompt = pruned.format(question=question)
+    if USE_PREFIX_CONTEXT:
+        chunks = stream_with_prefix_context(model_name, prompt_template, prompt)
+    else:
+        chunks = ollama_llm.stream([HumanMessage(content=prompt)])
+    partial_sql = st.empty()
+    response = stream_sql(chunks, lambda sql: partial_sql.code(sql, language='sql'), multiple=True)
+    partial_sql.empty()
+    return response.strip()
 
 def get_sql_query_from_response(response):
     """Extract SQL query from Ollama's response."""
     return response.split("SQL Query:")[-1].strip()
 
 def read_sql_query(sql_query, db_path):
-    """Execute SQL query and return results as a DataFrame."""
+    """Execute SQL query and return the first page of results."""
     try:
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query(sql_query, conn)
-        conn.close()
-        return df
+        return first_page(sql_query, db_path)
     except Exception as e:
         st.error(f"Error executing SQL query: {e}")
-        return pd.DataFrame()
+        return empty_page(sql_query, db_path)
 
 def determine_chart_type(df):
     """Determine the best chart type based on DataFrame columns."""
@@ -595,7 +610,7 @@ def determine_chart_type(df):
         return "table"
 
 def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=None):
-    """Generate a Plotly chart based on determined chart type."""
+    """Build a Plotly chart based on determined chart type; returns None if unsupported."""
     if chart_type == 'bar':
         fig = px.bar(df, x=df.columns[0], y=df.columns[1], title=title if title else "Bar Chart", template="plotly_white")
     elif chart_type == 'pie':
@@ -603,28 +618,47 @@ def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=N
     elif chart_type == 'scatter':
         fig = px.scatter(df, x=df.columns[0], y=df.columns[1], color=df.columns[2], title=title if title else "Scatter Plot")
     else:
-        st.write("Unsupported chart type.")
-        return
-    st.plotly_chart(fig)
+        return None
+    return fig
+
+def chart_for(df):
+    """The chart for a page of results."""
+    return generate_chart(df, determine_chart_type(df))
+
+
+def answer_question(question):
+    """Generate, run and chart the SQL for a question; called only when the question changes."""
+    return generate_answer(question, model_name, database_path, prompt_template,
+                           lambda q: get_ollama_response(q, prompt_template), get_sql_query_from_response,
+                           lambda prompt, timeout: stream_generate(model_name, prompt, timeout=timeout),
+                           lambda sql: read_sql_query(sql, database_path), chart_for)
 
 # Streamlit UI
+warm_up(model_name)
+if USE_PREFIX_CONTEXT:
+    warm_prefix_context(model_name, prompt_template)
 st.title("SQL Query Generator and Visualization")
 st.write("Enter your question about the database, and the system will generate an SQL query and suggest the best visualization.")
 
 user_question = st.text_input("Enter your question:")
 
 if user_question:
-    response = get_ollama_response(user_question, prompt_template)
-    sql_query = get_sql_query_from_response(response)
+    result = answer_once(user_question, answer_question)
 
-    if sql_query:
+    if result['note']:
+        st.caption(result['note'])
+    if result['sql_query']:
         st.write("Generated SQL Query:")
-        st.code(sql_query, language="sql")
+        st.code(result['sql_query'], language="sql")
 
-        df = read_sql_query(sql_query, database_path)
-        if not df.empty:
+        df = result['df']
+        if result['parts']:
+            show_parts(result)
+        elif not df.empty:
             st.write("Query Result:")
-            st.dataframe(df)
+            st.dataframe(page_controls(result))
 
-            chart_type = determine_chart_type(df)
-            generate_chart(df, chart_type)
\ No newline at end of file
+            if result['fig'] is not None:
+                st.plotly_chart(result['fig'])
+            else:
+                st.write("Unsupported chart type.")
@@ -1,11 +1,15 @@
 import streamlit as st
-from langchain.llms import Ollama
-import sqlite3
 import pandas as pd
 import plotly.express as px
+from request_state import answer_once, generate_answer, last_result, page_controls, show_parts
+from llm_clients import get_llm, stream_generate, stream_sql, warm_up
+from prompt_context import USE_PREFIX_CONTEXT, stream_with_prefix_context, warm_prefix_context
+from paged_query import empty_page, first_page
+from db_pool import QueryBudgetExceeded
 import matplotlib.pyplot as pl
 
 database_path = 'abc_cesl_final_data_acsentsarthi.db'
+model_name = 'mistral'
 
 prompt_template = """
 You are an expert SQL developer and data visualization specialist. Your role is to accurately translate user questions into optimized SQL queries and recommend the best visualization type for effective data interpretation. The database, named `tml_cesl_final_data_acsentsarthi.db`, contains the following three key tables:
@@ -36,20 +40,28 @@ Question: {question}
 Query Language:SQL
 Answer:
  
-[The output should be a single, valid SQL query in one line, without line breaks or additional text.]
+[The output should be a single, valid SQL query in one line, without line breaks or additional text. Only when the question combines totals from unrelated tables, write one such query per table, one after another on the same line.]
 
 """
 
 def get_ollama_response(question, prompt):
-    llm = Ollama(model="mistral")  
-    response = llm.invoke(f"{prompt}\nQuestion: {question}\nAnswer:")
+    full_prompt = f"{prompt}\nQuestion: {question}\nAnswer:"
+    if USE_PREFIX_CONTEXT:
+        chunks = stream_with_prefix_context(model_name, prompt, full_prompt)
+    else:
+        chunks = get_llm(model_name).stream(full_prompt)
+    partial_sql = st.empty()
+    response = stream_sql(chunks, lambda sql: partial_sql.code(sql, language='sql'), multiple=True)
+    partial_sql.empty()
     return response
 
 def read_sql_query(sql, db):
-    conn = sqlite3.connect(db)
-    df = pd.read_sql_query(sql, conn)
-    conn.close()
-    return df
+    try:
+        page = first_page(sql, db)
+    except QueryBudgetExceeded as e:
+        st.error(str(e))
+        return empty_page(sql, db)
+    return page
 
 def get_sql_query_from_response(response):
     try:
@@ -84,7 +96,7 @@ def determine_chart_type(df):
     num_cols = df.select_dtypes(include=['int64', 'float64']).columns
     cat_cols = df.select_dtypes(include=['object', 'category']).columns
 
-    # Check for Pie Chart: 1 categorical + 1 numerical, limited categories (&lt;=10)
+    # Check for Pie Chart: 1 categorical + 1 numerical, limited categories (<=10)
     if len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1 and len(df) <= 10:
        return 'pie'
 
@@ -115,13 +127,13 @@ def determine_chart_type(df):
         return 'radar'
 
     # Check for Bar Chart: 1 categorical + 1 numerical, or multiple categorical columns
-    if (len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1) or 
-        (len(df.columns) > 2 and len(cat_cols) > 0 and len(num_cols) > 0)):
+    if (len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1) or \
+       (len(df.columns) > 2 and len(cat_cols) > 0 and len(num_cols) > 0):
         return 'bar'
 
     # Check for Area Chart: 1 categorical + 1 numerical, or multiple numerical columns
-    if (len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1) or 
-        (len(df.columns) > 2 and len(num_cols) > 0)):
+    if (len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1) or \
+       (len(df.columns) > 2 and len(num_cols) > 0):
         return 'area'
 
     # Check for Dot Plot: 1 categorical + 1 numerical
@@ -132,8 +144,8 @@ def determine_chart_type(df):
     if len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1:
         return 'treemap'
 
-    # Check for Gauge Chart: 1 categorical + 1 numerical, with few rows (&lt;=5)
-    if len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1 and len(df) &lt;= 5:
+    # Check for Gauge Chart: 1 categorical + 1 numerical, with few rows (<=5)
+    if len(df.columns) == 2 and len(num_cols) == 1 and len(cat_cols) == 1 and len(df) <= 5:
         return 'gauge'
 
     # Default case
@@ -151,6 +163,9 @@ def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=N
     y_axis_label (str): The y-axis label.
     color_scale (str): The color scale for heatmaps.
     bin_size (int): The bin size for histograms.
+
+    Returns:
+    plotly.graph_objects.Figure: The chart, or None if no chart can be drawn.
     """
     if chart_type is None:
         st.write("No suitable chart type determined for this data.")
@@ -238,14 +253,30 @@ def generate_chart(df, chart_type, title=None, x_axis_label=None, y_axis_label=N
                          template="plotly_white")
     
     fig.update_layout(plot_bgcolor="rgba(0,0,0,0)")
-    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+def chart_for(df):
+    """The chart for a page of results, or None when no chart type suits it."""
+    chart_type = determine_chart_type(df)
+    return generate_chart(df, chart_type) if chart_type else None
+
+
+def answer_question(question):
+    """Generate, run and chart the SQL for a question; called only when the question changes."""
+    return generate_answer(question, model_name, database_path, prompt_template,
+                           lambda q: get_ollama_response(q, prompt_template), get_sql_query_from_response,
+                           lambda prompt, timeout: stream_generate(model_name, prompt, timeout=timeout),
+                           lambda sql: read_sql_query(sql, database_path), chart_for)
 
 st.set_page_config(page_title="SQL Query Retrieval App", layout="wide")
+warm_up(model_name)
+if USE_PREFIX_CONTEXT:
+    warm_prefix_context(model_name, prompt_template)
 
 st.markdown("""
-    &lt;h1 style="color: purple; text-align: center;">
+    <h1 style="color: purple; text-align: center;">
         📊 DataQuery Pro: Insights at Your Command 📊
-    &lt;/h1>
+    </h1>
     """, unsafe_allow_html=True)
 
 with st.container():
@@ -261,27 +292,32 @@ with st.container():
         submit = st.button("Retrieve Data", help="Click to submit your question.")
 
 if submit and question:
-    response = get_ollama_response(question, prompt_template)
-    st.write("Response:")
-    st.write(response)
-    sql_query = get_sql_query_from_response(response)
-    
-    if sql_query:
-        st.code(sql_query, language='sql')
-        df = read_sql_query(sql_query, database_path)
-        
-        if not df.empty:
+    answer_once(question, answer_question)
+
+result = last_result()
+if result:
+    if result['response'] is not None:
+        st.write("Response:")
+        st.write(result['response'])
+    if result['note']:
+        st.caption(result['note'])
+    if result['sql_query']:
+        st.code(result['sql_query'], language='sql')
+        df = result['df']
+
+        if result['parts']:
+            show_parts(result)
+        elif not df.empty:
             col_data, col_chart = st.columns(2)
             with col_data:
                 st.subheader("Query Results:")
-                st.dataframe(df)
-            chart_type = determine_chart_type(df)
-            
-            if chart_type:
+                st.dataframe(page_controls(result))
+
+            if result['fig'] is not None:
                 with col_chart:
                     st.subheader("Visualization:")
-                    generate_chart(df, chart_type)  
+                    st.plotly_chart(result['fig'], use_container_width=True)
         else:
             st.write("No results found for the given query.")
     else:
-        st.write("No valid SQL query could be extracted from the response.")
\ No newline at end of file
+        st.write("No valid SQL query could be extracted from the response.")
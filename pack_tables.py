@@ -0,0 +1,264 @@
+import argparse
+import sqlite3
+import time
+
+from db_pool import pooled_connection, time_query
+
+PACKS = ('A', 'B', 'C', 'D')
+
+# Long-format pack tables: one row per battery pack of each source row. Every metric maps
+# to its wide source column, with {pack} standing for A, B, C or D.
+PACK_TABLES = {
+    'charging_table': ('charging_pack', {
+        'KWh_Remain_start': '{pack}_KWh_Remain_start',
+        'KWh_Remain_End': '{pack}_KWh_Remain_End',
+        'Max_Cell_Temp': '{pack}_Max_Cell_Temp',
+        'Max_Cell_Volt': '{pack}_Max_Cell_Volt',
+        'Min_Cell_Volt': '{pack}_Min_Cell_Volt',
+    }),
+    'soh_table': ('soh_pack', {
+        'SOH_Value': '{pack}_SOH_Value',
+        'Total_KWH_Charged': 'Pack_{pack}_Total_KWH_Charged',
+        'Total_KWH_Discharged': 'Pack_{pack}_Total_KWH_Discharged',
+        'Avg_Charge_Temp': 'Avg_of_Pack_{pack}_Charge_Temp',
+        'Avg_Discharge_Temp': 'Avg_of_Pack_{pack}_Discharge_Temp',
+        'Median_Max_Charge_Temp': 'Median_of_Max_Pack_{pack}_Charge_Temp',
+        'Median_Max_Discharge_Temp': 'Median_of_Max_Pack_{pack}_Discharge_Temp',
+    }),
+}
+# Columns copied from the source row so most pack questions need no join.
+PACK_KEYS = ['vehicleId', 'vehicle_registration_number', 'unique_id', 'eventdate', 'monthId']
+
+# Prompt descriptions of the pack tables and their columns, in the templates' schema format.
+PACK_DESCRIPTIONS = {
+    'charging_pack': "One row per battery pack (A, B, C, D) of each charging_table session. Use it instead of the "
+                     "A_/B_/C_/D_ columns of charging_table for per-pack or per-category questions.",
+    'soh_pack': "One row per battery pack (A, B, C, D) of each soh_table record. Use it instead of the "
+                "A_/B_/C_/D_ and Pack_A..Pack_D columns of soh_table for per-pack questions.",
+}
+COLUMN_DESCRIPTIONS = {
+    'source_rowid': "rowid of the source row the pack row was taken from",
+    'pack': "Battery pack / category: 'A', 'B', 'C' or 'D'",
+    'vehicleId': "Unique identifier for the vehicle",
+    'vehicle_registration_number': "Registration number of the vehicle",
+    'unique_id': "Unique identifier of the source record",
+    'eventdate': "Date of the event logged in the system",
+    'monthId': "Identifier for the month of the event",
+    'KWh_Remain_start': "Energy remaining in the pack at the start (kWh)",
+    'KWh_Remain_End': "Energy remaining in the pack at the end (kWh)",
+    'Max_Cell_Temp': "Maximum cell temperature in the pack",
+    'Max_Cell_Volt': "Maximum cell voltage in the pack",
+    'Min_Cell_Volt': "Minimum cell voltage in the pack",
+    'SOH_Value': "State of Health (SOH) value of the pack",
+    'Total_KWH_Charged': "Total energy charged into the pack (kWh)",
+    'Total_KWH_Discharged': "Total energy discharged from the pack (kWh)",
+    'Avg_Charge_Temp': "Average charging temperature of the pack",
+    'Avg_Discharge_Temp': "Average discharging temperature of the pack",
+    'Median_Max_Charge_Temp': "Median of the maximum charging temperature of the pack",
+    'Median_Max_Discharge_Temp': "Median of the maximum discharging temperature of the pack",
+}
+PACK_EXAMPLES = {
+    'charging_pack': [
+        ("Find the maximum cell temperature for each pack category",
+         "SELECT pack, MAX(Max_Cell_Temp) AS max_cell_temp FROM charging_pack GROUP BY pack;"),
+        ("Find the average maximum cell voltage per pack for each vehicle",
+         "SELECT vehicleId, pack, AVG(Max_Cell_Volt) AS avg_max_cell_volt FROM charging_pack "
+         "GROUP BY vehicleId, pack;"),
+    ],
+    'soh_pack': [
+        ("Find the lowest state of health of each battery pack",
+         "SELECT pack, MIN(SOH_Value) AS min_soh FROM soh_pack GROUP BY pack;"),
+    ],
+}
+_EXAMPLES_HEADER = 'Example SQL Queries'
+
+
+def _table_columns(conn, table):
+    return [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+
+
+def _pack_layout(columns, metrics):
+    """Return (keys, {metric: {pack: source column}}) for the columns a source table has."""
+    present = set(columns)
+    keys = [key for key in PACK_KEYS if key in present]
+    layout = {}
+    for metric, template in metrics.items():
+        sources = {pack: template.format(pack=pack) for pack in PACKS}
+        sources = {pack: column for pack, column in sources.items() if column in present}
+        if sources:
+            layout[metric] = sources
+    return keys, layout
+
+
+def _pack_select(keys, layout, row):
+    """SELECT ... UNION ALL ... yielding the pack rows of one source row reference (a table or NEW)."""
+    rowid = 'rowid' if row is None else f"{row}.rowid"
+    prefix = '' if row is None else f"{row}."
+    selects = []
+    for pack in PACKS:
+        values = [rowid] + [f"{prefix}{key}" for key in keys] + [f"'{pack}'"]
+        values += [f"{prefix}{sources[pack]}" if pack in sources else 'NULL' for sources in layout.values()]
+        selects.append(f"SELECT {', '.join(values)}")
+    return selects
+
+
+def build_pack_tables(db_path, tables=None):
+    """
+    (Re)build the long-format pack tables of a database and return {pack table: rows}.
+
+    Each pack table holds source_rowid, the PACK_KEYS the source has, pack ('A'..'D') and
+    one column per metric. It is indexed on (vehicleId, pack) for per-vehicle questions,
+    on (pack, metric) for every metric, so a per-pack aggregate reads one covering index
+    instead of four times as many table rows, and on source_rowid. Triggers on the source
+    table replay every insert, update and delete, so the pack table stays in step with
+    it; rebuild after a VACUUM, which may renumber rowids.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        built = {}
+        for source, (name, metrics) in PACK_TABLES.items():
+            columns = _table_columns(conn, source)
+            if (tables and source not in tables) or not columns:
+                continue
+            keys, layout = _pack_layout(columns, metrics)
+            if not layout:
+                continue
+            drop_pack_tables(db_path, [source], conn)
+            target = ['source_rowid'] + keys + ['pack'] + list(layout)
+            conn.execute(f"CREATE TABLE {name} ({', '.join(target)})")
+            selects = _pack_select(keys, layout, None)
+            conn.execute(f"INSERT INTO {name} ({', '.join(target)}) "
+                         + ' UNION ALL '.join(f"{select} FROM {source}" for select in selects))
+            if 'vehicleId' in keys:
+                conn.execute(f"CREATE INDEX {name}_vehicle ON {name} (vehicleId, pack)")
+            for metric in layout:
+                conn.execute(f"CREATE INDEX {name}_{metric.lower()} ON {name} (pack, {metric})")
+            conn.execute(f"CREATE INDEX {name}_source ON {name} (source_rowid)")
+            insert = f"INSERT INTO {name} ({', '.join(target)}) " + ' UNION ALL '.join(_pack_select(keys, layout, 'NEW'))
+            conn.execute(f"CREATE TRIGGER {name}_insert AFTER INSERT ON {source} BEGIN {insert}; END")
+            conn.execute(f"CREATE TRIGGER {name}_delete AFTER DELETE ON {source} "
+                         f"BEGIN DELETE FROM {name} WHERE source_rowid = OLD.rowid; END")
+            conn.execute(f"CREATE TRIGGER {name}_update AFTER UPDATE ON {source} "
+                         f"BEGIN DELETE FROM {name} WHERE source_rowid = OLD.rowid; {insert}; END")
+            conn.commit()
+            built[name] = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+        return built
+    finally:
+        conn.close()
+
+
+def drop_pack_tables(db_path, tables=None, conn=None):
+    """Remove the pack tables (of the given source tables, default all) and their triggers."""
+    own = conn is None
+    conn = sqlite3.connect(db_path) if own else conn
+    try:
+        for source, (name, _) in PACK_TABLES.items():
+            if tables and source not in tables:
+                continue
+            for event in ('insert', 'update', 'delete'):
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}_{event}")
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+        conn.commit()
+    finally:
+        if own:
+            conn.close()
+
+
+def available_pack_tables(db_path):
+    """Return {pack table: [column, ...]} for the pack tables a database has."""
+    try:
+        with pooled_connection(db_path) as conn:
+            found = {name: _table_columns(conn, name) for name, _ in PACK_TABLES.values()}
+    except sqlite3.Error:
+        return {}
+    return {name: columns for name, columns in found.items() if columns}
+
+
+def pack_schema(tables):
+    """Schema blocks for the given {pack table: columns}, in the prompt templates' format."""
+    blocks = []
+    for name, columns in tables.items():
+        lines = [f"Table Name: {name}", PACK_DESCRIPTIONS[name], '', f"{'Columns Name':<36}Description"]
+        lines += [f"- {column:<35}{COLUMN_DESCRIPTIONS.get(column, '')}" for column in columns]
+        blocks.append('\n'.join(lines) + '\n\n')
+    return ''.join(blocks)
+
+
+def with_pack_tables(template, db_path):
+    """
+    Describe the database's pack tables in a prompt template: their schema goes at the end
+    of the schema section and their examples at the start of the example section. A
+    database without pack tables leaves the template unchanged.
+    """
+    tables = available_pack_tables(db_path)
+    header = template.find(_EXAMPLES_HEADER)
+    if not tables or header < 0:
+        return template
+    examples = ''.join(f"- {question}\n{sql}\n\n" for name in tables for question, sql in PACK_EXAMPLES[name])
+    body = template.index('\n', header) + 1
+    return template[:header] + pack_schema(tables) + template[header:body] + examples + template[body:]
+
+
+def benchmark(db_path, repeat=3, max_seconds=30.0):
+    """
+    Time per-pack questions answered from the wide columns (a UNION ALL per pack, as the
+    model writes them) and from the pack table. Returns a list of dicts with both
+    queries, their median seconds and whether they return the same rows.
+    """
+    pairs = [
+        ("SELECT 'A' AS pack, MAX(A_Max_Cell_Temp) AS max_cell_temp FROM charging_table UNION ALL "
+         "SELECT 'B', MAX(B_Max_Cell_Temp) FROM charging_table UNION ALL "
+         "SELECT 'C', MAX(C_Max_Cell_Temp) FROM charging_table UNION ALL "
+         "SELECT 'D', MAX(D_Max_Cell_Temp) FROM charging_table;",
+         "SELECT pack, MAX(Max_Cell_Temp) AS max_cell_temp FROM charging_pack GROUP BY pack;"),
+        ("SELECT 'A' AS pack, MIN(A_SOH_Value) AS min_soh FROM soh_table UNION ALL "
+         "SELECT 'B', MIN(B_SOH_Value) FROM soh_table UNION ALL "
+         "SELECT 'C', MIN(C_SOH_Value) FROM soh_table UNION ALL "
+         "SELECT 'D', MIN(D_SOH_Value) FROM soh_table;",
+         "SELECT pack, MIN(SOH_Value) AS min_soh FROM soh_pack GROUP BY pack;"),
+        ("SELECT pack, AVG(volt) AS avg_max_cell_volt FROM ("
+         "SELECT 'A' AS pack, A_Max_Cell_Volt AS volt FROM charging_table WHERE vehicleId = 7 UNION ALL "
+         "SELECT 'B', B_Max_Cell_Volt FROM charging_table WHERE vehicleId = 7 UNION ALL "
+         "SELECT 'C', C_Max_Cell_Volt FROM charging_table WHERE vehicleId = 7 UNION ALL "
+         "SELECT 'D', D_Max_Cell_Volt FROM charging_table WHERE vehicleId = 7) GROUP BY pack;",
+         "SELECT pack, AVG(Max_Cell_Volt) AS avg_max_cell_volt FROM charging_pack WHERE vehicleId = 7 GROUP BY pack;"),
+    ]
+    results = []
+    with pooled_connection(db_path) as conn:
+        for wide, long in pairs:
+            try:
+                same = sorted(conn.execute(wide).fetchall()) == sorted(conn.execute(long).fetchall())
+                timings = {sql: sorted(time_query(conn, sql, max_seconds) for _ in range(repeat))[repeat // 2]
+                           for sql in (wide, long)}
+            except sqlite3.Error as e:
+                results.append({'wide': wide, 'long': long, 'error': str(e)})
+                continue
+            results.append({'wide': wide, 'long': long, 'wide_seconds': timings[wide],
+                            'long_seconds': timings[long], 'same': same})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the long-format pack tables and benchmark per-pack questions.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--build', action='store_true', help="(re)build the pack tables first")
+    parser.add_argument('--drop', action='store_true', help="remove the pack tables and exit")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.0)
+    args = parser.parse_args()
+
+    if args.drop:
+        drop_pack_tables(args.db)
+        raise SystemExit
+    if args.build:
+        start = time.perf_counter()
+        for name, rows in build_pack_tables(args.db).items():
+            print(f"{name}: {rows:,} rows")
+        print(f"built in {time.perf_counter() - start:.1f}s")
+    for result in benchmark(args.db, args.repeat, args.max_seconds):
+        print(f"\n{result['long']}")
+        if 'error' in result:
+            print(f"  error: {result['error']}")
+            continue
+        print(f"  wide columns {result['wide_seconds'] * 1000:.1f}ms, pack table {result['long_seconds'] * 1000:.1f}ms, "
+              f"same rows: {'yes' if result['same'] else 'NO'}")
@@ -0,0 +1,234 @@
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from columnar import fetch_columnar
+from db_pool import QUERY_MAX_STEPS, QUERY_TIMEOUT, QueryBudgetExceeded, pooled_connection, query_budget
+from partitions import fetch_partitioned
+from result_cache import lookup_result, put_result, result_key
+from rollups import route_to_rollup
+from sql_rewrite import decorrelate_extrema
+
+PAGE_SIZE = 1000
+# Time allowed for an exact COUNT(*) before the estimate falls back to an upper bound.
+COUNT_TIMEOUT = 0.5
+KEYSET_COLUMN = 'nl2sql_rowid'
+_MIN_ROWID = -2 ** 63
+# Row estimates kept per query and database version (see result_cache.result_key).
+ESTIMATE_CACHE_SIZE = 512
+
+_estimates = OrderedDict()
+_estimates_lock = threading.Lock()
+
+_SIMPLE_SELECT_RE = re.compile(
+    r'^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+(?P<table>\w+)(?:\s+(?:AS\s+)?(?P<alias>(?!WHERE\b)\w+))?'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?\s*;?\s*$', re.IGNORECASE | re.DOTALL)
+_NOT_ROW_LEVEL_RE = re.compile(
+    r'\b(?:GROUP|ORDER|LIMIT|OFFSET|JOIN|UNION|INTERSECT|EXCEPT|HAVING|DISTINCT|OVER|WITH)\b'
+    r'|\b(?:COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT)\s*\(', re.IGNORECASE)
+_LIMIT_RE = re.compile(r'\s+LIMIT\s+(?P<limit>\d+)\s*;?\s*$', re.IGNORECASE)
+
+
+def split_limit(sql):
+    """Split a trailing LIMIT with a literal row count (and no OFFSET) off a query: (sql, count or None)."""
+    match = _LIMIT_RE.search(sql)
+    return (sql[:match.start()], int(match.group('limit'))) if match else (sql, None)
+
+
+def keyset_sql(sql):
+    """
+    Rewrite a plain single-table row-level SELECT to page on rowid, or return None.
+
+    The rewritten statement adds the rowid as KEYSET_COLUMN and takes (after, limit)
+    parameters, so every page is an index range scan however deep it is. A trailing
+    LIMIT n, such as the one result_guard adds, is dropped here and enforced by
+    fetch_page; without an ORDER BY any n rows are a valid answer, and these are the
+    first n by rowid. Keyset paging does not apply, and the query is re-run with skipping
+    instead, for ORDER BY (the order is not the rowid's), OFFSET or a computed LIMIT,
+    DISTINCT, GROUP BY and aggregates, joins, compound SELECTs, subqueries and CTEs,
+    and views or WITHOUT ROWID tables (detected when the rewrite fails to run).
+    """
+    sql, _ = split_limit(sql)
+    if len(re.findall(r'\bSELECT\b', sql, re.IGNORECASE)) != 1 or _NOT_ROW_LEVEL_RE.search(sql):
+        return None
+    match = _SIMPLE_SELECT_RE.match(sql)
+    if not match:
+        return None
+    alias = match.group('alias')
+    ref = alias or match.group('table')
+    where = f"({match.group('where')}) AND " if match.group('where') else ''
+    return (f"SELECT {match.group('columns')}, {ref}.rowid AS {KEYSET_COLUMN} "
+            f"FROM {match.group('table')}{' ' + alias if alias else ''} "
+            f"WHERE {where}{ref}.rowid > ? ORDER BY {ref}.rowid LIMIT ?")
+
+
+def executable_sql(sql, db_path):
+    """The form of a query actually run: correlated MAX/MIN subqueries decorrelated, aggregates routed to rollups."""
+    return route_to_rollup(decorrelate_extrema(sql), db_path)
+
+
+def _skip(cursor, count):
+    while count > 0:
+        skipped = len(cursor.fetchmany(min(count, PAGE_SIZE)))
+        if not skipped:
+            return
+        count -= skipped
+
+
+def _fetch_rows(sql, db_path, position, mode, page_size, timeout, max_steps):
+    """The page_size + 1 rows from position on, with KEYSET_COLUMN when they were read by rowid."""
+    start = position['start'] if position else 0
+    fetched = None
+    if mode == 'offset':
+        executable = executable_sql(sql, db_path)
+        fetched = fetch_columnar(executable, db_path, start, page_size + 1, timeout)
+        if fetched is None:
+            fetched = fetch_partitioned(executable, db_path, start, page_size + 1, timeout, max_steps)
+    if fetched is not None:
+        rows, labels = fetched
+    else:
+        with pooled_connection(db_path) as conn, query_budget(conn, timeout, max_steps) as budget:
+            cursor = None
+            if mode == 'keyset':
+                after = position['after'] if position else _MIN_ROWID
+                limit = split_limit(sql)[1]
+                wanted = page_size + 1 if limit is None else max(0, min(page_size + 1, limit - start))
+                try:
+                    cursor = conn.execute(keyset_sql(sql), (after, wanted))
+                except sqlite3.OperationalError:
+                    # Views and WITHOUT ROWID tables have no rowid to page on.
+                    if budget['exceeded'] or position:
+                        raise
+                    mode = 'offset'
+            if cursor is None:
+                cursor = conn.execute(executable_sql(sql, db_path))
+                _skip(cursor, start)
+            try:
+                rows = cursor.fetchmany(page_size + 1)
+                labels = [column[0] for column in cursor.description]
+            finally:
+                cursor.close()
+    return pd.DataFrame.from_records(rows, columns=labels)
+
+
+def fetch_page(sql, db_path, position=None, page_size=PAGE_SIZE, timeout=QUERY_TIMEOUT, max_steps=QUERY_MAX_STEPS):
+    """
+    Fetch one page of a query's result without materialising the rest.
+
+    position is None for the first page or the 'next' value of the previous page.
+    Row-level single-table queries, with or without a LIMIT, page by rowid (keyset, see
+    keyset_sql); anything else is re-run and the earlier rows skipped with fetchmany, so
+    memory stays at one page either way.
+    The query runs in its executable_sql form, on the columnar mirror when that is
+    enabled and accepts the query (see columnar.fetch_columnar), else on the month
+    partitions its predicates select when those are enabled (see partitions.fetch_partitioned).
+    Each page goes through the result cache, keyed on the query, database version and
+    position, so paging back and forth or asking again reads it from memory or disk.
+    Returns {'df', 'start', 'next'} where next is None on the last page.
+    """
+    start = position['start'] if position else 0
+    mode = position['mode'] if position else ('keyset' if keyset_sql(sql) else 'offset')
+    after = position.get('after') if position else None
+    extra = [KEYSET_COLUMN] if mode == 'keyset' else []
+    key, df = lookup_result(sql, db_path, page=f"{mode}:{after}:{start}:{page_size}", extra_labels=extra)
+    if df is None:
+        df = _fetch_rows(sql, db_path, position, mode, page_size, timeout, max_steps)
+        put_result(key, df.copy(), sql, db_path)
+    # A keyset first page falls back to offset paging on tables without a rowid.
+    mode = 'keyset' if KEYSET_COLUMN in df.columns else 'offset'
+    has_more = len(df) > page_size
+    df = df.iloc[:page_size].reset_index(drop=True)
+    following = None
+    if mode == 'keyset':
+        if has_more:
+            following = {'mode': mode, 'after': int(df[KEYSET_COLUMN].iloc[-1]), 'start': start + len(df)}
+        df = df.drop(columns=KEYSET_COLUMN)
+    elif has_more:
+        following = {'mode': mode, 'start': start + len(df)}
+    return {'df': df, 'start': start, 'next': following}
+
+
+def remember_estimate(sql, db_path, rows, exact):
+    """Record a query's (rows, exact) estimate for the current version of the database."""
+    key = result_key(sql, db_path)
+    with _estimates_lock:
+        _estimates[key] = (rows, exact)
+        _estimates.move_to_end(key)
+        while len(_estimates) > ESTIMATE_CACHE_SIZE:
+            _estimates.popitem(last=False)
+
+
+def estimate_rows(sql, db_path, timeout=COUNT_TIMEOUT):
+    """
+    Return (rows, exact) for a query's result size: an exact COUNT(*) if it finishes
+    within timeout, else the table's max(rowid) as an upper bound for row-level queries,
+    else (None, False). Estimates are remembered until the database changes, so a query
+    is counted once however many times it is guarded and paged.
+    """
+    with _estimates_lock:
+        estimate = _estimates.get(result_key(sql, db_path))
+    if estimate is None:
+        estimate = _count_rows(sql, db_path, timeout)
+        remember_estimate(sql, db_path, *estimate)
+    return estimate
+
+
+def _count_rows(sql, db_path, timeout):
+    try:
+        try:
+            counted = f"SELECT COUNT(*) FROM ({executable_sql(sql, db_path).strip().rstrip(';')})"
+            fetched = fetch_columnar(counted, db_path, 0, 1, timeout)
+            if fetched is not None:
+                return fetched[0][0][0], True
+            with pooled_connection(db_path) as conn, query_budget(conn, timeout, 0):
+                return conn.execute(counted).fetchone()[0], True
+        except QueryBudgetExceeded:
+            pass
+        unlimited, limit = split_limit(sql)
+        match = _SIMPLE_SELECT_RE.match(unlimited) if keyset_sql(sql) else None
+        if match:
+            with pooled_connection(db_path) as conn:
+                bound = conn.execute(f"SELECT MAX(rowid) FROM {match.group('table')}").fetchone()[0] or 0
+            return (bound if limit is None else min(bound, limit)), False
+    except sqlite3.Error:
+        pass
+    return None, False
+
+
+def first_page(sql, db_path, page_size=PAGE_SIZE):
+    """
+    Return the first page of a query as a page dict: sql, db_path, page_size, df, start,
+    next, and the result size as rows/exact. Results that fit in one page are counted
+    exactly; longer ones get a row-count estimate instead.
+    """
+    page = fetch_page(sql, db_path, None, page_size)
+    if page['next'] is None:
+        rows, exact = len(page['df']), True
+    else:
+        rows, exact = estimate_rows(sql, db_path)
+    return dict(page, sql=sql, db_path=db_path, page_size=page_size, rows=rows, exact=exact)
+
+
+def next_page(page):
+    """Return the page after the given one, keeping its query and row estimate."""
+    following = fetch_page(page['sql'], page['db_path'], page['next'], page['page_size'])
+    return dict(page, **following)
+
+
+def empty_page(sql, db_path, page_size=PAGE_SIZE):
+    """Page dict standing in for a query that failed."""
+    return {'df': pd.DataFrame(), 'start': 0, 'next': None, 'sql': sql, 'db_path': db_path,
+            'page_size': page_size, 'rows': 0, 'exact': True}
+
+
+def describe_page(page):
+    """Human-readable row range of a page, e.g. "Rows 1,001-2,000 of at most 1,234,567"."""
+    end = page['start'] + len(page['df'])
+    if page['rows'] is None:
+        total = f"more than {end:,}" if page['next'] else f"{end:,}"
+    else:
+        total = f"{page['rows']:,}" if page['exact'] else f"at most {page['rows']:,}"
+    return f"Rows {page['start'] + 1:,}-{end:,} of {total}"
@@ -0,0 +1,169 @@
+import argparse
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from db_pool import POOL_SIZE, QueryBudgetExceeded, get_pool, pooled_connection
+from paged_query import executable_sql, first_page, next_page
+from result_guard import ROW_LIMIT, guard_sql
+from sql_validation import validate_sql
+
+# Independent statements run at the same time, each on its own pooled read-only connection;
+# sqlite3 releases the GIL while a statement steps, so they overlap on separate cores.
+MAX_WORKERS = POOL_SIZE
+# Results are combined only when each is complete within this many rows; merging partial
+# results would show gaps (NaN) that are not in the data.
+MERGE_ROW_LIMIT = ROW_LIMIT
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='nl2sql-query')
+        return _executor
+
+
+def _complete(page, limit=MERGE_ROW_LIMIT):
+    """Read the rest of a paged result; the whole DataFrame, or None past limit rows."""
+    frames, rows = [page['df']], len(page['df'])
+    while page['next'] is not None and rows <= limit:
+        page = next_page(page)
+        frames.append(page['df'])
+        rows += len(page['df'])
+    if rows > limit:
+        return None
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def _run_one(sql, db_path):
+    start = time.perf_counter()
+    outcome = {'sql': sql, 'page': None, 'df': None, 'error': validate_sql(sql, db_path), 'limit': None}
+    if outcome['error'] is None:
+        try:
+            run_sql, outcome['limit'] = guard_sql(sql, db_path)
+            outcome['page'] = first_page(run_sql, db_path)
+        except (QueryBudgetExceeded, sqlite3.Error) as e:
+            outcome['error'] = str(e)
+    if outcome['page'] is not None and outcome['limit'] is None:
+        try:
+            outcome['df'] = _complete(outcome['page'])
+        except (QueryBudgetExceeded, sqlite3.Error):
+            pass
+    outcome['seconds'] = time.perf_counter() - start
+    return outcome
+
+
+def run_parallel(statements, db_path):
+    """
+    Validate and run independent statements concurrently and return one outcome per
+    statement, in order: {'sql', 'page' (paged_query first page or None), 'df' (the
+    whole result, None when it has more than MERGE_ROW_LIMIT rows or was capped by
+    guard_sql), 'error', 'limit', 'seconds'}. A failing statement does not stop the others.
+    """
+    futures = [_get_executor().submit(_run_one, sql, db_path) for sql in statements]
+    return [future.result() for future in futures]
+
+
+def merge_frames(frames):
+    """
+    Combine the results of several statements into one DataFrame.
+
+    Single-row results (KPIs) are placed side by side; results that all start with the
+    same column (e.g. vehicleId) are outer-joined on it; anything else is stacked with a
+    'query' column saying which statement each row came from.
+    """
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    if all(len(df) == 1 for df in frames):
+        return pd.concat([df.reset_index(drop=True) for df in frames], axis=1)
+    key = frames[0].columns[0] if len(frames[0].columns) else None
+    if key is not None and all(len(df.columns) > 1 and df.columns[0] == key and df.columns.is_unique
+                               for df in frames):
+        merged = frames[0]
+        for n, df in enumerate(frames[1:], start=2):
+            merged = merged.merge(df, on=key, how='outer', suffixes=('', f'_{n}'))
+        return merged
+    return pd.concat(frames, keys=range(1, len(frames) + 1), names=['query', None]).reset_index(level=0)
+
+
+def answer_statements(statements, db_path):
+    """
+    Run several statements in parallel and merge them into one result.
+
+    Returns {'df', 'merged', 'results', 'note', 'error'}: the merged complete results,
+    whether they could be merged, the per-statement outcomes, a note with the timings
+    and the errors of failed statements (or None). When a result has more than
+    MERGE_ROW_LIMIT rows nothing is merged: df is empty, and the outcomes' pages are
+    meant to be shown one by one, which the note explains.
+    """
+    start = time.perf_counter()
+    results = run_parallel(statements, db_path)
+    elapsed = time.perf_counter() - start
+    ran = [(n, outcome) for n, outcome in enumerate(results, start=1) if outcome['page'] is not None]
+    too_large = [n for n, outcome in ran if outcome['df'] is None]
+    timings = ', '.join(f"{outcome['seconds']:.2f}s" for outcome in results)
+    note = f"Ran {len(results)} queries in parallel in {elapsed:.2f}s ({timings})."
+    if too_large:
+        df = pd.DataFrame()
+        note += (f" The results are shown one by one: query {', '.join(map(str, too_large))} returns more than "
+                 f"{MERGE_ROW_LIMIT:,} rows, and combining part of a result would show gaps that are not in the data.")
+    else:
+        df = merge_frames([outcome['df'] for _, outcome in ran])
+    errors = [f"Query {n}: {outcome['error']}" for n, outcome in enumerate(results, start=1) if outcome['error']]
+    return {'df': df, 'merged': not too_large, 'results': results, 'note': note, 'error': '; '.join(errors) or None}
+
+
+def benchmark(db_path, statements, repeat=3):
+    """
+    Time the statements one after another on one connection and concurrently on pooled
+    connections. Returns (serial seconds, parallel seconds, per-statement seconds).
+    """
+    statements = [executable_sql(sql, db_path) for sql in statements]
+
+    def run(sql):
+        start = time.perf_counter()
+        with pooled_connection(db_path) as conn:
+            conn.execute(sql).fetchall()
+        return time.perf_counter() - start
+
+    for sql in statements:
+        run(sql)
+    serial, parallel, each = [], [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        each = [run(sql) for sql in statements]
+        serial.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        list(_get_executor().map(run, statements))
+        parallel.append(time.perf_counter() - start)
+    get_pool(db_path).close()
+    return sorted(serial)[repeat // 2], sorted(parallel)[repeat // 2], each
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare running independent queries serially and in parallel.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('sql', nargs='*', help="statements to run (default: per-vehicle discharge, charge and distance totals)")
+    args = parser.parse_args()
+
+    statements = args.sql or [
+        "SELECT vehicleId, SUM(NetkWh) AS total_energy_discharged FROM discharge_table GROUP BY vehicleId;",
+        "SELECT vehicleId, SUM(kwhCharged) AS total_energy_charged FROM charging_table GROUP BY vehicleId;",
+        "SELECT vehicleId, SUM(distanceInKM) AS total_distance FROM energy_data GROUP BY vehicleId;",
+        "SELECT vehicleId, AVG(chargeDurationInMin) AS avg_charge_duration FROM charging_table GROUP BY vehicleId;",
+    ]
+    serial, parallel, each = benchmark(args.db, statements, args.repeat)
+    for sql, seconds in zip(statements, each):
+        print(f"{seconds * 1000:>8.1f}ms  {' '.join(sql.split())[:90]}")
+    print(f"serial {serial * 1000:.1f}ms, parallel {parallel * 1000:.1f}ms ({serial / parallel:.1f}x)")
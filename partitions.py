@@ -0,0 +1,660 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import quote
+
+from db_pool import (QUERY_MAX_STEPS, QUERY_TIMEOUT, QueryBudgetExceeded, database_version, open_read_only,
+                     pooled_connection, query_budget, time_query)
+
+# Optional partitioned layout: the month-bounded fact tables are also stored as one SQLite
+# file per month (or quarter) under PARTITION_DIR. A query whose monthId/eventdate
+# predicates bound it to some periods reads only their files, attached to a read-only
+# connection behind a UNION ALL view that shadows the full table. The database stays the
+# source of truth; the partitions are built explicitly (python partitions.py --build) and
+# only used while the database is unchanged since the build.
+PARTITIONED = os.environ.get('NL2SQL_PARTITIONED', '0') == '1'
+PARTITION_DIR = os.environ.get('NL2SQL_PARTITION_DIR', 'nl2sql_partitions')
+PARTITION_GRAIN = os.environ.get('NL2SQL_PARTITION_GRAIN', 'month')
+GRAINS = ('month', 'quarter')
+PARTITION_TABLES = ['energy_data', 'discharge_table', 'charging_table']
+# The newest periods still receive rows. Older ones are sealed: compacted once, reused by
+# every later build while their rows are unchanged and attached as immutable, so SQLite
+# skips locking and change detection on them and the OS keeps their pages cached.
+OPEN_PERIODS = int(os.environ.get('NL2SQL_PARTITION_OPEN', '2'))
+MANIFEST = 'manifest.json'
+
+_TOKEN_RE = re.compile(
+    r"""\s+|'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\w+"""
+    r"""|<=|>=|<>|!=|==|\|\||\S""")
+_CREATE_TABLE_RE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)',
+                              re.IGNORECASE)
+_CREATE_INDEX_RE = re.compile(r'^(\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?)', re.IGNORECASE)
+# Words that end the WHERE clause or cannot be a table alias.
+_CLAUSE_END = {'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'WINDOW', ';'}
+_NOT_ALIAS = _CLAUSE_END | {'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'NATURAL', 'OUTER', 'ON',
+                            'USING', ',', ')', 'INDEXED', 'NOT'}
+_COMPARISONS = {'=', '==', '<', '<=', '>', '>='}
+# The partition views have no rowid of their own, so these would read NULL.
+_ROWID_NAMES = {'rowid', '_rowid_', 'oid'}
+
+logger = logging.getLogger(__name__)
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def partition_dir(db_path, directory=PARTITION_DIR):
+    """Directory of the partitions of a database."""
+    return os.path.join(directory, hashlib.sha1(os.path.abspath(db_path).encode('utf-8')).hexdigest()[:16])
+
+
+def period_of(month, grain=PARTITION_GRAIN):
+    """The partition a monthId (YYYYMM) belongs to, e.g. '2024-03' or '2024-Q1'."""
+    year, number = divmod(month, 100)
+    return f"{year}-{number:02d}" if grain == 'month' else f"{year}-Q{(number - 1) // 3 + 1}"
+
+
+def _period_months(period):
+    year, part = period.split('-')
+    if part.startswith('Q'):
+        first = (int(part[1:]) - 1) * 3 + 1
+        return int(year) * 100 + first, int(year) * 100 + first + 2
+    return int(year) * 100 + int(part), int(year) * 100 + int(part)
+
+
+def _read_manifest(target):
+    try:
+        with open(os.path.join(target, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _partitionable(conn, table):
+    """Whether every monthId of table is an integer YYYYMM, so the periods cover its rows exactly."""
+    columns = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({table})")}
+    if 'monthid' not in columns:
+        return False
+    bad = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE monthId IS NOT NULL AND (typeof(monthId) != 'integer' "
+                       f"OR monthId % 100 NOT BETWEEN 1 AND 12)").fetchone()[0]
+    if bad:
+        logger.warning("%s has %d rows whose monthId is not an integer YYYYMM; not partitioning it.", table, bad)
+    return not bad
+
+
+def _aligned(conn, table):
+    """Whether monthId always matches eventdate, so eventdate predicates can prune too."""
+    columns = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({table})")}
+    if 'eventdate' not in columns:
+        return False
+    return not conn.execute(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE eventdate IS NOT NULL AND monthId IS NOT "
+                            f"CAST(strftime('%Y%m', eventdate) AS INTEGER))").fetchone()[0]
+
+
+def _build_partition(conn, path, first, last, tables):
+    """Copy the rows of months first..last of tables, with their indexes, into a new file at path."""
+    building = path + '.building'
+    if os.path.exists(building):
+        os.remove(building)
+    rows = {}
+    conn.execute("ATTACH ? AS part", (building,))
+    try:
+        for table in tables:
+            create = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+            conn.execute(_CREATE_TABLE_RE.sub(f"CREATE TABLE part.{table}", create, count=1))
+            rows[table] = conn.execute(f"INSERT INTO part.{table} SELECT * FROM main.{table} "
+                                       f"WHERE monthId BETWEEN ? AND ?", (first, last)).rowcount
+            indexes = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                   "AND sql IS NOT NULL", (table,)).fetchall()
+            for (index,) in indexes:
+                conn.execute(_CREATE_INDEX_RE.sub(r'\1part.', index, count=1))
+        conn.commit()
+        conn.execute("ANALYZE part")
+        conn.commit()
+    finally:
+        conn.execute("DETACH part")
+    os.replace(building, path)
+    return rows
+
+
+def compact_partition(path):
+    """Rewrite a partition file without free pages and with its pages in order, before it is sealed."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def build_partitions(db_path, grain=PARTITION_GRAIN, open_periods=OPEN_PERIODS, directory=PARTITION_DIR,
+                     tables=PARTITION_TABLES):
+    """
+    Bring the partitions of a database up to date and return (manifest, rebuilt periods).
+
+    A partition whose rows are unchanged since the last build (same count and highest
+    rowid per table, which is what appending with ingest.py changes) is kept as it is;
+    the others are rebuilt. All but the newest open_periods periods are sealed, and a
+    partition is compacted when it becomes sealed. Rows without a monthId belong to no
+    partition, which is fine since no pruned query can match them.
+    """
+    if grain not in GRAINS:
+        raise ValueError(f"grain must be one of {', '.join(GRAINS)}, not {grain!r}.")
+    target = partition_dir(db_path, directory)
+    os.makedirs(target, exist_ok=True)
+    previous = _read_manifest(target)
+    if previous is not None and previous['grain'] != grain:
+        previous = None
+    old_partitions = previous['partitions'] if previous else {}
+    version = database_version(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        tables = [table for table in tables if table in present and _partitionable(conn, table)]
+        signatures = {}
+        for table in tables:
+            for month, count, last in conn.execute(f"SELECT monthId, COUNT(*), MAX(rowid) FROM {table} "
+                                                   f"WHERE monthId IS NOT NULL GROUP BY monthId"):
+                signature = signatures.setdefault(period_of(month, grain), {}).setdefault(table, [0, 0])
+                signature[0] += count
+                signature[1] = max(signature[1], last)
+        periods = sorted(signatures)
+        sealed = set(periods[:-open_periods] if open_periods else periods)
+        partitions, rebuilt = {}, []
+        for period in periods:
+            first, last = _period_months(period)
+            path = os.path.join(target, f"{period}.db")
+            old = old_partitions.get(period)
+            if old and old['signature'] == signatures[period] and sorted(old['rows']) == sorted(tables) \
+                    and os.path.exists(path):
+                info = dict(old)
+            else:
+                if old and old['sealed']:
+                    logger.warning("Rows of sealed partition %s changed; rebuilding it.", period)
+                rows = _build_partition(conn, path, first, last, tables)
+                info = {'file': os.path.basename(path), 'first_month': first, 'last_month': last, 'rows': rows,
+                        'signature': signatures[period], 'sealed': False}
+                rebuilt.append(period)
+            if period in sealed and not info['sealed']:
+                compact_partition(path)
+                info['sealed'] = True
+            partitions[period] = info
+        manifest = {'db_path': os.path.abspath(db_path), 'version': version, 'grain': grain,
+                    'tables': {table: {'columns': [row[1] for row in conn.execute(f"PRAGMA table_info({table})")],
+                                       'eventdate_aligned': _aligned(conn, table)} for table in tables},
+                    'partitions': partitions}
+    finally:
+        conn.close()
+    for name in os.listdir(target):
+        if name.endswith('.db') and name[:-3] not in partitions:
+            os.remove(os.path.join(target, name))
+    with open(os.path.join(target, MANIFEST + '.building'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(os.path.join(target, MANIFEST + '.building'), os.path.join(target, MANIFEST))
+    return manifest, rebuilt
+
+
+def drop_partitions(db_path, directory=PARTITION_DIR):
+    """Remove the partitions of a database."""
+    target = partition_dir(db_path, directory)
+    if os.path.isdir(target):
+        for name in os.listdir(target):
+            os.remove(os.path.join(target, name))
+        os.rmdir(target)
+
+
+def current_manifest(db_path, directory=PARTITION_DIR):
+    """The manifest of a database's partitions, or None when there are none of its current version."""
+    path = os.path.join(partition_dir(db_path, directory), MANIFEST)
+    try:
+        stamp = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _manifests_lock:
+        cached = _manifests.get(path)
+        if cached is None or cached[0] != stamp:
+            with open(path, encoding='utf-8') as f:
+                cached = _manifests[path] = (stamp, json.load(f))
+    manifest = cached[1]
+    return manifest if manifest['version'] == database_version(db_path) else None
+
+
+def _name(token):
+    return token[1:-1] if token[:1] in '"`[' else token
+
+
+def _literal(token):
+    """The value of a number or string literal token, else None."""
+    if token[:1] == "'":
+        return token[1:-1].replace("''", "'")
+    if token[:1].isdigit():
+        return float(token) if '.' in token or 'e' in token.lower() else int(token)
+    return None
+
+
+def _month_value(value):
+    """
+    A numeric monthId literal as YYYYMM, or None. String literals are not used: the
+    columns have no declared type, so SQLite orders every integer before every text value
+    and monthId < '202403' holds for all rows.
+    """
+    if isinstance(value, int) and 1 <= value % 100 <= 12 and 100000 <= value <= 999999:
+        return value
+    return None
+
+
+def _date_month(value):
+    """The month (YYYYMM) of a 'YYYY-MM...' date literal, or None."""
+    if isinstance(value, str) and re.match(r'^\d{4}-\d{2}(?:$|-)', value) and 1 <= int(value[5:7]) <= 12:
+        return int(value[:4]) * 100 + int(value[5:7])
+    return None
+
+
+def _split_and(tokens):
+    """
+    Split a WHERE clause into its AND-ed conjuncts, descending into fully parenthesised
+    ones. A clause with a top-level OR stays whole, since AND binds tighter than OR.
+    """
+    conjuncts, current, depth, between = [], [], 0, False
+    for token in tokens:
+        upper = token.upper()
+        if token == '(' or upper == 'CASE':
+            depth += 1
+        elif token == ')' or upper == 'END':
+            depth -= 1
+        elif depth == 0 and upper == 'OR':
+            return [tokens]
+        elif depth == 0 and upper == 'BETWEEN':
+            between = True
+        elif depth == 0 and upper == 'AND':
+            if between:
+                between = False
+            else:
+                conjuncts.append(current)
+                current = []
+                continue
+        current.append(token)
+    conjuncts.append(current)
+    result = []
+    for conjunct in conjuncts:
+        if len(conjunct) > 2 and conjunct[0] == '(' and conjunct[-1] == ')' and _wrapped(conjunct):
+            result.extend(_split_and(conjunct[1:-1]))
+        else:
+            result.append(conjunct)
+    return result
+
+
+def _wrapped(tokens):
+    depth = 0
+    for n, token in enumerate(tokens):
+        depth += token == '('
+        depth -= token == ')'
+        if depth == 0 and n < len(tokens) - 1:
+            return False
+    return True
+
+
+def _column(tokens, names):
+    """
+    Match a partitioning column at the start of tokens: monthId, eventdate, or
+    strftime('%Y-%m' or '%Y', eventdate), optionally qualified by one of names.
+    Returns (kind, tokens used) with kind 'month', 'date', 'year_month' or 'year', or None.
+    """
+    if len(tokens) >= 6 and tokens[0].lower() == 'strftime' and tokens[1] == '(' and tokens[3] == ',':
+        inner = _column(tokens[4:], names)
+        fmt = _literal(tokens[2])
+        if inner and inner[0] == 'date' and len(tokens) > 4 + inner[1] and tokens[4 + inner[1]] == ')' \
+                and fmt in ('%Y-%m', '%Y'):
+            return ('year_month' if fmt == '%Y-%m' else 'year'), 5 + inner[1]
+        return None
+    if len(tokens) >= 3 and tokens[1] == '.':
+        if _name(tokens[0]).lower() not in names:
+            return None
+        column, used = _name(tokens[2]).lower(), 3
+    elif tokens:
+        column, used = _name(tokens[0]).lower(), 1
+    else:
+        return None
+    if column == 'monthid':
+        return 'month', used
+    if column == 'eventdate':
+        return 'date', used
+    return None
+
+
+def _bounds(kind, value):
+    """The month range (lo, hi) a value of a partitioning column falls in, or None."""
+    if kind == 'month':
+        month = _month_value(value)
+        return (month, month) if month else None
+    if kind == 'year':
+        if isinstance(value, str) and re.fullmatch(r'\d{4}', value):
+            return int(value) * 100 + 1, int(value) * 100 + 12
+        return None
+    month = _date_month(value)
+    if month and (kind == 'date' or re.fullmatch(r'\d{4}-\d{2}', value)):
+        return month, month
+    return None
+
+
+def _conjunct_months(conjunct, names, aligned):
+    """
+    The months (lo, hi, set or None) a conjunct restricts rows to, or None when it is not
+    a predicate on a partitioning column against literals. Date ranges are widened to
+    whole months, so a pruned query never loses rows.
+    """
+    matched = _column(conjunct, names)
+    if matched is None:
+        return None
+    kind, used = matched
+    if kind != 'month' and not aligned:
+        return None
+    rest = conjunct[used:]
+    if len(rest) == 2 and rest[0] in _COMPARISONS:
+        bounds = _bounds(kind, _literal(rest[1]))
+        if bounds is None:
+            return None
+        lo, hi = bounds
+        operator = rest[0]
+        if operator in ('=', '=='):
+            return lo, hi, None
+        if operator in ('>', '>='):
+            return lo, None, None
+        return None, hi, None
+    if len(rest) == 4 and rest[0].upper() == 'BETWEEN' and rest[2].upper() == 'AND':
+        low, high = _bounds(kind, _literal(rest[1])), _bounds(kind, _literal(rest[3]))
+        if low is None or high is None:
+            return None
+        return low[0], high[1], None
+    if len(rest) >= 4 and rest[0].upper() == 'IN' and rest[1] == '(' and rest[-1] == ')':
+        values = rest[2:-1]
+        if values[1::2] != [','] * (len(values) // 2) or len(values) % 2 == 0:
+            return None
+        months = set()
+        for token in values[0::2]:
+            bounds = _bounds(kind, _literal(token))
+            if bounds is None:
+                return None
+            months.update(range(bounds[0], bounds[1] + 1))
+        return min(months), max(months), months
+    if len(rest) == 2 and rest[0].upper() == 'LIKE' and kind in ('date', 'year_month'):
+        pattern = _literal(rest[1])
+        if not isinstance(pattern, str):
+            return None
+        prefix = re.match(r'^(\d{4})(?:-(\d{2}))?', pattern)
+        if prefix is None or pattern[prefix.end():prefix.end() + 1] not in ('', '-', '%'):
+            return None
+        bounds = _bounds('year_month', prefix.group(0)) if prefix.group(2) else _bounds('year', prefix.group(1))
+        return (bounds[0], bounds[1], None) if bounds else None
+    return None
+
+
+def _view_columns(tokens, columns):
+    """
+    The columns of a table a query uses, in table order: all of them for a star
+    projection, else those named in it (at least one). SQLite materialises every column
+    of a UNION ALL view, so leaving out the unused ones saves most of its work.
+    """
+    for n, token in enumerate(tokens):
+        if token == '*' and n and tokens[n - 1].upper() in ('SELECT', ',', '.', 'DISTINCT', 'ALL'):
+            return columns
+    named = {_name(token).lower() for token in tokens}
+    return [column for column in columns if column.lower() in named] or columns[:1]
+
+
+def partition_plan(sql, manifest):
+    """
+    Return (table, periods, columns) when sql reads one partitioned table and its WHERE
+    clause bounds it to some of the periods, else None (the query runs on the full tables).
+
+    Only single-level SELECTs are pruned, and only on AND-ed predicates comparing monthId
+    or eventdate (or strftime('%Y-%m'/'%Y', eventdate)) with literals: =, <, <=, >, >=,
+    BETWEEN, IN and LIKE 'YYYY-MM%'. monthId is only compared with numbers and eventdate
+    with strings. Every other predicate only narrows the rows further, so it is left to SQLite. Queries naming rowid (or _rowid_, oid) are not pruned.
+    """
+    tokens = [token for token in _TOKEN_RE.findall(sql) if not token.isspace()]
+    uppers = [token.upper() for token in tokens]
+    if uppers.count('SELECT') != 1 or any(_name(token).lower() in _ROWID_NAMES for token in tokens):
+        return None
+    tables = manifest['tables']
+    references = [n for n, token in enumerate(tokens) if _name(token).lower() in tables
+                  and (n == 0 or tokens[n - 1] != '.') and (n + 1 == len(tokens) or tokens[n + 1] != '.')]
+    if len(references) != 1:
+        return None
+    at = references[0]
+    table = _name(tokens[at]).lower()
+    names = {table}
+    following = uppers[at + 1:at + 3]
+    if following[:1] == ['AS'] and len(following) > 1:
+        names.add(_name(tokens[at + 2]).lower())
+    elif following and following[0] not in _NOT_ALIAS and re.fullmatch(r'\w+|"[^"]+"|`[^`]+`|\[[^\]]+\]', tokens[at + 1]):
+        names.add(_name(tokens[at + 1]).lower())
+    depth, where = 0, None
+    for n, token in enumerate(tokens):
+        depth += (token == '(') - (token == ')')
+        if depth == 0 and uppers[n] == 'WHERE':
+            where = n + 1
+        elif depth == 0 and where is not None and uppers[n] in _CLAUSE_END:
+            clause = tokens[where:n]
+            break
+    else:
+        clause = tokens[where:] if where is not None else []
+    lo = hi = months = None
+    for conjunct in _split_and(clause):
+        bounds = _conjunct_months(conjunct, names, tables[table]['eventdate_aligned'])
+        if bounds is None:
+            continue
+        if bounds[0] is not None:
+            lo = bounds[0] if lo is None else max(lo, bounds[0])
+        if bounds[1] is not None:
+            hi = bounds[1] if hi is None else min(hi, bounds[1])
+        if bounds[2] is not None:
+            months = bounds[2] if months is None else months & bounds[2]
+    if lo is None and hi is None:
+        return None
+    periods = [period for period, info in sorted(manifest['partitions'].items())
+               if (lo is None or info['last_month'] >= lo) and (hi is None or info['first_month'] <= hi)
+               and (months is None or any(info['first_month'] <= month <= info['last_month'] for month in months))]
+    if len(periods) == len(manifest['partitions']):
+        return None
+    return table, periods, _view_columns(tokens, tables[table]['columns'])
+
+
+def open_partitioned(db_path, manifest, table, periods, columns, directory=PARTITION_DIR):
+    """
+    Open a read-only connection to a database on which table is a UNION ALL view of
+    columns of the given partitions, or return None when there are more than SQLite can
+    attach.
+    """
+    conn = open_read_only(db_path)
+    if len(periods) > conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        conn.close()
+        return None
+    target = partition_dir(db_path, directory)
+    try:
+        # The TEMP view is the only write; it shadows main.<table> for this connection.
+        conn.execute("PRAGMA query_only=OFF")
+        arms = []
+        selected = ', '.join(f'"{column}"' for column in columns)
+        for n, period in enumerate(periods):
+            info = manifest['partitions'][period]
+            uri = f"file:{quote(os.path.abspath(os.path.join(target, info['file'])))}?mode=ro"
+            conn.execute(f"ATTACH ? AS part{n}", (uri + ('&immutable=1' if info['sealed'] else ''),))
+            arms.append(f"SELECT {selected} FROM part{n}.{table}")
+        empty = f"SELECT {selected} FROM main.{table} WHERE 0"
+        conn.execute(f"CREATE TEMP VIEW {table} AS {' UNION ALL '.join(arms) or empty}")
+        conn.execute("PRAGMA query_only=ON")
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def fetch_partitioned(sql, db_path, start, count, timeout=QUERY_TIMEOUT, max_steps=QUERY_MAX_STEPS):
+    """
+    Run a query on the partitions its predicates select and return (rows start..start+count,
+    labels), or None when partitioning is off, there are no current partitions or the query
+    is not bounded to a subset of them, in which case the caller runs it on the full tables.
+    Raises QueryBudgetExceeded when over budget.
+    """
+    if not PARTITIONED:
+        return None
+    manifest = current_manifest(db_path)
+    if manifest is None:
+        return None
+    plan = partition_plan(sql, manifest)
+    if plan is None:
+        return None
+    table, periods, columns = plan
+    try:
+        conn = open_partitioned(db_path, manifest, table, periods, columns)
+    except sqlite3.Error as e:
+        logger.info("Could not attach the partitions of %s, using the full table: %s", table, e)
+        return None
+    if conn is None:
+        return None
+    try:
+        with query_budget(conn, timeout, max_steps):
+            cursor = conn.execute(sql)
+            skipped = 0
+            while skipped < start:
+                batch = len(cursor.fetchmany(min(start - skipped, 10000)))
+                if not batch:
+                    break
+                skipped += batch
+            rows = cursor.fetchmany(count)
+            labels = [column[0] for column in cursor.description]
+    except QueryBudgetExceeded:
+        raise
+    except sqlite3.Error as e:
+        logger.info("Partitioned query failed, using the full table: %s", e)
+        return None
+    finally:
+        conn.close()
+    logger.debug("Read %s from partitions %s", table, ', '.join(periods))
+    return rows, labels
+
+
+def period_queries(manifest):
+    """Typical period-bounded questions over the newest partitions, for the benchmark."""
+    periods = sorted(manifest['partitions'])
+    newest = manifest['partitions'][periods[-1]]
+    oldest = manifest['partitions'][periods[max(0, len(periods) - 3)]]
+    month, first = newest['last_month'], oldest['first_month']
+    date = f"{month // 100}-{month % 100:02d}"
+    queries = []
+    for table in manifest['tables']:
+        queries += [
+            f"SELECT vehicleId, COUNT(*) AS trips FROM {table} WHERE monthId = {month} GROUP BY vehicleId "
+            f"ORDER BY trips DESC LIMIT 10;",
+            f"SELECT monthId, COUNT(*) AS rows_in_month FROM {table} WHERE monthId BETWEEN {first} AND {month} "
+            f"GROUP BY monthId;",
+            f"SELECT * FROM {table} WHERE monthId >= {first} ORDER BY unique_id LIMIT 100;",
+        ]
+        if manifest['tables'][table]['eventdate_aligned']:
+            queries.append(f"SELECT COUNT(*), COUNT(DISTINCT vehicleId) FROM {table} WHERE eventdate LIKE '{date}%';")
+    return queries
+
+
+def benchmark(db_path, queries, repeat=3, max_seconds=60.0):
+    """
+    Time each query that prunes to some partitions on the full tables and on the
+    partitions (including attaching them) and check both return the same rows. Returns a
+    list of dicts with sql, periods, full and partitioned median seconds (None when over
+    max_seconds) and same.
+    """
+    from rollups import same_rows
+
+    manifest = current_manifest(db_path)
+    if manifest is None:
+        raise RuntimeError(f"No current partitions of {db_path}; run with --build first.")
+    results = []
+    with pooled_connection(db_path) as full_conn:
+        for sql in queries:
+            plan = partition_plan(sql, manifest)
+            if plan is None:
+                continue
+            table, periods, columns = plan
+            entry = {'sql': sql, 'periods': periods}
+            try:
+                entry['full'] = sorted(time_query(full_conn, sql, max_seconds) for _ in range(repeat))[repeat // 2]
+                expected = full_conn.execute(sql).fetchall()
+            except sqlite3.Error as e:
+                entry['full'] = None if isinstance(e, QueryBudgetExceeded) else e
+                expected = None
+            timings, rows = [], None
+            try:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    conn = open_partitioned(db_path, manifest, table, periods, columns)
+                    if conn is None:
+                        raise sqlite3.OperationalError("too many partitions to attach")
+                    try:
+                        with query_budget(conn, max_seconds, 0):
+                            rows = conn.execute(sql).fetchall()
+                    finally:
+                        conn.close()
+                    timings.append(time.perf_counter() - started)
+                entry['partitioned'] = sorted(timings)[repeat // 2]
+            except sqlite3.Error as e:
+                entry['partitioned'], rows = (None if isinstance(e, QueryBudgetExceeded) else e), None
+            if expected is not None and rows is not None:
+                entry['same'] = same_rows(sorted(expected, key=repr), sorted(rows, key=repr))
+            results.append(entry)
+    return results
+
+
+def _format(value):
+    if value is None:
+        return 'timeout'
+    if isinstance(value, Exception):
+        return 'error'
+    return f"{value * 1000:.1f}ms"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build month partitions of the fact tables and compare them with the full tables.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--build', action='store_true', help="build or refresh the partitions of --db first")
+    parser.add_argument('--drop', action='store_true', help="remove the partitions of --db and exit")
+    parser.add_argument('--grain', choices=GRAINS, default=PARTITION_GRAIN)
+    parser.add_argument('--open-periods', type=int, default=OPEN_PERIODS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=60.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if args.drop:
+        drop_partitions(args.db)
+        raise SystemExit
+    if args.build:
+        started = time.perf_counter()
+        manifest, rebuilt = build_partitions(args.db, args.grain, args.open_periods)
+        sealed = sum(info['sealed'] for info in manifest['partitions'].values())
+        print(f"{len(manifest['partitions'])} partitions ({sealed} sealed) of {', '.join(manifest['tables'])}; "
+              f"rebuilt {len(rebuilt)} in {time.perf_counter() - started:.1f}s")
+    manifest = current_manifest(args.db)
+    if manifest is None:
+        raise SystemExit(f"No current partitions of {args.db}; run with --build.")
+    from index_advisor import load_workload
+
+    queries = period_queries(manifest) + load_workload(args.script, args.template)
+    results = benchmark(args.db, queries, args.repeat, args.max_seconds)
+    print(f"{'query':<70}{'periods':>9}{'full':>12}{'partitioned':>13}  same")
+    for entry in results:
+        same = {True: 'yes', False: 'NO'}.get(entry.get('same'), '-')
+        print(f"{' '.join(entry['sql'].split())[:68]:<70}{len(entry['periods']):>9}{_format(entry['full']):>12}"
+              f"{_format(entry['partitioned']):>13}  {same}")
+    timed = [entry for entry in results if isinstance(entry['full'], float) and isinstance(entry['partitioned'], float)]
+    if timed:
+        full_total = sum(entry['full'] for entry in timed)
+        partitioned_total = sum(entry['partitioned'] for entry in timed)
+        print(f"{len(timed)} queries: full tables {full_total:.2f}s, partitions {partitioned_total:.2f}s "
+              f"({full_total / partitioned_total:.1f}x)")
@@ -0,0 +1,29 @@
+import ast
+
+from example_store import DEFAULT_K, select_examples
+from schema_linking import estimate_tokens, prune_prompt
+
+
+def build_prompt(prompt, question, k=DEFAULT_K):
+    """
+    Shrink a full prompt template for one question.
+
+    Prunes the schema to the linked tables and columns, then keeps only the k nearest
+    few-shot examples. Returns (prompt, stats) where stats reports the tokens saved.
+    """
+    pruned, stats = prune_prompt(prompt, question)
+    pruned = select_examples(pruned, question, k)
+    stats['tokens_after'] = estimate_tokens(pruned)
+    stats['tokens_saved'] = stats['tokens_before'] - stats['tokens_after']
+    return pruned, stats
+
+
+def load_template(script, name):
+    """Read a prompt template literal from an app script without running its Streamlit code."""
+    with open(script, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == name for t in node.targets):
+            value = ast.literal_eval(node.value)
+            return value[0] if isinstance(value, list) else value
+    raise ValueError(f"{name} not found in {script}")
@@ -0,0 +1,184 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from answer_cache import CACHE_PATH, get_cache_connection
+from llm_clients import KEEP_ALIVE, OLLAMA_BASE_URL, get_http_session, stream_generate
+from prompt_builder import build_prompt, load_template
+from schema_linking import build_schema_index
+
+QUESTION_MARKER = 'Question: {question}'
+
+# Reuse Ollama's evaluation of the static head of the prompt (see static_prefix) for every
+# question; only the pruned schema, examples and question after it are evaluated per
+# request. Prompts go to Ollama raw on this path, since a reused context can only be
+# continued verbatim. NL2SQL_PREFIX_CONTEXT=0 sends whole prompts instead.
+USE_PREFIX_CONTEXT = os.environ.get('NL2SQL_PREFIX_CONTEXT', '1') == '1'
+
+# A pruned prompt is 1-2k tokens, but the full template (used when schema linking finds
+# nothing) is around 11k, so the context window must hold that plus the answer. Prefix
+# evaluation and questions must use the same value or Ollama reloads the model.
+CONTEXT_WINDOW = 16384
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+_key_locks = {}
+
+
+def split_prompt(template):
+    """Split a prompt template into its static prefix and the per-question suffix."""
+    index = template.find(QUESTION_MARKER)
+    if index < 0:
+        return template, ''
+    return template[:index], template[index:]
+
+
+def static_prefix(template):
+    """
+    The part of a template that build_prompt sends unchanged with every question: the
+    text before the schema block, or before the question when there is no schema block.
+    """
+    index = build_schema_index(template)
+    return index['head'] if index else split_prompt(template)[0]
+
+
+def evaluate_prefix(model, prefix, url=f"{OLLAMA_BASE_URL}/api/generate", keep_alive=KEEP_ALIVE):
+    """
+    Have Ollama evaluate the prefix once and return its context token array.
+
+    Ollama has to generate at least one token; those tokens are trimmed from the returned
+    context so it covers the prefix only.
+    """
+    response = get_http_session().post(url, json={
+        "model": model,
+        "prompt": prefix,
+        "raw": True,
+        "stream": False,
+        "keep_alive": keep_alive,
+        "options": {"num_predict": 1, "num_ctx": CONTEXT_WINDOW},
+    }, timeout=600)
+    response.raise_for_status()
+    result = response.json()
+    context = result.get('context') or []
+    generated = result.get('eval_count', 0)
+    return context[:-generated] if generated else context
+
+
+def _context_key(model, prefix):
+    return hashlib.sha1(f"{model}\x00{CONTEXT_WINDOW}\x00{prefix}".encode('utf-8')).hexdigest()
+
+
+def _key_lock(key):
+    with _contexts_lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def get_prefix_context(model, prefix, url=f"{OLLAMA_BASE_URL}/api/generate", path=CACHE_PATH):
+    """
+    Return the evaluated context for a prompt prefix, computing it at most once.
+
+    Contexts are memoised per process and persisted in the cache database, so restarts
+    reuse them. They are keyed on model, context window and prefix text; clear the
+    prompt_contexts table after pulling a new version of a model.
+
+    Evaluation is single-flight per prefix: threads missing the same prefix wait for the
+    one evaluating it, while other prefixes are served meanwhile.
+    """
+    key = _context_key(model, prefix)
+    context = _contexts.get(key)
+    if context is not None:
+        return context
+    with _key_lock(key):
+        context = _contexts.get(key)
+        if context is not None:
+            return context
+        conn = get_cache_connection(path)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS prompt_contexts (key TEXT PRIMARY KEY, model TEXT, context TEXT)")
+        row = conn.execute("SELECT context FROM prompt_contexts WHERE key = ?", (key,)).fetchone()
+        if row:
+            context = json.loads(row[0])
+        else:
+            context = evaluate_prefix(model, prefix, url)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO prompt_contexts (key, model, context) VALUES (?, ?, ?)",
+                             (key, model, json.dumps(context)))
+        _contexts[key] = context
+        return context
+
+
+def warm_prefix_context(model, template, url=f"{OLLAMA_BASE_URL}/api/generate"):
+    """Evaluate a template's static prefix ahead of the first question; False if Ollama is unreachable."""
+    try:
+        get_prefix_context(model, static_prefix(template), url)
+        return True
+    except requests.RequestException:
+        return False
+
+
+def stream_with_prefix_context(model, template, prompt, url=f"{OLLAMA_BASE_URL}/api/generate"):
+    """
+    Stream a completion of prompt, the full text built from template for one question
+    (e.g. by build_prompt), evaluating only what follows the template's static prefix on
+    top of its cached context. A prompt not starting with that prefix is sent whole.
+    """
+    prefix = static_prefix(template)
+    if not prefix or not prompt.startswith(prefix):
+        return stream_generate(model, prompt, url=url, raw=True, num_ctx=CONTEXT_WINDOW)
+    context = get_prefix_context(model, prefix, url)
+    return stream_generate(model, prompt[len(prefix):], url=url, context=context, raw=True, num_ctx=CONTEXT_WINDOW)
+
+
+def time_to_first_token(chunks):
+    start = time.perf_counter()
+    try:
+        for _ in chunks:
+            return time.perf_counter() - start
+    finally:
+        chunks.close()
+    return time.perf_counter() - start
+
+
+def benchmark(model, template, questions, url=f"{OLLAMA_BASE_URL}/api/generate"):
+    """
+    Measure time-to-first-token per question with and without the cached prefix context.
+
+    Both send the per-question prompt built by build_prompt (pruned schema and nearest
+    examples); "without" has Ollama evaluate all of it. The one-off cost of evaluating
+    the static prefix is reported separately.
+    """
+    start = time.perf_counter()
+    get_prefix_context(model, static_prefix(template), url)
+    results = {'prefix_evaluation': time.perf_counter() - start, 'questions': []}
+    for question in questions:
+        pruned, _ = build_prompt(template, question)
+        prompt = pruned.format(question=question)
+        without = time_to_first_token(stream_generate(model, prompt, url=url, raw=True, num_ctx=CONTEXT_WINDOW))
+        with_context = time_to_first_token(stream_with_prefix_context(model, template, prompt, url))
+        results['questions'].append({'question': question, 'without': without, 'with_context': with_context})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark time-to-first-token with and without prefix context reuse.")
+    parser.add_argument('--model', default='llama3.1:8b')
+    parser.add_argument('--script', default='cesl_tml_sql.py')
+    parser.add_argument('--template', default='prompt')
+    parser.add_argument('--url', default=f"{OLLAMA_BASE_URL}/api/generate")
+    parser.add_argument('questions', nargs='*', default=[
+        "Find depots with the most charging sessions",
+        "Total energy consumption per vehicle",
+        "Average SOH per dealer region",
+    ])
+    args = parser.parse_args()
+
+    results = benchmark(args.model, load_template(args.script, args.template), args.questions, args.url)
+    print(f"prefix evaluation (one-off): {results['prefix_evaluation']:.2f}s")
+    print(f"{'question':<50}{'without':>10}{'context':>10}")
+    for row in results['questions']:
+        print(f"{row['question'][:48]:<50}{row['without']:>9.2f}s{row['with_context']:>9.2f}s")
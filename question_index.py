@@ -0,0 +1,186 @@
+import os
+import re
+import sqlite3
+import threading
+
+import numpy as np
+
+from answer_cache import (CACHE_PATH, cache_key, cache_scope, get_cache_connection, get_cached_sql,
+                          normalize_question, put_cached_sql)
+from schema_linking import TABLE_HINTS
+from text_vectors import DEFAULT_DIM, vectorize
+
+# Cosine similarity a past question needs before its SQL is reused for a paraphrase.
+DEFAULT_THRESHOLD = float(os.environ.get('NL2SQL_PARAPHRASE_THRESHOLD', '0.85'))
+
+# Questions that differ only in a value ("2023" / "2024", "top 5" / "top 10", "max" / "min"),
+# a negation ("sold" / "not sold") or a comparison ("above 30" / "below 30") score as
+# near-duplicates but need different SQL, so a match must also agree on these.
+VALUE_WORDS = {
+    'sum': {'total', 'sum'}, 'avg': {'average', 'avg', 'mean'}, 'max': {'max', 'maximum'},
+    'min': {'min', 'minimum'}, 'count': {'count', 'number', 'many'},
+    'high': {'highest', 'largest', 'biggest', 'greatest', 'most', 'top', 'best', 'descending'},
+    'low': {'lowest', 'smallest', 'least', 'fewest', 'bottom', 'worst', 'ascending'},
+    'latest': {'latest', 'last', 'recent', 'newest'}, 'earliest': {'earliest', 'first', 'oldest'},
+    'not': {'not', 'no', 'without', 'excluding', 'exclude', 'except', 'never', 'non', 'unsold'},
+    'above': {'above', 'over', 'greater', 'more', 'higher', 'larger', 'longer', 'exceeding', 'exceeds', 'after'},
+    'below': {'below', 'under', 'less', 'fewer', 'lower', 'smaller', 'shorter', 'before'},
+    'at_least': {'at_least'}, 'at_most': {'at_most'},
+    **{month: {month, month[:3]} for month in ('january', 'february', 'march', 'april', 'may', 'june', 'july',
+                                               'august', 'september', 'october', 'november', 'december')},
+}
+_VALUE_CLASSES = {word: name for name, words in VALUE_WORDS.items() for word in words}
+# Table and measure words ("charged" / "discharged", "trips" / "sessions") must agree too;
+# inflections share a stem so "charge", "charged" and "charging" still match each other.
+_HINT_WORDS = {word for words in TABLE_HINTS.values() for word in words}
+
+# Hashed n-gram vectors are randomly projected down to PROJECTED_DIM floats so 100k cached
+# questions fit in a 12.8 MB matrix scanned with one mat-vec (well under a millisecond).
+# The projection only shortlists candidates; the threshold is checked against the exact
+# n-gram cosine, so the margin absorbs the projection's distortion.
+PROJECTED_DIM = 32
+SHORTLIST_MARGIN = 0.3
+SHORTLIST_SIZE = 8
+
+_projection = np.random.default_rng(20240601).standard_normal((DEFAULT_DIM, PROJECTED_DIM)).astype(np.float32)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _hint_stem(word):
+    return re.sub(r'(?:ing|ed|es|e|s)$', '', word)
+
+
+def question_values(question):
+    """
+    The numbers, quoted literals, value-word classes (aggregate, ordering, month, negation,
+    comparison) and table/measure word stems of a question.
+    """
+    quoted = {match.group(1) or match.group(2) for match in re.finditer(r"'([^']*)'|\"([^\"]*)\"", question.lower())}
+    text = re.sub(r'\bat (least|most)\b', r'at_\1', normalize_question(question))
+    words = text.split()
+    numbers = {word.lstrip('0') or '0' for word in re.findall(r'\d+(?:\.\d+)?', text)}
+    classes = {_VALUE_CLASSES[word] for word in words if word in _VALUE_CLASSES}
+    return numbers, quoted, classes, {_hint_stem(word) for word in words if word in _HINT_WORDS}
+
+
+def project(vectors):
+    """Project hashed n-gram vectors to unit-length PROJECTED_DIM vectors."""
+    projected = vectors @ _projection
+    norms = np.linalg.norm(projected, axis=1, keepdims=True)
+    np.divide(projected, norms, out=projected, where=norms > 0)
+    return projected
+
+
+class QuestionIndex:
+    """Append-only nearest-neighbour index over the cached questions of one app scope (see cache_scope)."""
+
+    def __init__(self, capacity=1024):
+        self.matrix = np.zeros((capacity, PROJECTED_DIM), dtype=np.float32)
+        self.questions = []
+        self.positions = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.questions)
+
+    def add(self, question, projected=None):
+        normalized = normalize_question(question)
+        if projected is None:
+            projected = project(vectorize([question]))[0]
+        with self.lock:
+            row = self.positions.get(normalized)
+            if row is None:
+                row = len(self.questions)
+                if row == self.matrix.shape[0]:
+                    grown = np.zeros((row * 2, PROJECTED_DIM), dtype=np.float32)
+                    grown[:row] = self.matrix
+                    self.matrix = grown
+                self.questions.append(question)
+                self.positions[normalized] = row
+            self.matrix[row] = projected
+
+    def search(self, question, threshold=DEFAULT_THRESHOLD):
+        """
+        Return (past question, exact similarity) of the best match above threshold that
+        asks for the same values (see question_values), else None.
+        """
+        with self.lock:
+            count = len(self.questions)
+            matrix = self.matrix[:count]
+        if count == 0:
+            return None
+        vector = vectorize([question])
+        scores = matrix @ project(vector)[0]
+        rows = np.flatnonzero(scores >= threshold - SHORTLIST_MARGIN)
+        if len(rows) == 0:
+            return None
+        if len(rows) > SHORTLIST_SIZE:
+            rows = rows[np.argpartition(-scores[rows], SHORTLIST_SIZE - 1)[:SHORTLIST_SIZE]]
+        candidates = [self.questions[row] for row in rows]
+        exact = vectorize(candidates) @ vector[0]
+        values = question_values(question)
+        for best in np.argsort(-exact):
+            if exact[best] < threshold:
+                break
+            if question_values(candidates[best]) == values:
+                return candidates[best], float(exact[best])
+        return None
+
+
+def _store_vector(conn, key, projected):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO question_vectors (key, vector) VALUES (?, ?)",
+                     (key, sqlite3.Binary(projected.astype(np.float32).tobytes())))
+
+
+def get_question_index(scope, path=CACHE_PATH):
+    """Return the process-wide index for an app scope, loading persisted vectors on first use."""
+    with _indexes_lock:
+        index = _indexes.get((path, scope))
+        if index is not None:
+            return index
+        conn = get_cache_connection(path)
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS question_vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            conn.execute("DELETE FROM question_vectors WHERE key NOT IN (SELECT key FROM answer_cache)")
+        rows = conn.execute(
+            "SELECT a.question, v.vector FROM answer_cache a JOIN question_vectors v ON a.key = v.key "
+            "WHERE a.scope = ? ORDER BY a.last_used", (scope,)
+        ).fetchall()
+        index = QuestionIndex(capacity=max(1024, len(rows) * 2))
+        for question, blob in rows:
+            index.add(question, np.frombuffer(blob, dtype=np.float32))
+        _indexes[(path, scope)] = index
+        return index
+
+
+def lookup_cached_sql(question, model, db_path, prompt, threshold=DEFAULT_THRESHOLD, path=CACHE_PATH):
+    """
+    Look up SQL for a question, first by exact normalized match, then by similarity, among
+    questions cached for the same model, database and prompt template.
+
+    Returns (sql, matched question, similarity) or (None, None, 0.0) on a miss. Matches whose
+    entry has since been evicted from the answer cache are treated as misses.
+    """
+    sql = get_cached_sql(question, model, db_path, prompt, path=path)
+    if sql:
+        return sql, question, 1.0
+    match = get_question_index(cache_scope(model, db_path, prompt), path).search(question, threshold)
+    if match is None:
+        return None, None, 0.0
+    matched, similarity = match
+    sql = get_cached_sql(matched, model, db_path, prompt, path=path)
+    if sql is None:
+        return None, None, 0.0
+    return sql, matched, similarity
+
+
+def remember_sql(question, model, db_path, prompt, sql, path=CACHE_PATH):
+    """Store SQL in the answer cache and add the question to the similarity index of its scope."""
+    scope = cache_scope(model, db_path, prompt)
+    index = get_question_index(scope, path)
+    put_cached_sql(question, model, db_path, prompt, sql, path=path)
+    projected = project(vectorize([question]))[0]
+    _store_vector(get_cache_connection(path), cache_key(question, scope), projected)
+    index.add(question, projected)
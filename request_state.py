@@ -0,0 +1,211 @@
+import pandas as pd
+import streamlit as st
+
+from answer_cache import normalize_question
+from db_pool import QueryBudgetExceeded
+from fast_path import compile_question, fast_path_stats
+from paged_query import describe_page, empty_page, first_page, next_page
+from parallel_query import answer_statements
+from question_index import lookup_cached_sql, remember_sql
+from result_guard import describe_limit, guard_sql, summary_sql
+from sql_repair import REPAIR_ATTEMPTS, repair_sql
+from sql_text import find_statements
+from sql_validation import validate_sql
+
+QUESTION_KEY = 'nl2sql_question'
+RESULT_KEY = 'nl2sql_result'
+
+
+def answer_once(question, answer, retry_failed=True):
+    """
+    Return this session's result for the question, calling answer(question) only when the
+    question changed since the last answer.
+
+    Streamlit reruns the whole script on every widget interaction; keeping the question,
+    generated SQL, DataFrame and figure in st.session_state means those reruns redraw the
+    stored result instead of calling the LLM and database again. With retry_failed, a
+    question that produced no SQL (e.g. Ollama was down) is attempted again.
+    """
+    state = st.session_state
+    normalized = normalize_question(question)
+    stored = state.get(RESULT_KEY)
+    if (state.get(QUESTION_KEY) != normalized or stored is None
+            or (retry_failed and not stored['sql_query'])):
+        state[RESULT_KEY] = answer(question)
+        state[QUESTION_KEY] = normalized
+    return state[RESULT_KEY]
+
+
+def last_result():
+    """Return the most recent result of this session, or None before the first question."""
+    return st.session_state.get(RESULT_KEY)
+
+
+def new_result(question):
+    """Empty result record filled in by an app's answer function."""
+    return {'question': question, 'response': None, 'source': None, 'note': None, 'error': None,
+            'sql_query': None, 'df': None, 'page': None, 'limit': None, 'fig': None, 'chart': None, 'parts': []}
+
+
+def _draw(result):
+    """(Re)build the figure of a result from the rows on screen."""
+    df = result['df']
+    result['fig'] = result['chart'](df) if result['chart'] is not None and df is not None and not df.empty else None
+
+
+def generate_answer(question, model, db_path, template, ask, extract_sql, complete, read_page, chart):
+    """
+    Generate, run and chart the SQL for a question: the answer function every app hands
+    to answer_once.
+
+    The rule-based fast path is tried first, then the answer cache (scoped by model,
+    db_path and template), then the model: ask(question) returns its response and
+    extract_sql(response) the SQL in it; a response with several statements is answered
+    by parallel_query. SQL failing validation is repaired with complete(prompt, timeout),
+    which streams a completion within timeout seconds (see sql_repair.repair_sql); valid SQL is capped by guard_sql and read with
+    read_page(sql), which returns its first page. chart(df) returns a figure or None; it
+    is kept with the result so the figure follows the page on screen.
+    """
+    result = new_result(question)
+    result['chart'] = chart
+    statements = []
+    sql_query = compile_question(question, template)
+    if sql_query:
+        result['source'] = 'fast_path'
+        result['note'] = (f"Compiled by the rule-based fast path without the LLM "
+                          f"({fast_path_stats()['fast_path_rate']:.0%} of questions so far).")
+    else:
+        sql_query, matched_question, similarity = lookup_cached_sql(question, model, db_path, template)
+        if sql_query:
+            result['source'] = 'cache'
+            result['note'] = f"Answered from the query cache (matched \"{matched_question}\", similarity {similarity:.2f})."
+        else:
+            result['source'] = 'llm'
+            response = result['response'] = ask(question)
+            sql_query = extract_sql(response)
+            statements = find_statements(response)
+    result['sql_query'] = sql_query
+
+    if len(statements) > 1:
+        combined = answer_statements(statements, db_path)
+        result['sql_query'] = '\n'.join(statements)
+        result['note'], result['error'] = combined['note'], combined['error']
+        if result['error']:
+            st.error(result['error'])
+        result['df'] = combined['df']
+        result['parts'] = [] if combined['merged'] else statement_parts(combined['results'])
+        _draw(result)
+    elif sql_query:
+        result['error'] = validate_sql(sql_query, db_path)
+        if result['error'] and REPAIR_ATTEMPTS:
+            with st.spinner("The generated SQL failed validation; asking the model to fix it..."):
+                sql_query, result['error'], attempts = repair_sql(question, sql_query, result['error'], db_path, complete)
+            result['sql_query'] = sql_query
+            if not result['error']:
+                result['note'] = f"The generated SQL was repaired after {attempts} attempt(s)."
+        if result['error']:
+            st.error(f"The generated SQL was rejected before running: {result['error']}")
+            page = empty_page(sql_query, db_path)
+        else:
+            run_sql, result['limit'] = guard_sql(sql_query, db_path)
+            result['sql_query'] = run_sql
+            page = read_page(run_sql)
+        result['page'] = page
+        result['df'] = page['df']
+        if not result['df'].empty and result['source'] == 'llm':
+            remember_sql(question, model, db_path, template, sql_query)
+        _draw(result)
+    return result
+
+
+def statement_parts(outcomes):
+    """
+    Result records for statements shown one by one (see parallel_query.answer_statements),
+    each paged on its own with page_controls.
+    """
+    parts = []
+    for outcome in outcomes:
+        part = new_result(None)
+        part.update(sql_query=outcome['sql'], error=outcome['error'], page=outcome['page'], limit=outcome['limit'],
+                    df=outcome['page']['df'] if outcome['page'] is not None else pd.DataFrame())
+        parts.append(part)
+    return parts
+
+
+def show_parts(result):
+    """Show each statement of a result that could not be merged with its own table and paging."""
+    for n, part in enumerate(result['parts'], start=1):
+        st.subheader(f"Query {n}")
+        st.code(part['sql_query'], language='sql')
+        if part['error']:
+            st.error(part['error'])
+        elif part['df'].empty:
+            st.write("No results found for this query.")
+        else:
+            st.dataframe(page_controls(part, key=f'nl2sql_part{n}'))
+
+
+def _turn_page(result, fetch):
+    try:
+        page = fetch(result['page'])
+    except QueryBudgetExceeded as e:
+        result['note'] = str(e)
+        return
+    result['page'] = page
+    result['df'] = page['df']
+    _draw(result)
+
+
+def _load_all(result):
+    page = result['page']
+    _turn_page(result, lambda p: first_page(result['limit']['original_sql'], p['db_path'], p['page_size']))
+    if result['page'] is not page:
+        result['sql_query'] = result['limit']['original_sql']
+        result['limit'] = None
+
+
+def _aggregate_instead(result):
+    page = result['page']
+    columns = result['df'].select_dtypes('number').columns
+    sql = summary_sql(result['limit']['original_sql'], columns[~columns.duplicated()])
+    _turn_page(result, lambda p: first_page(sql, p['db_path'], p['page_size']))
+    if result['page'] is not page:
+        result['sql_query'] = sql
+        result['limit'] = None
+        result['chart'] = result['fig'] = None
+
+
+def limit_controls(result, key='nl2sql'):
+    """
+    For a result capped by result_guard, say so and offer to run the query without the
+    cap (still paged) or to summarise it instead.
+    """
+    if not result.get('limit') or result['page'] is None:
+        return
+    st.caption(describe_limit(result['limit']))
+    col_all, col_aggregate = st.columns(2)
+    col_all.button("Load all", key=f'{key}_load_all', on_click=_load_all, args=(result,))
+    col_aggregate.button("Aggregate instead", key=f'{key}_aggregate', on_click=_aggregate_instead, args=(result,))
+
+
+def page_controls(result, key='nl2sql'):
+    """
+    Show which rows of the result are on screen, with buttons for the next and first
+    pages, and return the DataFrame of the current page.
+
+    Pages are fetched in the buttons' callbacks, before the rerun redraws the table.
+    Results capped by result_guard also get the limit_controls. key prefixes the widget
+    keys, so several results can be paged on one screen.
+    """
+    page = result['page']
+    if page is None:
+        return result['df']
+    limit_controls(result, key)
+    st.caption(describe_page(page))
+    col_next, col_first = st.columns(2)
+    if page['next'] is not None:
+        col_next.button("Next page", key=f'{key}_next_page', on_click=_turn_page, args=(result, next_page))
+    if page['start'] > 0:
+        col_first.button("First page", key=f'{key}_first_page', on_click=_turn_page,
+                         args=(result, lambda p: first_page(p['sql'], p['db_path'], p['page_size'])))
+    return result['df']
@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from db_pool import database_version, pooled_connection
+
+try:
+    import pyarrow  # noqa: F401  (needed by DataFrame.to_parquet)
+except ImportError:
+    pyarrow = None
+
+RESULT_CACHE_DIR = 'nl2sql_results'
+# Budgets for cached DataFrames: the in-memory LRU tier (measured with memory_usage(deep=True))
+# and the Parquet files on disk.
+MEMORY_BUDGET = 256 * 1024 * 1024
+DISK_BUDGET = 1024 * 1024 * 1024
+
+_TOKEN_RE = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|--[^\n]*|/\*.*?\*/|\w+|\S""", re.DOTALL)
+_ALIAS_STOP = {
+    'on', 'where', 'join', 'left', 'right', 'inner', 'outer', 'cross', 'natural', 'group', 'order', 'limit',
+    'using', 'union', 'window', 'having', 'select', 'from', 'as', 'offset', 'except', 'intersect',
+}
+
+_memory = OrderedDict()
+_memory_bytes = 0
+_versions = {}
+_lock = threading.Lock()
+
+
+def canonical_sql(sql):
+    """
+    Normalise SQL so equivalent spellings share a cache entry.
+
+    Comments and the trailing semicolon are dropped, whitespace is collapsed, everything
+    outside quoted literals is lower-cased and table aliases are renamed t1, t2, ... in
+    order of appearance. Column aliases are kept since they name the result columns.
+    """
+    tokens = [token for token in _TOKEN_RE.findall(sql) if not token.startswith(('--', '/*'))]
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    tokens = [token if token[0] in '\'"`[' else token.lower() for token in tokens]
+
+    # Table aliases: "FROM energy_data e" and "FROM energy_data AS e" both become "... t1".
+    aliases, definitions, dropped = {}, set(), set()
+    for i, token in enumerate(tokens[:-1]):
+        if token in ('from', 'join') and re.fullmatch(r'\w+', tokens[i + 1]):
+            j = i + 2
+            if j < len(tokens) and tokens[j] == 'as':
+                dropped.add(j)
+                j += 1
+            if j < len(tokens) and re.fullmatch(r'\w+', tokens[j]) and tokens[j] not in _ALIAS_STOP:
+                aliases.setdefault(tokens[j], f"t{len(aliases) + 1}")
+                definitions.add(j)
+    return ' '.join(
+        aliases[token] if token in aliases and (i in definitions or tokens[i + 1:i + 2] == ['.']) else token
+        for i, token in enumerate(tokens) if i not in dropped)
+
+
+def sql_fingerprint(sql):
+    return hashlib.sha1(canonical_sql(sql).encode('utf-8')).hexdigest()
+
+
+def result_key(sql, db_path, version=None, page=None):
+    """Key of a query's result (or of one page of it) on the current version of a database."""
+    version = database_version(db_path) if version is None else version
+    key = f"{sql_fingerprint(sql)}\x00{os.path.abspath(db_path)}\x00{version}"
+    if page is not None:
+        key += f"\x00{page}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _disk_path(key, directory):
+    return os.path.join(directory, f"{key}.parquet")
+
+
+def result_labels(conn, sql):
+    """Return the column labels SQLite gives a query's result, without running the query."""
+    cursor = conn.execute(f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT 0")
+    labels = []
+    for name, *_ in cursor.description:
+        # Duplicate names come back from a subquery as "name:1"; the query itself returns "name".
+        base, _, suffix = name.rpartition(':')
+        labels.append(base if suffix.isdigit() and base in labels else name)
+    return labels
+
+
+def _remember(key, df, sql, db_path, memory_budget):
+    global _memory_bytes
+    size = int(df.memory_usage(deep=True).sum())
+    if size > memory_budget:
+        return
+    with _lock:
+        if key in _memory:
+            _memory_bytes -= _memory.pop(key)[1]
+        _memory[key] = (df, size, os.path.abspath(db_path), sql)
+        _memory_bytes += size
+        while _memory_bytes > memory_budget:
+            _, (_, evicted, _, _) = _memory.popitem(last=False)
+            _memory_bytes -= evicted
+
+
+def _forget_versions(db_path, version):
+    """Drop the in-memory results of a database whose file changed since the last lookup."""
+    global _memory_bytes
+    path = os.path.abspath(db_path)
+    with _lock:
+        previous = _versions.get(path)
+        _versions[path] = version
+        if previous is None or previous == version:
+            return
+        stale = [key for key, entry in _memory.items() if entry[2] == path]
+        for key in stale:
+            _memory_bytes -= _memory.pop(key)[1]
+
+
+def get_result(key, db_path, directory=RESULT_CACHE_DIR, memory_budget=MEMORY_BUDGET):
+    """
+    Return (DataFrame, sql) for a result key from memory or disk, or None. sql is the
+    statement that produced the labels of the DataFrame's columns; disk entries have
+    positional labels and sql None.
+    """
+    with _lock:
+        entry = _memory.get(key)
+        if entry is not None:
+            _memory.move_to_end(key)
+            return entry[0], entry[3]
+    path = _disk_path(key, directory)
+    if pyarrow is None or not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+    except Exception:
+        return None
+    os.utime(path)
+    return df, None
+
+
+def put_result(key, df, sql, db_path, directory=RESULT_CACHE_DIR, memory_budget=MEMORY_BUDGET,
+               disk_budget=DISK_BUDGET):
+    """Store a query's DataFrame in the memory tier and, when pyarrow is available, as Parquet on disk."""
+    _remember(key, df, sql, db_path, memory_budget)
+    if pyarrow is None:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = _disk_path(key, directory)
+    try:
+        # Positional names: SQL results may repeat a column name, which Parquet rejects.
+        df.set_axis([f"c{i}" for i in range(df.shape[1])], axis=1).to_parquet(path + '.tmp', index=False)
+        os.replace(path + '.tmp', path)
+    except Exception:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        return
+    _trim_disk(directory, disk_budget)
+
+
+def _trim_disk(directory, disk_budget):
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.parquet'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= disk_budget:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _relabel(df, sql, db_path, extra_labels=()):
+    """Give a cached DataFrame the column labels this spelling of the query produces, or None."""
+    try:
+        with pooled_connection(db_path) as conn:
+            labels = result_labels(conn, sql) + list(extra_labels)
+    except sqlite3.Error:
+        return None
+    return df.set_axis(labels, axis=1) if len(labels) == df.shape[1] else None
+
+
+def lookup_result(sql, db_path, directory=RESULT_CACHE_DIR, memory_budget=MEMORY_BUDGET, page=None, extra_labels=()):
+    """
+    Return (key, DataFrame) for a query, or for one page of it (page identifies the page,
+    extra_labels names columns the page adds after the query's own), with the DataFrame
+    None on a miss. The key pins the database version seen before the query runs; pass
+    it to put_result.
+    """
+    version = database_version(db_path)
+    _forget_versions(db_path, version)
+    key = result_key(sql, db_path, version, page)
+    cached = get_result(key, db_path, directory, memory_budget)
+    df = None
+    if cached is not None:
+        df, source = cached
+        if source != sql:
+            df = _relabel(df, sql, db_path, extra_labels)
+            if df is not None and source is None:
+                _remember(key, df, sql, db_path, memory_budget)
+    if df is None:
+        return key, None
+    return key, df.copy()
+
+
+def clear_results(directory=RESULT_CACHE_DIR):
+    """Drop every cached result, in memory and on disk."""
+    global _memory_bytes
+    with _lock:
+        _memory.clear()
+        _memory_bytes = 0
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if entry.name.endswith('.parquet'):
+                os.remove(entry.path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Manage the on-disk query result cache.")
+    parser.add_argument('--dir', default=RESULT_CACHE_DIR)
+    parser.add_argument('--clear', action='store_true', help="delete every cached result")
+    args = parser.parse_args()
+
+    if args.clear:
+        clear_results(args.dir)
+    files = [entry for entry in os.scandir(args.dir) if entry.name.endswith('.parquet')] \
+        if os.path.isdir(args.dir) else []
+    print(f"{len(files)} cached results, {sum(entry.stat().st_size for entry in files) / 1e6:.1f} MB in {args.dir}")
@@ -0,0 +1,80 @@
+import os
+import re
+
+from paged_query import estimate_rows, remember_estimate
+from sql_text import top_level_tokens
+
+# Row cap put on row-level queries that would otherwise return a whole table.
+ROW_LIMIT = int(os.environ.get('NL2SQL_ROW_LIMIT', '10000'))
+
+_AGGREGATES = {'COUNT', 'SUM', 'AVG', 'MIN', 'MAX', 'TOTAL', 'GROUP_CONCAT'}
+
+
+def is_unbounded(sql):
+    """
+    True for a SELECT whose outer query has no LIMIT, no GROUP BY and no aggregate, i.e.
+    one that returns a row per matching row of its tables. Window functions (OVER) do not
+    collapse rows, so a query using them still counts as unbounded.
+    """
+    tokens = top_level_tokens(sql)
+    if not tokens or tokens[0] not in ('SELECT', 'WITH') or 'LIMIT' in tokens:
+        return False
+    if 'GROUP' in tokens:
+        return False
+    calls = {token for token, following in zip(tokens, tokens[1:]) if following == '('}
+    return not (calls & _AGGREGATES) or 'OVER' in tokens
+
+
+def _strip_terminator(sql):
+    return re.sub(r'[;\s]+$', '', sql)
+
+
+def add_limit(sql, limit=ROW_LIMIT):
+    """Append a LIMIT to a statement, before its terminating semicolon."""
+    return f"{_strip_terminator(sql)} LIMIT {int(limit)};"
+
+
+def guard_sql(sql, db_path, limit=ROW_LIMIT):
+    """
+    Cap an unbounded query at limit rows.
+
+    Returns (sql to run, info). info is None when the query is left alone, otherwise a
+    dict with the original_sql, the limit and the original result size as rows/exact from
+    paged_query.estimate_rows, so the UI can offer to load everything or aggregate instead.
+    A query whose exact count already fits under the limit is not rewritten. The capped
+    query's own size follows from the estimate, so first_page does not count it again.
+    """
+    if not limit or not is_unbounded(sql):
+        return sql, None
+    rows, exact = estimate_rows(sql, db_path)
+    if exact and rows <= limit:
+        return sql, None
+    capped = add_limit(sql, limit)
+    if rows is not None:
+        remember_estimate(capped, db_path, min(rows, int(limit)), exact)
+    return capped, {'original_sql': sql, 'limit': int(limit), 'rows': rows, 'exact': exact}
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def summary_sql(sql, columns):
+    """
+    Summarise a row-level query instead of listing it: the row count plus SUM, AVG, MIN
+    and MAX of each of the given (numeric) columns.
+    """
+    select = ['COUNT(*) AS row_count']
+    for column in columns:
+        for function in ('SUM', 'AVG', 'MIN', 'MAX'):
+            select.append(f"{function}({_quote(column)}) AS {_quote(f'{function.lower()}_{column}')}")
+    return f"SELECT {', '.join(select)} FROM ({_strip_terminator(sql)});"
+
+
+def describe_limit(info):
+    """Caption for a capped result, e.g. "Showing the first 10,000 of 1,234,567 rows"."""
+    if info['rows'] is None:
+        total = "an unknown number of"
+    else:
+        total = f"{info['rows']:,}" if info['exact'] else f"up to {info['rows']:,}"
+    return f"Showing the first {info['limit']:,} of {total} rows; the query was capped with LIMIT {info['limit']:,}."
@@ -0,0 +1,460 @@
+import argparse
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from db_pool import database_version, pooled_connection, time_query
+from index_advisor import load_workload
+
+ROLLUP_PREFIX = 'rollup_'
+ROLLUP_META = 'rollup_meta'
+
+# Fact tables that get a rollup, and the measures summarised for each. Columns missing from
+# a database are skipped.
+ROLLUP_MEASURES = {
+    'energy_data': ['NetkWh', 'distanceInKM', 'whPerKM', 'kwh_km', 'dataRegen_kWh', 'dataCons_kWh',
+                    'dischargeSoc', 'Range', 'totalTimeInSec'],
+    'discharge_table': ['NetkWh', 'distanceInKM', 'whPerKM', 'dataRegen_kWh', 'dataCons_kWh',
+                        'dischargeSoc', 'startSoc', 'endSoc', 'Range', 'totalTimeInSec'],
+    'charging_table': ['kwhCharged', 'chargeDurationInMin', 'delta_soc', 'soc_start', 'soc_end',
+                       'NoOfInterrupt', 'InterruptDurationInMin', 'gunDurationInMin', 'avgChargingCurrent'],
+    'soh_table': ['A_SOH_Value', 'B_SOH_Value', 'C_SOH_Value', 'D_SOH_Value', 'NetkWh', 'Energy_consumption',
+                  'Regeneration', 'total_charged_cycle', 'total_full_charged_cycles'],
+}
+# Grouping keys: the vehicle and month plus every dealer/depot/vehicle attribute a table has.
+# Grouping on all of them keeps the rollup exact even where an attribute varies per vehicle.
+ROLLUP_KEYS = ['vehicleId', 'monthId', 'vehicle_registration_number', 'DLR_NAME', 'DLR_ORG_CITY',
+               'DLR_REGION', 'DLR_STATE', 'Depot_Name', 'PL', 'PPL', 'LOB', 'product_line', 'Smart_City',
+               'vehicle_type', 'VCU_BMS_No_of_Packs', 'FIRST_SALE_DT']
+# Aggregates that can be recombined from per-group partials.
+_SUMMARIES = ('sum', 'count', 'min', 'max')
+
+_TOKEN_RE = re.compile(
+    r"""\s+|'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\w+"""
+    r"""|<=|>=|<>|!=|==|\|\||\S""")
+_KEYWORDS = {
+    'SELECT', 'FROM', 'WHERE', 'GROUP', 'BY', 'ORDER', 'HAVING', 'LIMIT', 'OFFSET', 'AS', 'ASC', 'DESC',
+    'AND', 'OR', 'NOT', 'IS', 'NULL', 'IN', 'BETWEEN', 'LIKE', 'GLOB', 'ESCAPE', 'CASE', 'WHEN', 'THEN',
+    'ELSE', 'END', 'DISTINCT', 'COLLATE', 'NOCASE', 'CAST', 'REAL', 'INTEGER', 'TEXT', 'NUMERIC', 'NULLS',
+    'FIRST', 'LAST', 'TRUE', 'FALSE',
+}
+_UNSUPPORTED = {'JOIN', 'UNION', 'INTERSECT', 'EXCEPT', 'OVER', 'WINDOW', 'WITH', 'VALUES', 'FILTER'}
+# Aggregates whose result cannot be rebuilt from the rollup's partial sums.
+_OTHER_AGGREGATES = {'GROUP_CONCAT', 'STRING_AGG', 'JSON_GROUP_ARRAY', 'JSON_GROUP_OBJECT', 'MEDIAN'}
+
+_rollups = {}
+_rollups_lock = threading.Lock()
+
+
+def rollup_name(table):
+    return f"{ROLLUP_PREFIX}{table}"
+
+
+def _table_columns(conn, table):
+    return [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+
+
+def _summary_columns(keys, measures):
+    return keys + ['COUNT(*) AS row_count'] + [
+        f"{function.upper()}({measure}) AS {function}_{measure}" for measure in measures for function in _SUMMARIES]
+
+
+def build_rollups(db_path, tables=None):
+    """
+    (Re)build the rollup tables of a database and return {table: (source rows, rollup rows)}.
+
+    Each rollup_<table> holds one row per combination of the ROLLUP_KEYS the table has,
+    with COUNT(*) as row_count and sum_/count_/min_/max_ columns per measure. rollup_meta
+    records the keys and measures, and triggers on the source table mark the rollup stale
+    on any insert, update or delete, so a stale rollup is never used.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {ROLLUP_META} (source TEXT PRIMARY KEY, rollup TEXT, "
+                     f"keys TEXT, measures TEXT, stale INTEGER, source_rows INTEGER, rollup_rows INTEGER)")
+        built = {}
+        for table, wanted in ROLLUP_MEASURES.items():
+            columns = _table_columns(conn, table)
+            if (tables and table not in tables) or 'vehicleId' not in columns:
+                continue
+            keys = [column for column in ROLLUP_KEYS if column in columns]
+            measures = [column for column in wanted if column in columns]
+            name = rollup_name(table)
+            select = _summary_columns(keys, measures)
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute(f"CREATE TABLE {name} AS SELECT {', '.join(select)} FROM {table} GROUP BY {', '.join(keys)}")
+            conn.execute(f"CREATE INDEX {name}_key ON {name} ({', '.join(keys[:2])})")
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {name}_stale_{event.lower()} AFTER {event} ON {table} "
+                    f"WHEN (SELECT stale FROM {ROLLUP_META} WHERE source = '{table}') = 0 "
+                    f"BEGIN UPDATE {ROLLUP_META} SET stale = 1 WHERE source = '{table}'; END")
+            source_rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            rollup_rows = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            conn.execute(f"INSERT OR REPLACE INTO {ROLLUP_META} VALUES (?, ?, ?, ?, 0, ?, ?)",
+                         (table, name, ','.join(keys), ','.join(measures), source_rows, rollup_rows))
+            conn.commit()
+            built[table] = (source_rows, rollup_rows)
+        return built
+    finally:
+        conn.close()
+
+
+def fresh_rollups(conn):
+    """Return the source tables whose rollup is currently fresh."""
+    try:
+        return {row[0] for row in conn.execute(f"SELECT source FROM {ROLLUP_META} WHERE stale = 0")}
+    except sqlite3.OperationalError:
+        return set()
+
+
+def merge_new_rows(conn, table, after_rowid):
+    """
+    Fold the rows of table with a rowid above after_rowid into its rollup and mark the
+    rollup fresh again; returns the number of rollup rows touched.
+
+    Only valid for a rollup that was fresh before those rows were appended (see
+    fresh_rollups). The new rows are summarised on their own and combined with the
+    existing partials, so the cost follows the new rows, not the table. The caller commits.
+    """
+    name, keys, measures, source_rows = conn.execute(
+        f"SELECT rollup, keys, measures, source_rows FROM {ROLLUP_META} WHERE source = ?", (table,)).fetchone()
+    keys, measures = keys.split(','), [measure for measure in measures.split(',') if measure]
+    conn.execute("DROP TABLE IF EXISTS temp.rollup_delta")
+    conn.execute(f"CREATE TEMP TABLE rollup_delta AS SELECT {', '.join(_summary_columns(keys, measures))} "
+                 f"FROM {table} WHERE rowid > ? GROUP BY {', '.join(keys)}", (after_rowid,))
+    match = ' AND '.join(f"{name}.{key} IS d.{key}" for key in keys)
+    combine = {
+        'count': "{old} + {new}",
+        'sum': "CASE WHEN {new} IS NULL THEN {old} WHEN {old} IS NULL THEN {new} ELSE {old} + {new} END",
+        'min': "CASE WHEN {new} IS NULL THEN {old} WHEN {old} IS NULL THEN {new} ELSE MIN({old}, {new}) END",
+        'max': "CASE WHEN {new} IS NULL THEN {old} WHEN {old} IS NULL THEN {new} ELSE MAX({old}, {new}) END",
+    }
+    updates = [f"row_count = {name}.row_count + d.row_count"] + [
+        f"{function}_{measure} = " + combine[function].format(old=f"{name}.{function}_{measure}",
+                                                            new=f"d.{function}_{measure}")
+        for measure in measures for function in _SUMMARIES]
+    touched = conn.execute(f"UPDATE {name} SET {', '.join(updates)} FROM temp.rollup_delta d WHERE {match}").rowcount
+    touched += conn.execute(f"INSERT INTO {name} SELECT * FROM temp.rollup_delta d "
+                            f"WHERE NOT EXISTS (SELECT 1 FROM {name} WHERE {match})").rowcount
+    added = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM temp.rollup_delta").fetchone()[0]
+    conn.execute("DROP TABLE temp.rollup_delta")
+    conn.execute(f"UPDATE {ROLLUP_META} SET stale = 0, source_rows = ?, rollup_rows = (SELECT COUNT(*) FROM {name}) "
+                 f"WHERE source = ?", (source_rows + added, table))
+    return touched
+
+
+def drop_rollups(db_path):
+    """Remove every rollup table, its staleness triggers and rollup_meta."""
+    conn = sqlite3.connect(db_path)
+    try:
+        try:
+            sources = [row[0] for row in conn.execute(f"SELECT source FROM {ROLLUP_META}")]
+        except sqlite3.OperationalError:
+            return
+        for table in sources:
+            for event in ('insert', 'update', 'delete'):
+                conn.execute(f"DROP TRIGGER IF EXISTS {rollup_name(table)}_stale_{event}")
+            conn.execute(f"DROP TABLE IF EXISTS {rollup_name(table)}")
+        conn.execute(f"DROP TABLE {ROLLUP_META}")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def available_rollups(db_path):
+    """
+    Return {source table (lower-case): {'rollup', 'keys', 'measures'}} for the database's
+    fresh rollups, with keys and measures as {lower-case name: name}. Read once per
+    database version.
+    """
+    path = os.path.abspath(db_path)
+    version = database_version(db_path)
+    with _rollups_lock:
+        cached = _rollups.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    rollups = {}
+    try:
+        with pooled_connection(db_path) as conn:
+            rows = conn.execute(f"SELECT source, rollup, keys, measures FROM {ROLLUP_META} WHERE stale = 0").fetchall()
+            for source, rollup, keys, measures in rows:
+                if _table_columns(conn, rollup):
+                    rollups[source.lower()] = {
+                        'rollup': rollup,
+                        'keys': {key.lower(): key for key in keys.split(',')},
+                        'measures': {measure.lower(): measure for measure in measures.split(',') if measure},
+                    }
+    except sqlite3.Error:
+        pass
+    with _rollups_lock:
+        _rollups[path] = (version, rollups)
+    return rollups
+
+
+def _name(token):
+    return token[1:-1] if token[0] in '"`[' else token
+
+
+def _rewrite_aggregate(function, args, rollup, qualifiers):
+    """Rollup expression for FUNCTION(args) over the source table, or None."""
+    words = [token for token in args if not token.isspace()]
+    distinct = bool(words) and words[0].upper() == 'DISTINCT'
+    if distinct:
+        words = words[1:]
+    if words == ['*']:
+        return 'COALESCE(SUM(row_count), 0)' if function == 'COUNT' and not distinct else None
+    if len(words) == 3 and words[1] == '.' and _name(words[0]).lower() in qualifiers:
+        words = words[2:]
+    if len(words) != 1 or not re.fullmatch(r'\w+', _name(words[0])):
+        return None
+    column = _name(words[0]).lower()
+    if column in rollup['keys']:
+        key = rollup['keys'][column]
+        if function in ('MIN', 'MAX') or (function == 'COUNT' and distinct):
+            return f"{function}({'DISTINCT ' if distinct else ''}{key})"
+        if function == 'COUNT':
+            return f"COALESCE(SUM(CASE WHEN {key} IS NOT NULL THEN row_count END), 0)"
+        return None
+    if column not in rollup['measures'] or distinct:
+        return None
+    measure = rollup['measures'][column]
+    return {
+        'COUNT': f"COALESCE(SUM(count_{measure}), 0)",
+        'SUM': f"SUM(sum_{measure})",
+        'TOTAL': f"TOTAL(sum_{measure})",
+        'AVG': f"(TOTAL(sum_{measure}) / SUM(count_{measure}))",
+        'MIN': f"MIN(min_{measure})",
+        'MAX': f"MAX(max_{measure})",
+    }.get(function)
+
+
+def _matching_paren(tokens, start):
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i] == '(':
+            depth += 1
+        elif tokens[i] == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    return None
+
+
+def _has_alias(item):
+    """True if a select-list item (its non-space tokens) names its column with AS or a bare alias."""
+    depth = 0
+    for token in item:
+        depth += (token == '(') - (token == ')')
+        if depth == 0 and token.upper() == 'AS':
+            return True
+    return (len(item) > 1 and re.fullmatch(r'\w+|"[^"]*"', item[-1]) is not None
+            and item[-1].upper() not in _KEYWORDS and item[-2] not in ('.', '+', '-', '*', '/', '%', '||'))
+
+
+def _clauses(tokens, solid):
+    """Map each top-level clause keyword (SELECT, FROM, WHERE, GROUP, ...) to its span of solid indexes."""
+    starts, depth = [], 0
+    for n, i in enumerate(solid):
+        if tokens[i] == '(':
+            depth += 1
+        elif tokens[i] == ')':
+            depth -= 1
+        elif depth == 0 and tokens[i].upper() in ('SELECT', 'FROM', 'WHERE', 'GROUP', 'HAVING', 'ORDER', 'LIMIT'):
+            starts.append((tokens[i].upper(), n))
+    bounds = [n for _, n in starts[1:]] + [len(solid)]
+    return {clause: range(n, end) for (clause, n), end in zip(starts, bounds)}
+
+
+def rollup_sql(sql, rollups):
+    """
+    Rewrite an aggregate query over one fact table to read its rollup instead, or return None.
+
+    Only queries whose answer is the same from the rollup are rewritten: a single table,
+    no joins, subqueries or window functions, only COUNT, SUM, TOTAL, AVG, MIN and MAX of
+    single columns, and every other column a rollup key, used either in WHERE or as a
+    plain GROUP BY column (so no value comes from an arbitrary row of a group).
+    Unaliased aggregates keep their original column label. Floating-point sums may differ
+    in the last digits, since the rollup adds the same values in a different order.
+    """
+    tokens = _TOKEN_RE.findall(sql.strip())
+    words = [token.upper() for token in tokens if re.fullmatch(r'\w+', token)]
+    if not words or words[0] != 'SELECT' or words.count('SELECT') != 1 or _UNSUPPORTED.intersection(words):
+        return None
+    solid = [i for i, token in enumerate(tokens) if not token.isspace()]
+    clauses = _clauses(tokens, solid)
+    source = [tokens[solid[n]] for n in clauses.get('FROM', [])][1:]
+    if source and source[-1] == ';':
+        source.pop()
+    if len(source) == 3 and source[1].upper() == 'AS':
+        source.pop(1)
+    if not 1 <= len(source) <= 2 or not all(re.fullmatch(r'\w+', name) for name in source):
+        return None
+    table = source[0]
+    rollup = rollups.get(table.lower())
+    if rollup is None or (len(source) == 2 and source[1].upper() in _KEYWORDS):
+        return None
+    qualifiers = {name.lower() for name in source}
+    table_at = solid[clauses['FROM'][1]]
+    alias_at = {solid[n] for n in clauses['FROM'][2:]}
+
+    grouped = set()
+    for n in list(clauses.get('GROUP', []))[2:]:
+        token = tokens[solid[n]]
+        if token == '(':
+            return None
+        if re.fullmatch(r'\w+', token) and token.lower() in rollup['keys']:
+            grouped.add(token.lower())
+    where = {solid[n] for n in clauses.get('WHERE', [])}
+    items, current, depth = [], [], 0
+    for n in list(clauses['SELECT'])[1:]:
+        i = solid[n]
+        if tokens[i] == '(':
+            depth += 1
+        elif tokens[i] == ')':
+            depth -= 1
+        if tokens[i] == ',' and depth == 0:
+            items.append(current)
+            current = []
+        elif tokens[i].upper() not in ('DISTINCT', 'ALL') or current:
+            current.append(i)
+    items.append(current)
+    aliases = {_name(tokens[solid[n + 1]]).lower() for n in range(len(solid) - 1) if tokens[solid[n]].upper() == 'AS'}
+    aliases.update(_name(tokens[item[-1]]).lower() for item in items
+                   if item and _has_alias([tokens[i] for i in item]))
+    distinct = len(solid) > 1 and tokens[solid[1]].upper() == 'DISTINCT'
+
+    output = list(tokens)
+    rewritten = set()
+    ungrouped = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        upper = token.upper()
+        following = next((tokens[j] for j in range(i + 1, len(tokens)) if not tokens[j].isspace()), None)
+        previous = next((tokens[j] for j in range(i - 1, -1, -1) if not tokens[j].isspace()), None)
+        if token == '*' and previous is not None and previous.upper() in ('SELECT', 'DISTINCT', 'ALL', ',', '.'):
+            return None
+        if not re.fullmatch(r'\w+|"[^"]*"|`[^`]*`|\[[^\]]*\]', token) or token[0].isdigit():
+            i += 1
+            continue
+        if following == '(' and token[0] not in '"`[':
+            if upper in _OTHER_AGGREGATES:
+                return None
+            open_at = tokens.index('(', i)
+            close_at = _matching_paren(tokens, open_at)
+            if close_at is None:
+                return None
+            args = tokens[open_at + 1:close_at]
+            # MIN/MAX with several arguments are scalar functions, handled like any other.
+            if upper in ('COUNT', 'SUM', 'TOTAL', 'AVG', 'MIN', 'MAX') and not (upper in ('MIN', 'MAX') and ',' in args):
+                replacement = _rewrite_aggregate(upper, args, rollup, qualifiers)
+                if replacement is None:
+                    return None
+                output[i:close_at + 1] = [replacement] + [''] * (close_at - i)
+                rewritten.add(i)
+                i = close_at + 1
+                continue
+            i += 1
+            continue
+        name = _name(token).lower()
+        if i == table_at:
+            output[i] = rollup['rollup']
+        elif not (upper in _KEYWORDS or i in alias_at or (following == '.' and name in qualifiers)):
+            if name in rollup['keys']:
+                ungrouped = ungrouped or (i not in where and name not in grouped)
+            elif name not in aliases or name in rollup['measures']:
+                return None
+        i += 1
+    if ungrouped and not (distinct and not grouped and not rewritten):
+        return None
+    if not (rewritten or grouped or distinct):
+        return None
+
+    # Unaliased aggregates in the select list keep the label SQLite gives the original text.
+    for item in items:
+        if item and any(i in rewritten for i in item) and not _has_alias([tokens[i] for i in item]):
+            label = ''.join(tokens[item[0]:item[-1] + 1]).replace('"', '""')
+            output[item[-1]] += f' AS "{label}"'
+    return ''.join(output)
+
+
+def route_to_rollup(sql, db_path):
+    """Return the rollup form of a query when its database has a fresh, matching rollup, else sql."""
+    rollups = available_rollups(db_path)
+    if not rollups:
+        return sql
+    return rollup_sql(sql, rollups) or sql
+
+
+def same_rows(left, right, rel_tol=1e-9):
+    if len(left) != len(right):
+        return False
+    key = lambda row: tuple((value is None, str(type(value)), value if value is not None else 0) for value in row)
+    for a, b in zip(sorted(left, key=key), sorted(right, key=key)):
+        for x, y in zip(a, b):
+            if isinstance(x, float) or isinstance(y, float):
+                if x is None or y is None or not math.isclose(x, y, rel_tol=rel_tol, abs_tol=1e-9):
+                    return False
+            elif x != y:
+                return False
+    return True
+
+
+def benchmark(db_path, queries, repeat=3, max_seconds=10.0):
+    """
+    Time each query that can be served from a rollup against the raw tables and the
+    rollup, and check both return the same rows. Returns a list of dicts with sql,
+    rewritten, raw and rollup median seconds and same.
+    """
+    rollups = available_rollups(db_path)
+    results = []
+    with pooled_connection(db_path) as conn:
+        for sql in queries:
+            rewritten = rollup_sql(sql, rollups)
+            if rewritten is None:
+                continue
+            try:
+                same = same_rows(conn.execute(sql).fetchall(), conn.execute(rewritten).fetchall())
+                raw = sorted(time_query(conn, sql, max_seconds) for _ in range(repeat))[repeat // 2]
+                rolled = sorted(time_query(conn, rewritten, max_seconds) for _ in range(repeat))[repeat // 2]
+            except sqlite3.Error as e:
+                results.append({'sql': sql, 'rewritten': rewritten, 'error': str(e)})
+                continue
+            results.append({'sql': sql, 'rewritten': rewritten, 'raw': raw, 'rollup': rolled, 'same': same})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build per-vehicle/per-month rollups and benchmark the queries they serve.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--build', action='store_true', help="(re)build the rollup tables first")
+    parser.add_argument('--drop', action='store_true', help="remove the rollup tables and exit")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    if args.drop:
+        drop_rollups(args.db)
+        raise SystemExit
+    if args.build:
+        for table, (source_rows, rollup_rows) in build_rollups(args.db).items():
+            print(f"{rollup_name(table)}: {source_rows:,} rows summarised into {rollup_rows:,}")
+    workload = load_workload(args.script, args.template)
+    results = benchmark(args.db, workload, args.repeat, args.max_seconds)
+    timed = [row for row in results if 'raw' in row]
+    print(f"\n{len(results)} of {len(workload)} queries can use a rollup")
+    print(f"{'query':<70}{'raw':>10}{'rollup':>10}{'speedup':>9}  same")
+    for row in timed:
+        print(f"{' '.join(row['sql'].split())[:68]:<70}{row['raw'] * 1000:>8.1f}ms{row['rollup'] * 1000:>8.1f}ms"
+              f"{row['raw'] / row['rollup']:>8.1f}x  {'yes' if row['same'] else 'NO'}")
+    for row in results:
+        if 'error' in row:
+            print(f"failed: {' '.join(row['sql'].split())[:68]}: {row['error']}")
+    if timed:
+        print(f"total raw {sum(r['raw'] for r in timed) * 1000:.1f}ms, "
+              f"rollup {sum(r['rollup'] for r in timed) * 1000:.1f}ms")
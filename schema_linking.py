@@ -0,0 +1,190 @@
+import math
+import re
+from functools import lru_cache
+
+# Columns every kept table carries so the model can still join across tables.
+JOIN_KEYS = ('vehicleId', 'vehicle_registration_number')
+
+# Words in a question that point at a table even when no column matches.
+TABLE_HINTS = {
+    'energy_data': {'energy', 'consumption', 'efficiency', 'range'},
+    'discharge_table': {'discharge', 'discharged', 'trip', 'trips', 'distance', 'regen', 'regenerated'},
+    'charging_table': {'charge', 'charged', 'charging', 'session', 'sessions', 'interruption', 'interruptions'},
+    'soh_table': {'soh', 'health', 'pack', 'packs', 'temperature'},
+    'vehicle_table': {'dealer', 'dealers', 'depot', 'depots', 'sold', 'sale', 'sales'},
+    'charging_pack': {'pack', 'packs', 'category', 'categories', 'cell', 'cells'},
+    'soh_pack': {'pack', 'packs', 'soh', 'health'},
+}
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'each', 'for', 'from', 'get', 'has', 'have',
+    'how', 'in', 'is', 'it', 'its', 'list', 'many', 'me', 'of', 'on', 'or', 'per', 'show', 'that',
+    'the', 'their', 'to', 'value', 'was', 'what', 'which', 'with', 'vehicle', 'vehicles', 'total',
+    'find', 'give', 'all', 'number', 'count', 'average', 'avg', 'sum', 'record', 'data',
+}
+
+# Score added to a table hinted at by the question, and the fraction of a table's best
+# column score another column needs to be kept.
+HINT_BONUS = 10.0
+COLUMN_RATIO = 0.35
+
+_TABLE_RE = re.compile(r'^Table(?: Name)?:\s*(\w+)', re.MULTILINE)
+_COLUMN_RE = re.compile(r'^-\s+(\w+)\s*(.*?)\s*$')
+_SCHEMA_START = 'Following is the Table Schema:'
+_SCHEMA_END = 'Example SQL Queries'
+
+
+def tokenize(text, stopwords=STOPWORDS):
+    """Split text, snake_case and camelCase identifiers into lowercase word stems."""
+    text = re.sub(r'([a-z])([A-Z])', r'\1 \2', text)
+    words = re.findall(r'[a-z0-9]+', text.lower())
+    return [_stem(w) for w in words if w not in stopwords]
+
+
+def _stem(word):
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def estimate_tokens(text):
+    """Rough prompt token count (about four characters per token for English and SQL)."""
+    return len(text) // 4
+
+
+@lru_cache(maxsize=8)
+def build_schema_index(prompt):
+    """
+    Parse the schema block of a prompt template and index its column lines.
+
+    Returns None when the prompt has no recognisable schema block, otherwise a dict with
+    the text before and after the schema, the parsed tables and an inverted index of
+    token -> {(table, column): weight}.
+    """
+    start = prompt.find(_SCHEMA_START)
+    end = prompt.find(_SCHEMA_END)
+    if start < 0 or end < 0 or end < start:
+        return None
+    head = prompt[:start + len(_SCHEMA_START)]
+    schema = prompt[start + len(_SCHEMA_START):end]
+    tail = prompt[end:]
+
+    tables = {}
+    matches = list(_TABLE_RE.finditer(schema))
+    for i, match in enumerate(matches):
+        block_end = matches[i + 1].start() if i + 1 < len(matches) else len(schema)
+        columns = []
+        summary = ''
+        for line in schema[match.end():block_end].splitlines():
+            line = line.strip()
+            column = _COLUMN_RE.match(line)
+            if column:
+                columns.append((column.group(1), column.group(2)))
+            elif line.startswith('Contains'):
+                summary = line
+        tables[match.group(1)] = {'summary': summary, 'columns': columns}
+
+    if not tables:
+        return None
+
+    # Column names count double; descriptions are indexed too so "temperature" finds *_Temp.
+    postings = {}
+    for table, info in tables.items():
+        for name, description in info['columns']:
+            for token in set(tokenize(name)):
+                postings.setdefault(token, {})[(table, name)] = 2.0
+            for token in set(tokenize(description)):
+                postings.setdefault(token, {}).setdefault((table, name), 1.0)
+
+    total = sum(len(info['columns']) for info in tables.values())
+    idf = {token: math.log(1 + total / len(cols)) for token, cols in postings.items()}
+    return {'head': head, 'tail': tail, 'tables': tables, 'postings': postings, 'idf': idf}
+
+
+def score_columns(index, question):
+    """Score every (table, column) pair against the question tokens."""
+    scores = {}
+    for token in set(tokenize(question)):
+        for key, weight in index['postings'].get(token, {}).items():
+            scores[key] = scores.get(key, 0.0) + weight * index['idf'][token]
+    return scores
+
+
+def link_schema(index, question, min_score=1.5, max_columns=20, table_ratio=0.5):
+    """Return {table: [column, ...]} for the tables and columns relevant to the question."""
+    scores = score_columns(index, question)
+    question_tokens = set(tokenize(question))
+    candidates = {}
+    for table, info in index['tables'].items():
+        ranked = sorted(
+            ((scores.get((table, name), 0.0), name) for name, _ in info['columns']),
+            reverse=True,
+        )
+        ranked = [(score, name) for score, name in ranked[:max_columns] if score >= min_score]
+        # Shared dimension columns (DLR_*, Depot_Name) exist in every table, so a table
+        # named or hinted at by the question outranks one that only shares a column.
+        bonus = HINT_BONUS if table in question or question_tokens & TABLE_HINTS.get(table, set()) else 0.0
+        table_score = sum(score for score, _ in ranked[:3]) + bonus
+        if table_score > 0:
+            candidates[table] = (table_score, ranked)
+
+    if not candidates:
+        return {}
+    best = max(score for score, _ in candidates.values())
+    selected = {}
+    for table, (table_score, ranked) in candidates.items():
+        if table_score < best * table_ratio:
+            continue
+        top = ranked[0][0] if ranked else 0.0
+        columns = [name for score, name in ranked if score >= top * COLUMN_RATIO]
+        known = {name for name, _ in index['tables'][table]['columns']}
+        columns += [key for key in JOIN_KEYS if key in known and key not in columns]
+        selected[table] = columns
+    return selected
+
+
+def render_schema(index, selected):
+    lines = ['']
+    for table, columns in selected.items():
+        info = index['tables'][table]
+        descriptions = dict(info['columns'])
+        lines.append(f"Table Name: {table}")
+        if info['summary']:
+            lines.append(info['summary'])
+        lines.append(f"{'Columns Name':<38}Description")
+        for name in columns:
+            lines.append(f"- {name:<37}{descriptions[name]}")
+        lines.append('')
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def prune_prompt(prompt, question, min_score=1.5, max_columns=20):
+    """
+    Keep only the schema tables and columns relevant to the question.
+
+    Parameters:
+    prompt (str): The full prompt template containing the hard-coded schema.
+    question (str): The user's natural language question.
+    min_score (float): Minimum IDF-weighted overlap for a column to be kept.
+    max_columns (int): Maximum number of scored columns kept per table.
+
+    Returns:
+    tuple: (pruned prompt, stats dict with tokens_before, tokens_after and tokens_saved).
+    When nothing in the schema matches the question the full prompt is returned unchanged.
+    """
+    tokens_before = estimate_tokens(prompt)
+    index = build_schema_index(prompt)
+    selected = link_schema(index, question, min_score, max_columns) if index else {}
+    if not selected:
+        return prompt, {'tokens_before': tokens_before, 'tokens_after': tokens_before,
+                        'tokens_saved': 0, 'tables': []}
+
+    pruned = index['head'] + render_schema(index, selected) + index['tail']
+    tokens_after = estimate_tokens(pruned)
+    return pruned, {
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': tokens_before - tokens_after,
+        'tables': list(selected),
+    }
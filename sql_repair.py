@@ -0,0 +1,107 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from llm_clients import stream_sql
+from sql_text import find_complete_statement
+from sql_validation import validate_sql
+
+# Repair budget for one question: at most REPAIR_ATTEMPTS extra generations, all of them
+# within REPAIR_TIMEOUT seconds in total; 0 attempts disables repair.
+REPAIR_ATTEMPTS = int(os.environ.get('NL2SQL_REPAIR_ATTEMPTS', '2'))
+REPAIR_TIMEOUT = float(os.environ.get('NL2SQL_REPAIR_TIMEOUT', '20'))
+
+REPAIR_PROMPT = """The SQLite query below was written to answer the question but fails.
+Question: {question}
+Query: {sql}
+Error: {error}
+Reply with only the corrected SQLite query, ending with a semicolon.
+Corrected query:"""
+
+logger = logging.getLogger(__name__)
+
+
+def repair_prompt(question, sql, error):
+    """Short prompt carrying only the failing query and its error, not the schema again."""
+    return REPAIR_PROMPT.format(question=question, sql=' '.join(sql.split()), error=error)
+
+
+def _until(chunks, deadline):
+    """
+    Yield chunks until the deadline passes, then stop.
+
+    The stream is read on a worker thread, so the wait for every chunk, the first one
+    included, ends at the deadline. The worker closes the stream (which ends generation)
+    once the reader has stopped; a stream still waiting on the model ends with the request
+    timeout that generate was given.
+    """
+    received = queue.Queue()
+    stopped = threading.Event()
+
+    def read():
+        try:
+            for chunk in chunks:
+                if stopped.is_set():
+                    break
+                received.put(('chunk', chunk))
+            received.put(('end', None))
+        except Exception as e:
+            received.put(('error', e))
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+
+    threading.Thread(target=read, daemon=True).start()
+    try:
+        while True:
+            try:
+                kind, value = received.get(timeout=max(deadline - time.perf_counter(), 0))
+            except queue.Empty:
+                return
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stopped.set()
+
+
+def repair_sql(question, sql, error, db_path, generate, attempts=REPAIR_ATTEMPTS, timeout=REPAIR_TIMEOUT):
+    """
+    Ask the model to fix a query that failed validation, re-validating every answer.
+
+    generate(prompt, timeout) returns an iterable of completion chunks, e.g.
+    llm_clients.stream_generate; timeout is what is left of the repair budget, for use as
+    the request timeout. Stops at the first valid query, after attempts tries or once
+    timeout seconds have passed, also while waiting for the model's first token. Each
+    attempt's time and outcome are logged.
+
+    Returns (sql, error, attempts made): the last query tried and its validation error,
+    which is None when the repair succeeded.
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    made = 0
+    while made < attempts and time.perf_counter() < deadline:
+        made += 1
+        attempt_start = time.perf_counter()
+        try:
+            response = stream_sql(_until(generate(repair_prompt(question, sql, error), deadline - attempt_start),
+                                         deadline))
+        except Exception as e:
+            logger.warning("SQL repair attempt %d failed after %.2fs: %s", made,
+                           time.perf_counter() - attempt_start, e)
+            break
+        candidate = find_complete_statement(response)
+        if candidate:
+            sql, error = candidate, validate_sql(candidate, db_path)
+        logger.info("SQL repair attempt %d took %.2fs (%.2fs in total): %s", made,
+                    time.perf_counter() - attempt_start, time.perf_counter() - start,
+                    (error or 'valid') if candidate else 'no complete statement in the reply')
+        if error is None:
+            break
+    return sql, error, made
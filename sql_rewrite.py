@@ -0,0 +1,120 @@
+import argparse
+import re
+import sqlite3
+
+from db_pool import time_query
+from index_advisor import explain, load_workload
+
+# The "latest charging session" pattern the few-shot examples used to teach, kept as a
+# benchmark case.
+LATEST_ROW_EXAMPLE = (
+    "SELECT v.vehicleId, v.vehicle_registration_number, v.DLR_NAME AS dealer_name, v.DLR_STATE AS dealer_state, "
+    "c.kwhCharged, c.chargeDurationInMin, c.soc_start, c.soc_end, c.eventdate FROM vehicle_table v "
+    "JOIN charging_table c ON v.vehicleId = c.vehicleId AND v.vehicle_registration_number = c.vehicle_registration_number "
+    "WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 WHERE c2.vehicleId = c.vehicleId) "
+    "ORDER BY c.eventdate DESC;")
+
+_COLUMN = r'(?:(\w+)\.)?(\w+)'
+# Only a whole predicate is rewritten: it must follow WHERE/ON/AND/OR or "(" and end the
+# condition, so operator precedence around it cannot change.
+_EXTREMUM_RE = re.compile(
+    r'(\b(?:WHERE|ON|AND|OR)\s+|\(\s*)' + _COLUMN + r'\s*=\s*\(\s*SELECT\s+(MAX|MIN)\s*\(\s*' + _COLUMN
+    + r'\s*\)\s+FROM\s+(\w+)(?:\s+(?:AS\s+)?(?!WHERE\b)(\w+))?\s+WHERE\s+([^()]*?)\s*\)'
+    r'(?=\s*(?:$|;|\)|\b(?:AND|OR|GROUP|ORDER|LIMIT|HAVING|WINDOW|UNION|EXCEPT|INTERSECT)\b))', re.IGNORECASE)
+_EQUALITY_RE = re.compile(r'^\s*' + _COLUMN + r'\s*=\s*' + _COLUMN + r'\s*$')
+_REFERENCE_RE = re.compile(r"'(?:[^']|'')*'|(\w+)\s*\.", re.IGNORECASE)
+
+
+def _decorrelate(match):
+    lead, outer_alias, outer_column, function, inner_alias, inner_column, table, alias, where = match.groups()
+    inner = {(alias or table).lower()}
+    if inner_alias and inner_alias.lower() not in inner:
+        return None
+    partition, outer, filters = [], [], []
+    for condition in re.split(r'\s+AND\s+', where, flags=re.IGNORECASE):
+        equality = _EQUALITY_RE.match(condition)
+        if equality:
+            left_alias, left, right_alias, right = equality.groups()
+            sides = [(left_alias, left), (right_alias, right)]
+            inner_sides = [side for side in sides if side[0] is None or side[0].lower() in inner]
+            if len(inner_sides) == 1:
+                (_, inner_name), = inner_sides
+                (outer_qualifier, outer_name), = [side for side in sides if side not in inner_sides]
+                partition.append(inner_name)
+                outer.append(f"{outer_qualifier}.{outer_name}")
+                continue
+        referenced = {name.lower() for name in _REFERENCE_RE.findall(condition) if name}
+        if re.search(r'\bOR\b', condition, re.IGNORECASE) or not referenced <= inner:
+            return None
+        filters.append(condition.strip())
+    if not partition:
+        return None
+    target = f"{outer_alias}.{outer_column}" if outer_alias else outer_column
+    filter_sql = f" WHERE {' AND '.join(filters)}" if filters else ''
+    return (f"{lead}({', '.join(outer)}, {target}) IN (SELECT {', '.join(partition)}, {function.upper()}({inner_column}) "
+            f"FROM {table}{' ' + alias if alias else ''}{filter_sql} GROUP BY {', '.join(partition)})")
+
+
+def decorrelate_extrema(sql):
+    """
+    Rewrite correlated "latest/earliest row per group" predicates into a pre-aggregated form.
+
+    col = (SELECT MAX(x) FROM t t2 WHERE t2.k = o.k [AND filters on t2]) is re-evaluated
+    for every outer row, which is quadratic without an index on (k, x). It becomes
+    (o.k, col) IN (SELECT k, MAX(x) FROM t t2 [WHERE filters] GROUP BY k), which SQLite
+    computes once and probes through a temporary index. The result is the same, including
+    ties, which a ROW_NUMBER() form would drop. Anything not matching the pattern exactly
+    (OR, non-equality correlation, nested parentheses) is left unchanged.
+    """
+    if not re.search(r'\b(?:MAX|MIN)\s*\(', sql, re.IGNORECASE):
+        return sql
+    return _EXTREMUM_RE.sub(lambda match: _decorrelate(match) or match.group(0), sql)
+
+
+def compare(conn, queries, repeat=3, max_seconds=30.0):
+    """
+    Time and EXPLAIN each rewritable query before and after decorrelate_extrema. Returns
+    a list of dicts with sql, rewritten, before/after plans, seconds (None when over
+    max_seconds) and whether both returned the same rows.
+    """
+    results = []
+    for sql in queries:
+        rewritten = decorrelate_extrema(sql)
+        if rewritten == sql:
+            continue
+        entry = {'sql': sql, 'rewritten': rewritten,
+                 'plan_before': [detail for _, _, detail in explain(conn, sql)],
+                 'plan_after': [detail for _, _, detail in explain(conn, rewritten)]}
+        for key, statement in (('before', sql), ('after', rewritten)):
+            try:
+                entry[key] = sorted(time_query(conn, statement, max_seconds) for _ in range(repeat))[repeat // 2]
+            except sqlite3.OperationalError:
+                entry[key] = None
+        if entry['before'] is not None:
+            entry['same'] = sorted(map(repr, conn.execute(sql))) == sorted(map(repr, conn.execute(rewritten)))
+        results.append(entry)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare correlated MAX/MIN subqueries with their decorrelated form.")
+    parser.add_argument('--db', default='tml_cesl_final_data_acsentsarthi.db')
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-seconds', type=float, default=30.0)
+    args = parser.parse_args()
+
+    workload = [LATEST_ROW_EXAMPLE] + load_workload(args.script, args.template)
+    with sqlite3.connect(f"file:{args.db}?mode=ro", uri=True) as conn:
+        results = compare(conn, list(dict.fromkeys(workload)), args.repeat, args.max_seconds)
+    for entry in results:
+        print(f"\n{' '.join(entry['sql'].split())}\n  -> {entry['rewritten']}")
+        for key in ('before', 'after'):
+            seconds = entry[key]
+            timing = f"{seconds * 1000:.1f}ms" if seconds is not None else f"over {args.max_seconds:g}s"
+            print(f"  {key}: {timing}")
+            for detail in entry[f'plan_{key}']:
+                print(f"      {detail}")
+        if 'same' in entry:
+            print(f"  same rows: {'yes' if entry['same'] else 'NO'}")
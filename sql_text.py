@@ -0,0 +1,66 @@
+import re
+
+_STATEMENT_START_RE = re.compile(r'\b(SELECT|WITH)\b', re.IGNORECASE)
+
+
+def find_statement_start(text):
+    """Return the offset of the first SELECT/WITH keyword in text, or -1."""
+    match = _STATEMENT_START_RE.search(text)
+    return match.start() if match else -1
+
+
+def find_complete_statement(text):
+    """
+    Return the first complete SQL statement in text, from SELECT/WITH to its terminating
+    semicolon, or None while the statement is still incomplete.
+
+    Semicolons inside quoted strings and identifiers do not end the statement.
+    """
+    start = find_statement_start(text)
+    if start < 0:
+        return None
+    quote = None
+    for i in range(start, len(text)):
+        char = text[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in ("'", '"', '`'):
+            quote = char
+        elif char == ';':
+            return text[start:i + 1]
+    return None
+
+
+def find_statements(text):
+    """Return every complete SELECT/WITH statement in text, in order."""
+    statements = []
+    statement = find_complete_statement(text)
+    while statement:
+        statements.append(statement)
+        text = text[text.index(statement) + len(statement):]
+        statement = find_complete_statement(text)
+    return statements
+
+
+def top_level_tokens(text):
+    """
+    Return the upper-cased words and single-character symbols of a statement that sit
+    outside parentheses and quotes, e.g. to find the outer query's GROUP BY or LIMIT.
+    The outermost parentheses themselves are kept, so "SUM(" shows up as 'SUM', '('.
+    """
+    tokens = []
+    depth = 0
+    for match in re.finditer(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|\w+|\S", text):
+        token = match.group(0)
+        if token == '(':
+            if depth == 0:
+                tokens.append(token)
+            depth += 1
+        elif token == ')':
+            depth -= 1
+            if depth == 0:
+                tokens.append(token)
+        elif depth == 0 and token[0] not in '\'"`[':
+            tokens.append(token.upper())
+    return tokens
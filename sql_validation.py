@@ -0,0 +1,120 @@
+import difflib
+import os
+import re
+import sqlite3
+import threading
+
+from db_pool import database_version, pooled_connection
+from sql_text import top_level_tokens
+
+# Authorizer actions a read-only query may need while it is prepared.
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+_WRITE_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER', 'ATTACH', 'DETACH', 'PRAGMA',
+    'VACUUM', 'REINDEX', 'ANALYZE', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE',
+}
+_MISSING_RE = re.compile(r'no such (table|column): (\S+)')
+
+_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def database_schema(db_path):
+    """
+    Return {table: [column, ...]} for the tables and views of a database, read from
+    sqlite_master and pragma_table_info once per database version.
+    """
+    path = os.path.abspath(db_path)
+    version = database_version(db_path)
+    with _schemas_lock:
+        cached = _schemas.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    with pooled_connection(db_path) as conn:
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'")]
+        schema = {table: [row[0] for row in conn.execute("SELECT name FROM pragma_table_info(?)", (table,))]
+                  for table in tables}
+    with _schemas_lock:
+        _schemas[path] = (version, schema)
+    return schema
+
+
+def _statement_error(sql):
+    """Reject anything but a single SELECT/WITH statement before it reaches SQLite."""
+    tokens = top_level_tokens(sql)
+    while tokens and tokens[-1] == ';':
+        tokens.pop()
+    if not tokens:
+        return "The statement is empty."
+    if tokens[0] not in ('SELECT', 'WITH'):
+        return f"Only SELECT or WITH queries are allowed, not {tokens[0]}."
+    if ';' in tokens:
+        return "Only a single statement is allowed; remove everything after the first semicolon."
+    # REPLACE(...) is also a string function.
+    writes = {token for token, following in zip(tokens, tokens[1:] + [None])
+              if token in _WRITE_KEYWORDS and following != '('}
+    if writes:
+        return f"Only read-only queries are allowed; found {', '.join(sorted(writes))}."
+    return None
+
+
+def _explain_missing(message, schema):
+    """Add the closest real names from the schema to a "no such table/column" error."""
+    match = _MISSING_RE.search(message)
+    if not match:
+        return message
+    kind, name = match.groups()
+    if kind == 'table':
+        candidates = list(schema)
+        close = difflib.get_close_matches(name, candidates, n=3, cutoff=0.5)
+        hint = f"Did you mean {', '.join(close)}?" if close else f"Available tables: {', '.join(candidates)}."
+        return f"{message}. {hint}"
+    column = name.rpartition('.')[2]
+    by_lower = {}
+    for table, columns in schema.items():
+        for candidate in columns:
+            by_lower.setdefault(candidate.lower(), []).append(f"{table}.{candidate}")
+    close = difflib.get_close_matches(column.lower(), list(by_lower), n=3, cutoff=0.6)
+    if not close:
+        return f"{message}. No similar column exists in {', '.join(schema)}."
+    suggestions = [name for lower in close for name in by_lower[lower]]
+    return f"{message}. Columns with similar names: {', '.join(suggestions)}."
+
+
+def validate_sql(sql, db_path):
+    """
+    Check a generated query before running it and return None if it is valid, otherwise
+    the error message, worded so it can be shown to the user or fed back to the model.
+
+    The query must be a single read-only SELECT/WITH statement. It is then compiled with
+    EXPLAIN, which checks every table, column and function without executing anything,
+    under an authorizer that denies any action a plain read does not need. Unknown names
+    are reported with the closest names from the cached schema.
+    """
+    error = _statement_error(sql)
+    if error:
+        return error
+    denied = []
+
+    def authorize(action, *_):
+        if action in _READ_ACTIONS:
+            return sqlite3.SQLITE_OK
+        denied.append(action)
+        return sqlite3.SQLITE_DENY
+
+    try:
+        with pooled_connection(db_path) as conn:
+            conn.set_authorizer(authorize)
+            try:
+                conn.execute("EXPLAIN " + sql.strip().rstrip(';')).close()
+            finally:
+                conn.set_authorizer(None)
+    except sqlite3.Error as e:
+        if denied:
+            return "Only read-only queries are allowed; the statement tries to do more than read tables."
+        try:
+            return _explain_missing(str(e), database_schema(db_path))
+        except sqlite3.Error:
+            return str(e)
+    return None
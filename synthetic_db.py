@@ -0,0 +1,112 @@
+import argparse
+import os
+import sqlite3
+import time
+
+from prompt_builder import load_template
+from schema_linking import build_schema_index
+
+# Column typing for generated data. Everything not listed is a REAL measurement.
+TEXT_COLUMNS = {
+    'DLR_NAME', 'DLR_ORG_CITY', 'DLR_REGION', 'DLR_STATE', 'Depot_Name', 'FIRST_SALE_DT', 'LOB', 'PL',
+    'PPL', 'Smart_City', 'product_line', 'vehicle_registration_number', 'vehicle_type', 'month_year',
+    'signal_occurence_name', 'fullcharge', 'fullcharge_old', 'eventdate', 'unique_id', 'error',
+    'startTime', 'endTime', 'fistChargeTime', 'LastChargeTime', 'LastInterrupttime', 'gun_start', 'gun_end',
+}
+INTEGER_COLUMNS = {'vehicleId', 'monthId', 'rn', 'NoOfInterrupt', 'NoOfInterrupt_in', 'VCU_BMS_No_of_Packs',
+                   'signal_occurence_count', 'total_charged_cycle', 'total_full_charged_cycles'}
+
+# Vehicle attributes are derived from vehicleId so every table agrees on them.
+DIMENSION_EXPRESSIONS = {
+    'vehicleId': "v",
+    'vehicle_registration_number': "printf('MH%06d', v)",
+    'DLR_NAME': "'Dealer ' || (v % 40)",
+    'DLR_ORG_CITY': "'City ' || (v % 30)",
+    'DLR_REGION': "'Region ' || (v % 5)",
+    'DLR_STATE': "'State ' || (v % 12)",
+    'Depot_Name': "'Depot ' || (v % 25)",
+    'PL': "'PL ' || (v % 6)",
+    'PPL': "'PPL ' || (v % 4)",
+    'LOB': "'LOB ' || (v % 3)",
+    'product_line': "'Product ' || (v % 6)",
+    'vehicle_type': "'Type ' || (v % 3)",
+    'Smart_City': "CASE WHEN v % 3 = 0 THEN 'Yes' ELSE 'No' END",
+    'FIRST_SALE_DT': "date('2022-01-01', '+' || (v % 700) || ' days')",
+    'VCU_BMS_No_of_Packs': "4",
+    'rn': "1",
+}
+
+DEFAULT_ROWS = 100000
+DEFAULT_VEHICLES = 500
+
+
+def _expression(table, column):
+    if column in DIMENSION_EXPRESSIONS:
+        return DIMENSION_EXPRESSIONS[column]
+    if column == 'eventdate':
+        return "date('2024-01-01', '+' || d || ' days')"
+    if column == 'monthId':
+        return "CAST(strftime('%Y%m', '2024-01-01', '+' || d || ' days') AS INTEGER)"
+    if column == 'month_year':
+        return "strftime('%Y-%m', '2024-01-01', '+' || d || ' days')"
+    if column == 'unique_id':
+        return f"'{table}-' || i"
+    if column.startswith('fullcharge'):
+        return "CASE WHEN i % 2 = 0 THEN 'Yes' ELSE 'No' END"
+    if column in TEXT_COLUMNS:
+        if column.lower().endswith(('time', 'start', 'end')):
+            return "datetime('2024-01-01', '+' || d || ' days', '+' || (i % 86400) || ' seconds')"
+        return "'x'"
+    if column in INTEGER_COLUMNS:
+        return "abs(random() % 6)"
+    return "abs(random() % 100000) / 100.0"
+
+
+def create_synthetic_db(path, template, rows=DEFAULT_ROWS, vehicles=DEFAULT_VEHICLES):
+    """
+    Create a database with the tables and columns described in a prompt template, filled
+    with random data, for benchmarking without the production database.
+
+    Fact tables get rows rows spread over vehicles vehicles and one year of eventdates;
+    vehicle_table gets one row per vehicle. Rows are generated inside SQLite, so tens of
+    millions of rows are practical. Returns a dict of row counts per table.
+    """
+    index = build_schema_index(template)
+    if index is None:
+        raise ValueError("template has no table schema")
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        counts = {}
+        for table, info in index['tables'].items():
+            names = list(dict.fromkeys(name for name, _ in info['columns']))
+            count = vehicles if table == 'vehicle_table' else rows
+            conn.execute(f"CREATE TABLE {table} ({', '.join(names)})")
+            conn.execute(
+                f"WITH RECURSIVE seq(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM seq WHERE i + 1 < ?), "
+                f"src AS (SELECT i, i % ? AS v, (i * 7919) % 365 AS d FROM seq) "
+                f"INSERT INTO {table} ({', '.join(names)}) "
+                f"SELECT {', '.join(_expression(table, name) for name in names)} FROM src",
+                (count, vehicles))
+            counts[table] = count
+        conn.commit()
+        return counts
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create a random database with the apps' schema.")
+    parser.add_argument('path')
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS)
+    parser.add_argument('--vehicles', type=int, default=DEFAULT_VEHICLES)
+    parser.add_argument('--script', default='main.py')
+    parser.add_argument('--template', default='prompt_template')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    counts = create_synthetic_db(args.path, load_template(args.script, args.template), args.rows, args.vehicles)
+    print(f"created {args.path} in {time.perf_counter() - start:.1f}s: {counts}")
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from prompt_builder import load_template  # noqa: E402
+from synthetic_db import create_synthetic_db  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def prompt():
+    """The main app's prompt template, whose schema the synthetic database follows."""
+    return load_template(os.path.join(ROOT, 'main.py'), 'prompt_template')
+
+
+@pytest.fixture(scope='session')
+def synthetic_db(tmp_path_factory, prompt):
+    """A small synthetic copy of the telemetry database: 20k rows per fact table over twelve months."""
+    path = str(tmp_path_factory.mktemp('db') / 'telemetry.db')
+    create_synthetic_db(path, prompt, 20000)
+    return path
+
+
+@pytest.fixture(scope='session', autouse=True)
+def working_dir(tmp_path_factory):
+    """Run the tests in a scratch directory, so result caches and partitions stay out of the repo."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('cwd'))
+        yield
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('duckdb')
+
+import columnar  # noqa: E402
+from rollups import same_rows  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def mirrored(synthetic_db, tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('columnar'))
+        patch.setattr(columnar, 'COLUMNAR', True)
+        manifest = columnar.build_mirror(synthetic_db)
+        yield synthetic_db, manifest
+
+
+def _sqlite_rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT COUNT(*) FROM energy_data WHERE monthId = '202401';",
+    "SELECT COUNT(*) FROM energy_data WHERE vehicleId = '5';",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId > '202401';",
+    "SELECT COUNT(*) FROM energy_data WHERE NetkWh > '500';",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId IN ('202401', '202402');",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId BETWEEN '202401' AND '202403';",
+    "SELECT vehicleId, COUNT(*) FROM energy_data GROUP BY vehicleId HAVING COUNT(*) > '50';",
+])
+def test_string_literals_compared_with_numbers_stay_on_sqlite(mirrored, sql):
+    _, manifest = mirrored
+    assert columnar.columnar_sql(sql, manifest) is None
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT COUNT(*) FROM energy_data WHERE monthId = 202401;",
+    "SELECT DLR_REGION, SUM(NetkWh) FROM energy_data WHERE DLR_REGION = 'Region 1' GROUP BY DLR_REGION;",
+    "SELECT DLR_NAME, COUNT(*) FROM charging_table WHERE LOWER(DLR_NAME) LIKE '%dealer 1%' GROUP BY DLR_NAME;",
+    "SELECT vehicleId, COUNT(*) > 50 AS busy FROM energy_data GROUP BY vehicleId;",
+    "SELECT Depot_Name, AVG(chargeDurationInMin) AS avg_duration FROM charging_table GROUP BY Depot_Name "
+    "ORDER BY avg_duration DESC LIMIT 5;",
+    "SELECT monthId, SUM(distanceInKM), MAX(Range) FROM discharge_table WHERE monthId >= 202406 GROUP BY monthId;",
+])
+def test_mirror_answers_like_sqlite(mirrored, sql):
+    db_path, manifest = mirrored
+    assert columnar.columnar_sql(sql, manifest) is not None
+    rows, _ = columnar.fetch_columnar(sql, db_path, 0, 100000)
+    expected = _sqlite_rows(db_path, sql)
+    assert same_rows(sorted(expected, key=repr), sorted(rows, key=repr), rel_tol=1e-6)
+    assert [type(value) for value in rows[0]] == [type(value) for value in expected[0]]
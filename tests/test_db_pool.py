@@ -0,0 +1,102 @@
+import shutil
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import db_pool
+from db_pool import ConnectionPool, QueryBudgetExceeded, query_budget
+
+HEAVY = "SELECT COUNT(*) FROM energy_data a, energy_data b WHERE a.NetkWh > b.NetkWh"
+
+
+@pytest.fixture
+def pool(synthetic_db):
+    pool = ConnectionPool(synthetic_db, size=2)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def memory_pool(synthetic_db, tmp_path):
+    """An in-memory pool over a copy of the synthetic database, so tests may write to the file."""
+    path = str(tmp_path / 'reload.db')
+    shutil.copyfile(synthetic_db, path)
+    pool = ConnectionPool(path, size=4, in_memory=True)
+    yield pool
+    pool.close()
+    if pool.memory is not None:
+        pool.memory.close()
+
+
+def _add_vehicle(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("INSERT INTO vehicle_table (vehicleId) VALUES (100000)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_step_budget_interrupts_a_query(pool):
+    with pool.connection() as conn:
+        with pytest.raises(QueryBudgetExceeded, match="more than 1,000,000 steps"):
+            with query_budget(conn, timeout=0, max_steps=1000000):
+                conn.execute(HEAVY).fetchall()
+        # The connection stays usable and the handler is gone once the block ends.
+        assert conn.execute("SELECT COUNT(*) FROM vehicle_table").fetchone() == (500,)
+        with query_budget(conn, timeout=0, max_steps=0):
+            assert conn.execute("SELECT COUNT(*) FROM energy_data").fetchone() == (20000,)
+
+
+def test_time_budget_interrupts_a_query_read_through_pandas(pool):
+    with pool.connection() as conn:
+        with pytest.raises(QueryBudgetExceeded, match="ran longer than 0.2s"):
+            with query_budget(conn, timeout=0.2, max_steps=0):
+                pd.read_sql_query(HEAVY, conn)
+
+
+def test_errors_within_the_budget_are_not_relabelled(pool):
+    with pool.connection() as conn:
+        with pytest.raises(Exception) as raised:
+            with query_budget(conn, timeout=10, max_steps=0):
+                conn.execute("SELECT no_such_column FROM energy_data")
+        assert not isinstance(raised.value, QueryBudgetExceeded)
+
+
+def test_a_changed_file_is_reloaded(memory_pool):
+    with memory_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM vehicle_table").fetchone() == (500,)
+    assert (memory_pool.mode, memory_pool.generation) == ('memory', 1)
+    _add_vehicle(memory_pool.db_path)
+    with memory_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM vehicle_table").fetchone() == (501,)
+    assert (memory_pool.mode, memory_pool.generation) == ('memory', 2)
+    # Only connections to the current copy are kept.
+    assert [generation for generation, _ in list(memory_pool.idle.queue)] == [2]
+
+
+def test_a_reload_during_open_never_yields_an_empty_copy(memory_pool, monkeypatch):
+    with memory_pool.connection():
+        pass
+    memory_pool.close()
+    open_memory, reload = db_pool.open_memory, None
+
+    def slow_open(uri):
+        # Another session reloads the database while this one is opening the old copy.
+        nonlocal reload
+        if reload is None:
+            _add_vehicle(memory_pool.db_path)
+            reload = threading.Thread(target=memory_pool._refresh)
+            reload.start()
+            time.sleep(0.2)
+        return open_memory(uri)
+    monkeypatch.setattr(db_pool, 'open_memory', slow_open)
+    with memory_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM vehicle_table").fetchone() == (500,)
+    reload.join()
+    assert memory_pool.generation == 2 and memory_pool.idle.empty()
+    with memory_pool.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM vehicle_table").fetchone() == (501,)
@@ -0,0 +1,48 @@
+from example_store import nearest_examples, parse_examples, select_examples
+
+EXAMPLES = """Instructions.
+
+Example SQL Queries & Visualizations
+
+- Total energy consumed per vehicle
+SELECT vehicleId, SUM(NetkWh) FROM energy_data GROUP BY vehicleId;
+
+- Average charging duration per depot
+SELECT Depot_Name, AVG(chargeDurationInMin) FROM charging_table GROUP BY Depot_Name;
+
+- Latest SOH of every pack
+SELECT vehicleId, A_SOH_Value FROM soh_table;
+
+Question: {question}
+Answer:
+"""
+
+
+def test_examples_are_parsed_with_their_block():
+    examples, start, end = parse_examples(EXAMPLES)
+    assert [example.question for example in examples] == [
+        "Total energy consumed per vehicle", "Average charging duration per depot", "Latest SOH of every pack"]
+    assert examples[1].sql == "SELECT Depot_Name, AVG(chargeDurationInMin) FROM charging_table GROUP BY Depot_Name;"
+    assert EXAMPLES[start:].startswith("- Total energy") and EXAMPLES[end:].lstrip().startswith("Question:")
+    assert parse_examples("No examples here.") == ([], -1, -1)
+
+
+def test_nearest_examples_match_on_sql_identifiers():
+    # "depot" appears only in the SQL of the charging example.
+    (example, score), = nearest_examples(EXAMPLES, "how long does charging take at each depot", 1)
+    assert example.question == "Average charging duration per depot" and score > 0
+
+
+def test_only_the_nearest_examples_are_sent():
+    pruned = select_examples(EXAMPLES, "energy consumed by vehicle 12", 1)
+    assert "- Total energy consumed per vehicle\nSELECT vehicleId, SUM(NetkWh)" in pruned
+    assert "charging_table" not in pruned and "soh_table" not in pruned
+    assert pruned.startswith("Instructions.") and pruned.endswith("Question: {question}\nAnswer:\n")
+    assert select_examples(EXAMPLES, "anything", 3) == EXAMPLES
+
+
+def test_app_prompt_keeps_k_examples(prompt):
+    examples, _, _ = parse_examples(prompt)
+    pruned = select_examples(prompt, "kwh charged by each depot", 2)
+    assert len(examples) > 2 and len(parse_examples(pruned)[0]) == 2
+    assert "{question}" in pruned
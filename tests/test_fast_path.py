@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from fast_path import compile_question
+
+
+@pytest.mark.parametrize('question', [
+    "total distance per vehicle for March 2024",
+    "total distance per vehicle this year",
+    "total distance per vehicle for 202403",
+    "total distance per vehicle for vehicle MH12AB1234",
+    "sum of distance per vehicle with SOH under 80",
+    "how many trips per vehicle in January",
+    "average charging duration per vehicle excluding zero sessions",
+    "total energy consumption per vehicle last 30 days",
+    "lowest range vehicles by dealer",
+    "total distance and energy consumed per vehicle",
+])
+def test_questions_with_unhandled_words_go_to_the_llm(question, prompt):
+    assert compile_question(question, prompt) is None
+
+
+@pytest.mark.parametrize('question, expected', [
+    ("total distance per vehicle",
+     "SELECT vehicleId, SUM(distanceInKM) AS total_distanceInKM FROM discharge_table GROUP BY vehicleId "
+     "ORDER BY total_distanceInKM DESC;"),
+    ("top 5 dealers by distance",
+     "SELECT DLR_NAME, SUM(distanceInKM) AS total_distanceInKM FROM discharge_table GROUP BY DLR_NAME "
+     "ORDER BY total_distanceInKM DESC LIMIT 5;"),
+    ("lowest range per dealer",
+     "SELECT DLR_NAME, MIN(Range) AS min_Range FROM energy_data GROUP BY DLR_NAME ORDER BY min_Range ASC;"),
+    ("vehicles with the lowest average range",
+     "SELECT vehicleId, AVG(Range) AS avg_Range FROM energy_data GROUP BY vehicleId ORDER BY avg_Range ASC;"),
+    ("bottom 3 cities by energy consumed",
+     "SELECT DLR_ORG_CITY, SUM(NetkWh) AS total_NetkWh FROM energy_data GROUP BY DLR_ORG_CITY "
+     "ORDER BY total_NetkWh ASC LIMIT 3;"),
+    ("depots with the most charging sessions",
+     "SELECT Depot_Name, COUNT(*) AS charging_sessions FROM charging_table GROUP BY Depot_Name "
+     "ORDER BY charging_sessions DESC;"),
+    ("How many trips per vehicle?",
+     "SELECT vehicleId, COUNT(*) AS trips FROM discharge_table GROUP BY vehicleId ORDER BY trips DESC;"),
+])
+def test_fixed_shapes_compile(question, expected, prompt):
+    assert compile_question(question, prompt) == expected
+
+
+@pytest.mark.parametrize('question, reference', [
+    ("top 5 dealers by distance",
+     "SELECT DLR_NAME, SUM(distanceInKM) FROM discharge_table GROUP BY DLR_NAME ORDER BY 2 DESC LIMIT 5"),
+    ("bottom 3 vehicles by average range",
+     "SELECT vehicleId, AVG(Range) FROM energy_data GROUP BY vehicleId ORDER BY 2 ASC LIMIT 3"),
+    ("number of charging sessions per depot",
+     "SELECT Depot_Name, COUNT(*) FROM charging_table GROUP BY Depot_Name ORDER BY 2 DESC"),
+])
+def test_compiled_sql_answers_like_the_reference(question, reference, prompt, synthetic_db):
+    conn = sqlite3.connect(synthetic_db)
+    try:
+        compiled = conn.execute(compile_question(question, prompt)).fetchall()
+        assert [row[1] for row in compiled] == pytest.approx([row[1] for row in conn.execute(reference)])
+    finally:
+        conn.close()
+
+
+def test_latest_row_per_vehicle_returns_the_table_columns(prompt, synthetic_db):
+    conn = sqlite3.connect(synthetic_db)
+    try:
+        cursor = conn.execute(compile_question("latest charging session per vehicle", prompt))
+        rows = cursor.fetchall()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(charging_table)")]
+        assert [description[0] for description in cursor.description] == columns
+        latest = conn.execute("SELECT vehicleId, MAX(eventdate) FROM charging_table GROUP BY vehicleId").fetchall()
+    finally:
+        conn.close()
+    at = columns.index('eventdate')
+    assert len(rows) == len(latest)
+    assert {(row[columns.index('vehicleId')], row[at]) for row in rows} == set(latest)
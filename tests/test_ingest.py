@@ -0,0 +1,84 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from ingest import ingest, table_for
+from rollups import ROLLUP_META, build_rollups, fresh_rollups, merge_new_rows, rollup_name, same_rows
+
+
+@pytest.fixture
+def rollup_db(synthetic_db, tmp_path):
+    """A copy of the synthetic database with rollups built, so tests may write to it."""
+    path = str(tmp_path / 'ingest.db')
+    shutil.copyfile(synthetic_db, path)
+    build_rollups(path)
+    return path
+
+
+def _rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_merge_new_rows_matches_a_rebuild(rollup_db):
+    conn = sqlite3.connect(rollup_db)
+    try:
+        last = conn.execute("SELECT MAX(rowid) FROM charging_table").fetchone()[0]
+        # Half the new rows repeat existing groups, the other half add a vehicle and month.
+        conn.execute("INSERT INTO charging_table SELECT * FROM charging_table WHERE rowid <= 500")
+        conn.execute("INSERT INTO charging_table SELECT * FROM charging_table WHERE rowid <= 500")
+        conn.execute(f"UPDATE charging_table SET vehicleId = vehicleId + 100000, monthId = 202501 "
+                     f"WHERE rowid > {last + 500}")
+        touched = merge_new_rows(conn, 'charging_table', last)
+        conn.commit()
+        assert touched > 0
+        assert 'charging_table' in fresh_rollups(conn)
+        merged = conn.execute(f"SELECT * FROM {rollup_name('charging_table')}").fetchall()
+        source_rows = conn.execute(f"SELECT source_rows FROM {ROLLUP_META} WHERE source = 'charging_table'").fetchone()
+        assert source_rows[0] == last + 1000
+    finally:
+        conn.close()
+    build_rollups(rollup_db, ['charging_table'])
+    assert same_rows(merged, _rows(rollup_db, f"SELECT * FROM {rollup_name('charging_table')}"))
+
+
+def test_drops_are_deduplicated_and_rollups_stay_fresh(rollup_db, tmp_path):
+    conn = sqlite3.connect(rollup_db)
+    try:
+        existing = pd.read_sql_query("SELECT * FROM energy_data WHERE rowid <= 300", conn)
+    finally:
+        conn.close()
+    new = existing.iloc[:200].copy()
+    new['unique_id'] = [f"new-{i}" for i in range(200)]
+    new['monthId'] = 202501
+    # 100 rows already loaded, 200 new ones, 50 of them repeated within the drop, and a
+    # column the table does not have.
+    drop = pd.concat([existing.iloc[200:], new, new.iloc[:50]]).rename(columns={'NetkWh': 'netkwh'})
+    drop['comment'] = 'ignored'
+    path = str(tmp_path / 'energy_data_2025_01.csv')
+    drop.to_csv(path, index=False)
+
+    reports = ingest(rollup_db, [path], batch_rows=64, transaction_rows=128)
+    assert reports[path]['table'] == 'energy_data'
+    assert (reports[path]['read'], reports[path]['inserted']) == (350, 200)
+    assert _rows(rollup_db, "SELECT COUNT(*), COUNT(DISTINCT unique_id) FROM energy_data") == [(20200, 20200)]
+    assert _rows(rollup_db, "SELECT SUM(NetkWh) FROM energy_data WHERE monthId = 202501") == \
+        [(pytest.approx(new['NetkWh'].sum()),)]
+
+    merged = _rows(rollup_db, f"SELECT * FROM {rollup_name('energy_data')}")
+    assert _rows(rollup_db, f"SELECT stale FROM {ROLLUP_META} WHERE source = 'energy_data'") == [(0,)]
+    build_rollups(rollup_db, ['energy_data'])
+    assert same_rows(merged, _rows(rollup_db, f"SELECT * FROM {rollup_name('energy_data')}"))
+
+
+def test_drop_files_are_named_after_their_table():
+    assert table_for('/drops/Energy_Data-2025-01.parquet') == 'energy_data'
+    assert table_for('charging_table_jan.csv') == 'charging_table'
+    assert table_for('jan.csv', 'soh_table') == 'soh_table'
+    with pytest.raises(ValueError):
+        table_for('jan.csv')
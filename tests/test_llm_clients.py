@@ -0,0 +1,61 @@
+import pytest
+
+from llm_clients import stream_sql
+
+
+class Chunks:
+    """A model stream that records how far it was read and whether it was closed."""
+
+    def __init__(self, *chunks):
+        self.chunks, self.read, self.closed = list(chunks), 0, False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class Message:
+    def __init__(self, content):
+        self.content = content
+
+
+def test_generation_stops_at_the_first_complete_statement():
+    chunks = Chunks("Here is the query:\n", "SELECT vehicleId ", "FROM energy_data", " WHERE Depot_Name = 'a;b'",
+                    ";\nExplanation: ", "this query selects", " every vehicle.")
+    assert stream_sql(chunks) == ("Here is the query:\nSELECT vehicleId FROM energy_data "
+                                  "WHERE Depot_Name = 'a;b';")
+    assert chunks.read == 5 and chunks.closed
+
+
+def test_partials_and_message_chunks():
+    partials = []
+    chunks = Chunks(Message("SQL: SELECT "), Message("COUNT(*) FROM"), Message(" vehicle_table;"), Message(" done"))
+    assert stream_sql(chunks, on_partial=partials.append) == "SQL: SELECT COUNT(*) FROM vehicle_table;"
+    assert partials == ["SELECT ", "SELECT COUNT(*) FROM", "SELECT COUNT(*) FROM vehicle_table;"]
+    assert chunks.read == 3
+
+
+def test_an_unfinished_answer_is_returned_whole():
+    chunks = Chunks("I am not sure ", "which table you mean")
+    assert stream_sql(chunks) == "I am not sure which table you mean"
+    assert chunks.read == 2 and chunks.closed
+
+
+@pytest.mark.parametrize('chunks, expected, read', [
+    (["SELECT a FROM t; ", "SELECT b FROM u;", " With these results", " you can compare them."],
+     "SELECT a FROM t; SELECT b FROM u;", 3),
+    (["SELECT a FROM t; SELECT b FROM u;\n", "\nSELECT c FROM v;", " SELECT d FROM w;"],
+     "SELECT a FROM t; SELECT b FROM u;", 2),
+    (["SELECT a FROM t; SEL", "ECT b FROM u;", "\nNote: both are totals."], "SELECT a FROM t; SELECT b FROM u;", 3),
+    (["WITH x AS (SELECT 1) SELECT * FROM x;\nWITH y AS (SELECT 2) SELECT * FROM y;", " I hope this helps."],
+     "WITH x AS (SELECT 1) SELECT * FROM x;\nWITH y AS (SELECT 2) SELECT * FROM y;", 2),
+    (["SELECT a FROM t;", " SELECT b FROM u;"], "SELECT a FROM t; SELECT b FROM u;", 2),
+])
+def test_multiple_statements_end_at_trailing_text(chunks, expected, read):
+    chunks = Chunks(*chunks)
+    assert stream_sql(chunks, multiple=True) == expected
+    assert chunks.read == read and chunks.closed
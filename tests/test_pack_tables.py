@@ -0,0 +1,61 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from pack_tables import PACKS, build_pack_tables, with_pack_tables
+
+
+@pytest.fixture(scope='module')
+def pack_db(synthetic_db, tmp_path_factory):
+    """A copy of the synthetic database with pack tables built, so tests may write to it."""
+    path = str(tmp_path_factory.mktemp('packs') / 'packs.db')
+    shutil.copyfile(synthetic_db, path)
+    build_pack_tables(path)
+    return path
+
+
+def _rows(conn, sql):
+    return sorted(conn.execute(sql).fetchall(), key=repr)
+
+
+def _matches_source(conn):
+    """Whether charging_pack holds exactly the per-pack values of charging_table."""
+    wide = ' UNION ALL '.join(f"SELECT rowid, '{pack}', {pack}_Max_Cell_Temp, {pack}_KWh_Remain_End "
+                              f"FROM charging_table" for pack in PACKS)
+    return _rows(conn, wide) == _rows(conn, "SELECT source_rowid, pack, Max_Cell_Temp, KWh_Remain_End "
+                                           "FROM charging_pack")
+
+
+def test_pack_tables_hold_one_row_per_pack(pack_db):
+    conn = sqlite3.connect(pack_db)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM charging_pack").fetchone()[0] == 4 * 20000
+        assert conn.execute("SELECT COUNT(*) FROM soh_pack").fetchone()[0] == 4 * 20000
+        assert _matches_source(conn)
+        per_pack = dict(conn.execute("SELECT pack, MIN(SOH_Value) FROM soh_pack GROUP BY pack"))
+        assert per_pack == {pack: conn.execute(f"SELECT MIN({pack}_SOH_Value) FROM soh_table").fetchone()[0]
+                            for pack in PACKS}
+    finally:
+        conn.close()
+
+
+def test_triggers_keep_pack_tables_in_step(pack_db):
+    conn = sqlite3.connect(pack_db)
+    try:
+        conn.execute("INSERT INTO charging_table SELECT * FROM charging_table WHERE rowid <= 10")
+        conn.execute("UPDATE charging_table SET B_Max_Cell_Temp = -1, C_KWh_Remain_End = NULL WHERE rowid % 1000 = 0")
+        conn.execute("DELETE FROM charging_table WHERE rowid BETWEEN 100 AND 120")
+        conn.commit()
+        assert conn.execute("SELECT COUNT(*) FROM charging_pack").fetchone()[0] == 4 * (20000 + 10 - 21)
+        assert _matches_source(conn)
+    finally:
+        conn.close()
+
+
+def test_prompt_describes_the_pack_tables(pack_db, synthetic_db, prompt):
+    extended = with_pack_tables(prompt, pack_db)
+    schema, examples = extended.split('Example SQL Queries', 1)
+    assert 'Table Name: charging_pack' in schema and 'Table Name: soh_pack' in schema
+    assert 'FROM charging_pack GROUP BY pack;' in examples
+    assert with_pack_tables(prompt, synthetic_db) == prompt
@@ -0,0 +1,81 @@
+import sqlite3
+
+import pytest
+
+import paged_query
+from db_pool import QueryBudgetExceeded
+from paged_query import fetch_page, keyset_sql
+
+
+def _sqlite_rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def _all_pages(sql, db_path, page_size):
+    pages, position = [], None
+    while True:
+        page = fetch_page(sql, db_path, position, page_size)
+        pages.append(page)
+        position = page['next']
+        if position is None:
+            return pages
+
+
+@pytest.mark.parametrize('sql, limit', [
+    ("SELECT vehicleId, NetkWh FROM energy_data WHERE NetkWh > 1 LIMIT 250;", 250),
+    ("SELECT * FROM charging_table LIMIT 300", 300),
+    ("SELECT vehicleId FROM discharge_table d WHERE d.distanceInKM > 5 LIMIT 100;", 100),
+    ("SELECT vehicleId, NetkWh FROM energy_data WHERE NetkWh > 1;", None),
+])
+def test_limited_queries_page_by_rowid(synthetic_db, sql, limit):
+    assert keyset_sql(sql) is not None
+    pages = _all_pages(sql, synthetic_db, 64)
+    assert all(page['next'] is None or page['next']['mode'] == 'keyset' for page in pages)
+    rows = [row for page in pages for row in page['df'].itertuples(index=False, name=None)]
+    expected = _sqlite_rows(synthetic_db, sql)
+    assert rows == [tuple(row) for row in expected]
+    if limit is not None:
+        assert len(rows) == limit
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT vehicleId FROM energy_data ORDER BY NetkWh DESC LIMIT 10;",
+    "SELECT vehicleId FROM energy_data LIMIT 10 OFFSET 5;",
+    "SELECT vehicleId FROM energy_data LIMIT 5, 10;",
+    "SELECT DISTINCT vehicleId FROM energy_data LIMIT 10;",
+    "SELECT vehicleId FROM energy_data LIMIT (SELECT 10);",
+])
+def test_keyset_paging_does_not_apply(sql):
+    assert keyset_sql(sql) is None
+
+
+def test_every_page_is_cached(synthetic_db, monkeypatch):
+    fetches = []
+    fetch_rows = paged_query._fetch_rows
+    monkeypatch.setattr(paged_query, '_fetch_rows', lambda *args: fetches.append(args[0]) or fetch_rows(*args))
+    for sql in ("SELECT vehicleId, NetkWh FROM energy_data WHERE NetkWh > 2;",
+                "SELECT vehicleId, monthId, COUNT(*) FROM energy_data GROUP BY vehicleId, monthId;"):
+        first = _all_pages(sql, synthetic_db, 1000)
+        again = _all_pages(sql, synthetic_db, 1000)
+        assert len(first) > 1 and fetches.count(sql) == len(first)
+        assert [page['next'] for page in again] == [page['next'] for page in first]
+        assert all(a['df'].equals(b['df']) for a, b in zip(first, again))
+
+
+def test_counts_over_budget_fall_back_to_the_rowid_bound(synthetic_db, monkeypatch):
+    def over_budget(*args):
+        raise QueryBudgetExceeded("Query cancelled: it ran longer than 1s.")
+    monkeypatch.setattr(paged_query, 'fetch_columnar', over_budget)
+    count = paged_query._count_rows
+    assert count("SELECT vehicleId FROM energy_data WHERE NetkWh > 1", synthetic_db, 1) == (20000, False)
+    assert count("SELECT vehicleId FROM energy_data WHERE NetkWh > 1 LIMIT 70", synthetic_db, 1) == (70, False)
+    assert count("SELECT monthId, COUNT(*) FROM energy_data GROUP BY monthId", synthetic_db, 1) == (None, False)
+
+    def unavailable(db_path):
+        raise sqlite3.OperationalError("unable to open database file")
+    monkeypatch.setattr(paged_query, 'pooled_connection', unavailable)
+    assert count("SELECT vehicleId FROM energy_data WHERE NetkWh > 1", synthetic_db, 1) == (None, False)
@@ -0,0 +1,39 @@
+import sqlite3
+
+import parallel_query
+from rollups import same_rows
+
+
+def _sqlite_rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_results_over_one_page_are_merged_whole(synthetic_db):
+    statements = [
+        "SELECT unique_id, NetkWh FROM energy_data WHERE monthId <= 202402;",
+        "SELECT unique_id, monthId FROM energy_data WHERE monthId <= 202402;",
+    ]
+    combined = parallel_query.answer_statements(statements, synthetic_db)
+    expected = _sqlite_rows(synthetic_db, "SELECT unique_id, NetkWh, monthId FROM energy_data WHERE monthId <= 202402;")
+    assert len(expected) > 1000
+    assert combined['merged'] and combined['error'] is None
+    assert not combined['df'].isna().any().any()
+    rows = list(combined['df'].itertuples(index=False, name=None))
+    assert same_rows(sorted(expected), sorted(rows), rel_tol=1e-9)
+
+
+def test_results_over_the_row_cap_are_not_merged(synthetic_db):
+    statements = [
+        "SELECT vehicleId, SUM(NetkWh) AS energy FROM energy_data GROUP BY vehicleId;",
+        "SELECT vehicleId, NetkWh FROM energy_data;",
+    ]
+    combined = parallel_query.answer_statements(statements, synthetic_db)
+    assert not combined['merged'] and combined['df'].empty
+    assert 'query 2 returns more than' in combined['note']
+    small, large = combined['results']
+    assert small['df'] is not None and large['df'] is None
+    assert large['page']['next'] is not None and large['limit'] is not None
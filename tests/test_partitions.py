@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+import partitions
+from rollups import same_rows
+
+
+@pytest.fixture(scope='module')
+def partitioned(synthetic_db, tmp_path_factory):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp('partitions'))
+        patch.setattr(partitions, 'PARTITIONED', True)
+        manifest, _ = partitions.build_partitions(synthetic_db)
+        yield synthetic_db, manifest
+
+
+def _sqlite_rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT vehicleId, COUNT(*) AS trips FROM energy_data WHERE monthId = 202412 GROUP BY vehicleId;",
+    "SELECT monthId, SUM(distanceInKM), MAX(Range) FROM discharge_table WHERE monthId BETWEEN 202403 AND 202405 "
+    "GROUP BY monthId;",
+    "SELECT * FROM charging_table WHERE monthId >= 202411 ORDER BY unique_id;",
+    "SELECT COUNT(*), COUNT(DISTINCT vehicleId) FROM energy_data WHERE monthId IN (202401, 202407);",
+    "SELECT e.DLR_REGION, AVG(e.NetkWh) FROM energy_data AS e WHERE e.monthId < 202403 GROUP BY e.DLR_REGION;",
+    "SELECT COUNT(*) FROM discharge_table WHERE eventdate LIKE '2024-06%';",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId >= 202411 AND monthId < '202412';",
+])
+def test_pruned_queries_answer_like_the_full_tables(partitioned, sql):
+    db_path, manifest = partitioned
+    plan = partitions.partition_plan(sql, manifest)
+    assert plan is not None and len(plan[1]) < len(manifest['partitions'])
+    rows, _ = partitions.fetch_partitioned(sql, db_path, 0, 100000)
+    expected = _sqlite_rows(db_path, sql)
+    assert rows
+    assert same_rows(sorted(expected, key=repr), sorted(rows, key=repr), rel_tol=1e-9)
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT rowid, vehicleId FROM energy_data WHERE monthId = 202412 ORDER BY rowid LIMIT 10;",
+    "SELECT _rowid_, NetkWh FROM energy_data WHERE monthId = 202412;",
+    "SELECT MAX(oid) FROM charging_table WHERE monthId >= 202411;",
+    "SELECT COUNT(*) FROM discharge_table d WHERE d.monthId = 202405 AND d.ROWID > 100;",
+    "SELECT vehicleId, COUNT(*) FROM energy_data WHERE vehicleId = 5 GROUP BY vehicleId;",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId < '202403';",
+    "SELECT COUNT(*) FROM energy_data WHERE monthId <= '202403';",
+    "SELECT COUNT(*) FROM discharge_table WHERE monthId BETWEEN '202401' AND '202403';",
+    "SELECT COUNT(*) FROM charging_table WHERE monthId = '202405';",
+    "SELECT COUNT(*) FROM charging_table WHERE monthId IN ('202405', '202406');",
+])
+def test_unbounded_or_rowid_queries_use_the_full_tables(partitioned, sql):
+    db_path, manifest = partitioned
+    assert partitions.partition_plan(sql, manifest) is None
+    assert partitions.fetch_partitioned(sql, db_path, 0, 100) is None
@@ -0,0 +1,37 @@
+import threading
+import time
+
+import prompt_context
+from prompt_builder import build_prompt
+
+
+def test_static_prefix_is_shared_by_pruned_prompts(prompt):
+    prefix = prompt_context.static_prefix(prompt)
+    assert prefix and len(prefix) < len(prompt) // 4
+    for question in ("total energy consumed per vehicle", "charging sessions per depot", "average soh per pack"):
+        pruned, _ = build_prompt(prompt, question)
+        assert pruned.format(question=question).startswith(prefix)
+
+
+def test_prefix_is_evaluated_once_without_blocking_other_prefixes(tmp_path, monkeypatch):
+    calls = []
+
+    def evaluate(model, prefix, url):
+        calls.append(prefix)
+        time.sleep(0.5 if prefix == 'slow' else 0)
+        return [len(prefix)]
+
+    monkeypatch.setattr(prompt_context, 'evaluate_prefix', evaluate)
+    monkeypatch.setattr(prompt_context, '_contexts', {})
+    path = str(tmp_path / 'cache.db')
+    threads = [threading.Thread(target=prompt_context.get_prefix_context, args=('m', 'slow'), kwargs={'path': path})
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    assert prompt_context.get_prefix_context('m', 'fast', path=path) == [4]
+    assert time.perf_counter() - start < 0.3
+    for thread in threads:
+        thread.join()
+    assert calls.count('slow') == 1
@@ -0,0 +1,64 @@
+import pytest
+
+import question_index
+from answer_cache import cache_scope
+from question_index import lookup_cached_sql, remember_sql
+
+MODEL = 'test-model'
+DATABASE = 'nl2sql.db'
+PROMPT = "Schema: vehicles(id, distance)\nQuestion: {question}\nSQL:"
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("total energy consumed per vehicle in 2023", "total energy consumed per vehicle in 2024"),
+    ("top 5 vehicles by distance", "top 10 vehicles by distance"),
+    ("charging sessions per depot for month 202401", "charging sessions per depot for month 202402"),
+    ("max cell temperature per vehicle", "min cell temperature per vehicle"),
+    ("average range per vehicle for depot 'Pune'", "average range per vehicle for depot 'Nagpur'"),
+    ("total distance per vehicle in january", "total distance per vehicle in february"),
+    ("total energy discharged per vehicle", "total energy charged per vehicle"),
+    ("charging interruptions above 30 minutes", "charging interruptions below 30 minutes"),
+    ("vehicles sold by dealer", "vehicles not sold by dealer"),
+    ("vehicles with at least 3 trips", "vehicles with at most 3 trips"),
+])
+def test_questions_differing_in_a_value_do_not_share_sql(cached, asked, cache_path):
+    remember_sql(cached, MODEL, DATABASE, PROMPT, "SELECT 1;", path=cache_path)
+    index = question_index.get_question_index(cache_scope(MODEL, DATABASE, PROMPT), cache_path)
+    assert index.search(asked, 0.5) is None
+    assert lookup_cached_sql(asked, MODEL, DATABASE, PROMPT, path=cache_path) == (None, None, 0.0)
+
+
+@pytest.mark.parametrize('cached, asked', [
+    ("total distance per vehicle", "What is the total distance for each vehicle?"),
+    ("top 5 vehicles by energy consumed in 2024", "show the top 5 vehicles by energy consumed in 2024"),
+    ("average charging duration per depot", "list the average charging duration of each depot"),
+    ("charging sessions per depot", "list the charging sessions of each depot"),
+])
+def test_paraphrases_share_sql(cached, asked, cache_path):
+    remember_sql(cached, MODEL, DATABASE, PROMPT, "SELECT 1;", path=cache_path)
+    sql, matched, similarity = lookup_cached_sql(asked, MODEL, DATABASE, PROMPT, path=cache_path)
+    assert (sql, matched) == ("SELECT 1;", cached)
+    assert similarity >= question_index.DEFAULT_THRESHOLD
+
+
+@pytest.mark.parametrize('database, prompt', [
+    ('abc_cesl_final_data_acsentsarthi.db', PROMPT),
+    (DATABASE, PROMPT.replace('distance', 'odometer')),
+])
+def test_sql_is_not_shared_across_databases_or_prompts(database, prompt, cache_path):
+    question = "total distance per vehicle"
+    remember_sql(question, MODEL, DATABASE, PROMPT, "SELECT 1;", path=cache_path)
+    assert lookup_cached_sql(question, MODEL, database, prompt, path=cache_path) == (None, None, 0.0)
+    assert lookup_cached_sql(question, MODEL, DATABASE, PROMPT, path=cache_path)[0] == "SELECT 1;"
+
+
+def test_relative_and_absolute_database_paths_share_sql(cache_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    remember_sql("total distance per vehicle", MODEL, DATABASE, PROMPT, "SELECT 1;", path=cache_path)
+    absolute = str(tmp_path / DATABASE)
+    assert lookup_cached_sql("total distance per vehicle", MODEL, absolute, PROMPT, path=cache_path)[0] == "SELECT 1;"
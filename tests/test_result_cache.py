@@ -0,0 +1,67 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from result_cache import canonical_sql, clear_results, lookup_result, put_result
+
+
+@pytest.mark.parametrize('left, right', [
+    ("SELECT vehicleId FROM energy_data;", "select   vehicleid\nfrom ENERGY_DATA"),
+    ("SELECT e.NetkWh FROM energy_data e WHERE e.vehicleId = 3",
+     "SELECT x.NetkWh FROM energy_data AS x WHERE x.vehicleId = 3 -- one vehicle"),
+    ("SELECT c.kwhCharged FROM charging_table c JOIN vehicle_table v ON v.vehicleId = c.vehicleId",
+     "SELECT a.kwhCharged /* charged */ FROM charging_table a JOIN vehicle_table b ON b.vehicleId = a.vehicleId"),
+])
+def test_equivalent_spellings_share_a_key(left, right):
+    assert canonical_sql(left) == canonical_sql(right)
+
+
+@pytest.mark.parametrize('left, right', [
+    # Literals are compared as written.
+    ("SELECT * FROM vehicle_table WHERE Depot_Name = 'Depot 1'",
+     "SELECT * FROM vehicle_table WHERE Depot_Name = 'DEPOT 1'"),
+    # Column aliases name the result columns.
+    ("SELECT SUM(NetkWh) AS energy FROM energy_data", "SELECT SUM(NetkWh) AS total FROM energy_data"),
+    # Aliases are renamed in order of appearance, so swapped tables stay different.
+    ("SELECT a.vehicleId FROM energy_data a JOIN charging_table b ON a.vehicleId = b.vehicleId",
+     "SELECT b.vehicleId FROM energy_data a JOIN charging_table b ON a.vehicleId = b.vehicleId"),
+])
+def test_different_queries_keep_different_keys(left, right):
+    assert canonical_sql(left) != canonical_sql(right)
+
+
+def test_cached_results_take_the_labels_of_each_spelling(synthetic_db, tmp_path):
+    directory = str(tmp_path / 'results')
+    sql = "SELECT e.vehicleId AS vehicle, e.NetkWh FROM energy_data e WHERE e.rowid <= 3"
+    key, df = lookup_result(sql, synthetic_db, directory)
+    assert df is None
+    put_result(key, pd.DataFrame([[1, 2.0], [3, 4.0]], columns=['vehicle', 'NetkWh']), sql, synthetic_db, directory)
+
+    respelled = "select t.vehicleId as vehicle, t.netkwh from energy_data as t where t.rowid <= 3;"
+    same_key, df = lookup_result(respelled, synthetic_db, directory)
+    assert same_key == key
+    assert list(df.columns) == ['vehicle', 'netkwh'] and df['vehicle'].tolist() == [1, 3]
+
+    clear_results(directory)
+    assert lookup_result(sql, synthetic_db, directory)[1] is None
+
+
+def test_a_changed_database_misses(synthetic_db, tmp_path):
+    path = str(tmp_path / 'copy.db')
+    shutil.copyfile(synthetic_db, path)
+    directory = str(tmp_path / 'results')
+    sql = "SELECT COUNT(*) AS n FROM vehicle_table"
+    key, _ = lookup_result(sql, path, directory)
+    put_result(key, pd.DataFrame({'n': [500]}), sql, path, directory)
+    assert lookup_result(sql, path, directory)[1]['n'].tolist() == [500]
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("DELETE FROM vehicle_table WHERE vehicleId = 1")
+        conn.commit()
+    finally:
+        conn.close()
+    new_key, df = lookup_result(sql, path, directory)
+    assert new_key != key and df is None
@@ -0,0 +1,23 @@
+import sqlite3
+
+import paged_query
+from paged_query import first_page
+from result_guard import guard_sql
+
+
+def test_capped_query_is_counted_once(synthetic_db, monkeypatch):
+    counted = []
+    count_rows = paged_query._count_rows
+    monkeypatch.setattr(paged_query, '_count_rows', lambda *args: counted.append(args[0]) or count_rows(*args))
+    sql = "SELECT vehicleId, NetkWh FROM energy_data WHERE NetkWh > 1;"
+    run_sql, info = guard_sql(sql, synthetic_db, limit=500)
+    page = first_page(run_sql, synthetic_db, page_size=100)
+    conn = sqlite3.connect(synthetic_db)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM energy_data WHERE NetkWh > 1").fetchone()[0]
+    finally:
+        conn.close()
+    assert counted == [sql]
+    assert (info['rows'], info['exact']) == (total, True)
+    assert (page['rows'], page['exact']) == (500, True)
+    assert len(page['df']) == 100 and page['next'] is not None
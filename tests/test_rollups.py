@@ -0,0 +1,64 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from rollups import available_rollups, build_rollups, fresh_rollups, rollup_name, route_to_rollup, same_rows
+
+
+@pytest.fixture
+def rollup_db(synthetic_db, tmp_path):
+    """A copy of the synthetic database with rollups built, so tests may write to it."""
+    path = str(tmp_path / 'rollups.db')
+    shutil.copyfile(synthetic_db, path)
+    build_rollups(path)
+    return path
+
+
+def _rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT vehicleId, SUM(NetkWh) AS energy FROM energy_data GROUP BY vehicleId;",
+    "SELECT monthId, COUNT(*), AVG(distanceInKM) FROM energy_data WHERE monthId >= 202406 GROUP BY monthId",
+    "SELECT DLR_REGION, MIN(kwhCharged), MAX(kwhCharged) FROM charging_table c GROUP BY c.DLR_REGION",
+    "SELECT TOTAL(NetkWh) FROM discharge_table WHERE Depot_Name = 'Depot 3'",
+])
+def test_aggregates_are_routed_and_agree(rollup_db, sql):
+    routed = route_to_rollup(sql, rollup_db)
+    assert rollup_name(sql.split('FROM ')[1].split()[0]) in routed
+    assert same_rows(_rows(rollup_db, sql), _rows(rollup_db, routed))
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT vehicleId, NetkWh FROM energy_data WHERE NetkWh > 10",
+    "SELECT vehicleId, SUM(NetkWh) FROM energy_data WHERE NetkWh > 10 GROUP BY vehicleId",
+    "SELECT eventdate, SUM(NetkWh) FROM energy_data GROUP BY eventdate",
+    "SELECT e.vehicleId, SUM(c.kwhCharged) FROM energy_data e JOIN charging_table c ON e.vehicleId = c.vehicleId "
+    "GROUP BY e.vehicleId",
+    "SELECT vehicleId, SUM(NetkWh) FROM energy_data WHERE vehicleId IN (SELECT vehicleId FROM vehicle_table) "
+    "GROUP BY vehicleId",
+])
+def test_queries_the_rollup_cannot_answer_are_left_alone(rollup_db, sql):
+    assert route_to_rollup(sql, rollup_db) == sql
+
+
+def test_writes_mark_the_rollup_stale(rollup_db):
+    sql = "SELECT vehicleId, SUM(NetkWh) FROM energy_data GROUP BY vehicleId"
+    assert route_to_rollup(sql, rollup_db) != sql
+    conn = sqlite3.connect(rollup_db)
+    try:
+        conn.execute("UPDATE energy_data SET NetkWh = NetkWh + 1 WHERE rowid = 1")
+        conn.commit()
+        assert 'energy_data' not in fresh_rollups(conn)
+        assert 'charging_table' in fresh_rollups(conn)
+    finally:
+        conn.close()
+    assert 'energy_data' not in available_rollups(rollup_db)
+    assert route_to_rollup(sql, rollup_db) == sql
+
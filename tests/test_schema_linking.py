@@ -0,0 +1,43 @@
+import pytest
+
+from schema_linking import JOIN_KEYS, build_schema_index, link_schema, prune_prompt
+
+
+@pytest.fixture(scope='module')
+def index(prompt):
+    return build_schema_index(prompt)
+
+
+@pytest.mark.parametrize('question, table, column', [
+    ("total kwh charged per depot in March", 'charging_table', 'kwhCharged'),
+    ("average SOH of packs for each vehicle", 'soh_table', 'A_SOH_Value'),
+    ("distance travelled by each vehicle last month", 'discharge_table', 'distanceInKM'),
+    ("energy consumption per km by dealer", 'energy_data', 'whPerKM'),
+    ("which dealers sold the most vehicles", 'vehicle_table', 'DLR_NAME'),
+])
+def test_questions_keep_their_table_and_column(index, question, table, column):
+    selected = link_schema(index, question)
+    assert column in selected[table]
+    # Every kept table can still be joined.
+    assert all(set(JOIN_KEYS) <= set(columns) for columns in selected.values())
+
+
+def test_unrelated_tables_are_dropped(index):
+    selected = link_schema(index, "average SOH of packs for each vehicle")
+    assert set(selected) == {'soh_table'}
+    assert len(selected['soh_table']) < len(index['tables']['soh_table']['columns'])
+
+
+def test_pruned_prompt_keeps_instructions_and_examples(prompt, index):
+    pruned, stats = prune_prompt(prompt, "total kwh charged per depot")
+    assert pruned.startswith(index['head']) and pruned.endswith(index['tail'])
+    assert 'Table Name: charging_table' in pruned and 'Table Name: energy_data' not in pruned
+    assert stats['tokens_saved'] > stats['tokens_before'] // 4
+    assert stats['tables'][0] == 'charging_table'
+
+
+def test_nothing_to_link_keeps_the_prompt(prompt):
+    pruned, stats = prune_prompt(prompt, "hello there")
+    assert pruned == prompt and stats['tokens_saved'] == 0 and stats['tables'] == []
+    assert build_schema_index("You are an SQL expert.") is None
+    assert prune_prompt("You are an SQL expert.", "total kwh charged")[0] == "You are an SQL expert."
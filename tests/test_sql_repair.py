@@ -0,0 +1,88 @@
+import threading
+import time
+
+from sql_repair import repair_prompt, repair_sql
+
+BROKEN = "SELECT kwhCharge FROM charging_table"
+FIXED = "SELECT kwhCharged FROM charging_table;"
+
+
+def _replies(*replies):
+    """A generate() that answers each prompt with the next reply, in small chunks, and records the prompts."""
+    prompts = []
+
+    def generate(prompt, timeout):
+        reply = replies[len(prompts)]
+        prompts.append(prompt)
+        return iter([reply[i:i + 5] for i in range(0, len(reply), 5)])
+    return generate, prompts
+
+
+def test_repair_stops_at_the_first_valid_query(synthetic_db):
+    generate, prompts = _replies("Sure! SELECT kwhCharge FROM charging_tabel;", "```sql\n" + FIXED + "\n```", FIXED)
+    sql, error, attempts = repair_sql("energy charged", BROKEN, "no such column: kwhCharge", synthetic_db,
+                                      generate, attempts=3)
+    assert (sql, error, attempts) == (FIXED, None, 2)
+    assert 'no such column: kwhCharge' in prompts[0] and 'no such table: charging_tabel' in prompts[1]
+
+
+def test_repair_gives_up_after_its_attempts(synthetic_db):
+    generate, prompts = _replies("I cannot help with that.", "SELECT energy FROM nowhere;")
+    sql, error, attempts = repair_sql("energy charged", BROKEN, "no such column: kwhCharge", synthetic_db,
+                                      generate, attempts=2)
+    assert attempts == 2 and len(prompts) == 2
+    assert sql == "SELECT energy FROM nowhere;" and 'no such table: nowhere' in error
+
+
+def test_repair_stops_at_the_deadline(synthetic_db):
+    closed, timeouts = threading.Event(), []
+
+    def generate(prompt, timeout):
+        timeouts.append(timeout)
+
+        def chunks():
+            try:
+                while True:
+                    time.sleep(0.05)
+                    yield "SELECT "
+            finally:
+                closed.set()
+        return chunks()
+    start = time.perf_counter()
+    sql, error, attempts = repair_sql("energy charged", BROKEN, "no such column", synthetic_db, generate,
+                                      attempts=5, timeout=0.3)
+    assert time.perf_counter() - start < 1.0
+    assert attempts == 1 and 0 < timeouts[0] <= 0.3
+    assert (sql, error) == (BROKEN, "no such column")
+    # The stream is closed once the worker reading it sees the repair has stopped.
+    assert closed.wait(1.0)
+
+
+def test_the_wait_for_the_first_token_is_bounded(synthetic_db):
+    def generate(prompt, timeout):
+        def chunks():
+            # A model still loading: nothing arrives within the repair budget.
+            time.sleep(2.0)
+            yield FIXED
+        return chunks()
+    start = time.perf_counter()
+    assert repair_sql("q", BROKEN, "no such column", synthetic_db, generate, timeout=0.3) == \
+        (BROKEN, "no such column", 1)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_a_failing_model_ends_the_repair(synthetic_db):
+    def generate(prompt, timeout):
+        raise ConnectionError("Ollama is not running")
+    assert repair_sql("q", BROKEN, "no such column", synthetic_db, generate) == (BROKEN, "no such column", 1)
+
+    def broken_stream(prompt, timeout):
+        yield "SELECT "
+        raise ConnectionError("connection reset")
+    assert repair_sql("q", BROKEN, "no such column", synthetic_db, broken_stream) == (BROKEN, "no such column", 1)
+
+
+def test_repair_prompt_is_short():
+    prompt = repair_prompt("energy charged", "SELECT\n    kwhCharge\nFROM charging_table", "no such column")
+    assert "Query: SELECT kwhCharge FROM charging_table\n" in prompt
+    assert "CREATE TABLE" not in prompt
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+from rollups import same_rows
+from sql_rewrite import LATEST_ROW_EXAMPLE, decorrelate_extrema
+from synthetic_db import create_synthetic_db
+
+
+@pytest.fixture(scope='module')
+def small_db(tmp_path_factory, prompt):
+    """A synthetic database small enough for the correlated originals to finish quickly."""
+    path = str(tmp_path_factory.mktemp('rewrite') / 'small.db')
+    create_synthetic_db(path, prompt, 2000, vehicles=50)
+    return path
+
+
+def _rows(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('sql', [
+    LATEST_ROW_EXAMPLE,
+    "SELECT vehicleId, eventdate, kwhCharged FROM charging_table c WHERE c.kwhCharged > 10 AND c.eventdate = "
+    "(SELECT MIN(eventdate) FROM charging_table WHERE vehicleId = c.vehicleId AND kwhCharged > 10)",
+    "SELECT e.vehicleId, e.monthId, e.NetkWh FROM energy_data AS e WHERE e.NetkWh = (SELECT MAX(e2.NetkWh) "
+    "FROM energy_data AS e2 WHERE e2.vehicleId = e.vehicleId AND e2.monthId = e.monthId) ORDER BY e.vehicleId;",
+    "SELECT COUNT(*) FROM discharge_table d WHERE (d.eventdate = (SELECT max(eventdate) FROM discharge_table x "
+    "WHERE x.Depot_Name = d.Depot_Name))",
+])
+def test_latest_row_predicates_are_decorrelated(small_db, sql):
+    rewritten = decorrelate_extrema(sql)
+    assert rewritten != sql
+    assert ' IN (SELECT ' in rewritten and ' GROUP BY ' in rewritten
+    assert same_rows(_rows(small_db, sql), _rows(small_db, rewritten))
+
+
+@pytest.mark.parametrize('sql', [
+    # Correlated through an inequality or OR, or filtered on the outer row.
+    "SELECT * FROM charging_table c WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 "
+    "WHERE c2.eventdate < c.eventdate)",
+    "SELECT * FROM charging_table c WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 "
+    "WHERE c2.vehicleId = c.vehicleId OR c2.Depot_Name = c.Depot_Name)",
+    "SELECT * FROM charging_table c WHERE c.eventdate = (SELECT MAX(eventdate) FROM charging_table c2 "
+    "WHERE c2.vehicleId = c.vehicleId AND c2.kwhCharged > c.kwhCharged)",
+    # Not a whole predicate: the subquery is part of an expression.
+    "SELECT * FROM charging_table c WHERE c.monthId = (SELECT MAX(monthId) FROM charging_table c2 "
+    "WHERE c2.vehicleId = c.vehicleId) - 1",
+    # Uncorrelated: nothing to decorrelate.
+    "SELECT * FROM charging_table WHERE eventdate = (SELECT MAX(eventdate) FROM charging_table)",
+])
+def test_other_shapes_are_left_alone(sql):
+    assert decorrelate_extrema(sql) == sql
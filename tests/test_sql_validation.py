@@ -0,0 +1,38 @@
+import pytest
+
+from sql_validation import database_schema, validate_sql
+
+
+@pytest.mark.parametrize('sql', [
+    "SELECT vehicleId, SUM(NetkWh) FROM energy_data GROUP BY vehicleId;",
+    "WITH t AS (SELECT vehicleId FROM charging_table) SELECT COUNT(*) FROM t",
+    "SELECT REPLACE(Depot_Name, 'Depot ', '') FROM vehicle_table;;",
+    "SELECT 'DROP TABLE x; DELETE' AS text",
+])
+def test_valid_queries_pass(synthetic_db, sql):
+    assert validate_sql(sql, synthetic_db) is None
+
+
+@pytest.mark.parametrize('sql, message', [
+    ("", "empty"),
+    ("DELETE FROM energy_data", "not DELETE"),
+    ("SELECT 1; DROP TABLE energy_data", "single statement"),
+    ("WITH t AS (SELECT 1) DELETE FROM energy_data", "found DELETE"),
+    ("SELECT MEDIAN_OF(NetkWh) FROM energy_data", "no such function"),
+])
+def test_invalid_statements_are_rejected(synthetic_db, sql, message):
+    error = validate_sql(sql, synthetic_db)
+    assert error is not None and message in error
+
+
+def test_unknown_names_get_suggestions(synthetic_db):
+    error = validate_sql("SELECT vehicleId FROM charging_tabel", synthetic_db)
+    assert 'no such table: charging_tabel' in error and 'charging_table' in error
+    error = validate_sql("SELECT kwhCharge FROM charging_table", synthetic_db)
+    assert 'no such column: kwhCharge' in error and 'charging_table.kwhCharged' in error
+
+
+def test_schema_lists_tables_and_columns(synthetic_db):
+    schema = database_schema(synthetic_db)
+    assert {'energy_data', 'charging_table', 'vehicle_table'} <= set(schema)
+    assert 'kwhCharged' in schema['charging_table']
@@ -0,0 +1,57 @@
+import zlib
+
+import numpy as np
+
+from schema_linking import tokenize
+
+# Width of the hashed feature space; collisions are rare at the sizes we index.
+DEFAULT_DIM = 2048
+NGRAM_RANGE = (3, 5)
+WORD_WEIGHT = 2.0
+
+# Unlike schema linking, aggregation words ("total", "average", "count") are kept: they are
+# what separates otherwise identical questions.
+STOPWORDS = {
+    'a', 'an', 'and', 'the', 'of', 'for', 'to', 'in', 'on', 'by', 'per', 'each', 'me', 'is', 'are',
+    'what', 'which', 'show', 'get', 'find', 'list', 'give', 'retrieve', 'with', 'their', 'all',
+}
+
+
+def features(text, ngram_range=NGRAM_RANGE):
+    """Return (feature, weight) pairs: whole word stems plus character n-grams of each word."""
+    pairs = []
+    for word in tokenize(text, STOPWORDS):
+        pairs.append(('w:' + word, WORD_WEIGHT))
+        padded = f' {word} '
+        for n in range(ngram_range[0], ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                pairs.append((padded[i:i + n], 1.0))
+    return pairs
+
+
+def vectorize(texts, dim=DEFAULT_DIM):
+    """
+    Embed texts as L2-normalised hashed n-gram vectors.
+
+    crc32 is used instead of hash() so vectors are stable across processes and can be
+    persisted. Rows for texts without any features are left as zeros.
+    """
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for feature, weight in features(text):
+            matrix[row, zlib.crc32(feature.encode('utf-8')) % dim] += weight
+    np.sqrt(matrix, out=matrix)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+
+def top_k(matrix, vector, k):
+    """Return [(row, cosine similarity)] of the k rows of matrix closest to vector, best first."""
+    if matrix.shape[0] == 0 or k <= 0:
+        return []
+    scores = matrix @ vector
+    k = min(k, len(scores))
+    rows = np.argpartition(-scores, k - 1)[:k]
+    rows = rows[np.argsort(-scores[rows])]
+    return [(int(row), float(scores[row])) for row in rows]